@@ -16,11 +16,10 @@ from .gitrepo import GitRepo, GitCommandError
 from .helpers import (
     ApiError,
     rm_tree_contents,
-    lieutenant_query,
     sliding_window,
     IndentedListDumper,
 )
-from .cluster import Cluster, CompileMeta
+from .cluster import Cluster, CompileMeta, fetch_clusters
 from .config import Config, Migration
 from .k8sobject import K8sObject
 
@@ -184,6 +183,17 @@ def _ignore_yaml_formatting_difffunc(
     return diff_lines, len(diff_lines) == 0
 
 
+def copy_target_manifests(cfg: Config, target_name: str, repo: GitRepo):
+    """Copy the compiled output of target `target_name` into the catalog repo."""
+    if repo.working_tree_dir is None:
+        raise click.ClickException("Catalog repo has no working tree")
+    shutil.copytree(
+        cfg.inventory.output_dir / target_name,
+        P(repo.working_tree_dir, "manifests"),
+        dirs_exist_ok=True,
+    )
+
+
 def update_catalog(
     cfg: Config, targets: Iterable[str], repo: GitRepo, compile_meta: CompileMeta
 ):
@@ -199,11 +209,8 @@ def update_catalog(
 
     click.secho("Updating catalog repository...", bold=True)
 
-    catalogdir = P(repo.working_tree_dir, "manifests")
     for target_name in targets:
-        shutil.copytree(
-            cfg.inventory.output_dir / target_name, catalogdir, dirs_exist_ok=True
-        )
+        copy_target_manifests(cfg, target_name, repo)
 
     start = time.time()
     if cfg.migration == Migration.KAP_029_030:
@@ -238,18 +245,8 @@ def update_catalog(
 
 
 def catalog_list(cfg, out: str, sort_by: str = "id", tenant: str = ""):
-    params = {"sort_by": sort_by}
-    if tenant != "":
-        params["tenant"] = tenant
     try:
-        clusters = lieutenant_query(
-            cfg.api_url,
-            cfg.api_token,
-            "clusters",
-            "",
-            params=params,
-            timeout=cfg.request_timeout,
-        )
+        clusters = fetch_clusters(cfg, tenant=tenant, sort_by=sort_by)
     except ApiError as e:
         raise click.ClickException(f"While listing clusters on Lieutenant: {e}") from e
     if out == "yaml" or out == "yml":
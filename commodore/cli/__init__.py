@@ -3,6 +3,7 @@ from __future__ import annotations
 import multiprocessing
 
 from pathlib import Path
+from typing import Optional
 
 import click
 
@@ -13,12 +14,16 @@ from dotenv import load_dotenv, find_dotenv
 from commodore import __git_version__, __version__, tools
 from commodore.config import Config
 from commodore.helpers import cpu_count
+from commodore.lieutenant_session import DEFAULT_BACKOFF_FACTOR, DEFAULT_RETRIES
 from commodore.version import version_info
 
 import commodore.cli.options as options
 
+from .cache import cache_group
 from .catalog import catalog_group
 from .component import component_group
+from .daemon import commodore_daemon
+from .dependency import dependency_group
 from .inventory import inventory_group
 from .package import package_group
 from .oidc import commodore_fetch_token, commodore_login
@@ -67,18 +72,85 @@ def commodore_version(config: Config):
     envvar="COMMODORE_REQUEST_TIMEOUT",
     help="Timeout in seconds for HTTP requests",
 )
+@click.option(
+    "--request-retries",
+    default=DEFAULT_RETRIES,
+    show_default=True,
+    type=click.INT,
+    envvar="COMMODORE_REQUEST_RETRIES",
+    help="Number of retries for Lieutenant API requests which fail with a connection "
+    + "error or a transient server error. Only idempotent requests are retried.",
+)
+@click.option(
+    "--request-backoff-factor",
+    default=DEFAULT_BACKOFF_FACTOR,
+    show_default=True,
+    type=click.FLOAT,
+    envvar="COMMODORE_REQUEST_BACKOFF_FACTOR",
+    help="Backoff factor for retries of Lieutenant API requests. The delay before the "
+    + "n-th retry is FACTOR * 2^(n-1) seconds.",
+)
+@click.option(
+    "--oidc-callback-port",
+    default=18000,
+    show_default=True,
+    type=click.IntRange(0, 65535),
+    envvar="COMMODORE_OIDC_CALLBACK_PORT",
+    help="Port of the local server which receives the OIDC login callback. "
+    + "Use 0 to select a free port. The OIDC client must accept the resulting "
+    + "redirect URL http://localhost:PORT.",
+)
+@options.git_object_cache
+@options.jsonnet_cache
+@options.kapitan_dependency_cache
+@options.helm_template_cache
+@options.kustomize_cache
+@options.lieutenant_cache
 @click.pass_context
-def commodore(ctx, working_dir, verbose, request_timeout):
+# pylint: disable=too-many-arguments
+def commodore(
+    ctx,
+    working_dir,
+    verbose,
+    request_timeout,
+    request_retries,
+    request_backoff_factor,
+    oidc_callback_port,
+    git_object_cache,
+    jsonnet_cache,
+    kapitan_dependency_cache,
+    helm_template_cache,
+    kustomize_cache,
+    lieutenant_cache,
+):
     cfg = Config(Path(working_dir), verbose=verbose)
     cfg.request_timeout = request_timeout
+    cfg.request_retries = request_retries
+    cfg.request_backoff_factor = request_backoff_factor
+    cfg.oidc_callback_port = oidc_callback_port
+    if git_object_cache:
+        cfg.git_object_cache = Path(git_object_cache)
+    if jsonnet_cache:
+        cfg.jsonnet_cache = Path(jsonnet_cache)
+    if kapitan_dependency_cache:
+        cfg.kapitan_dependency_cache = Path(kapitan_dependency_cache)
+    if helm_template_cache:
+        cfg.helm_template_cache = Path(helm_template_cache)
+    if kustomize_cache:
+        cfg.kustomize_cache = Path(kustomize_cache)
+    if lieutenant_cache:
+        cfg.lieutenant_cache = Path(lieutenant_cache)
     ctx.obj = cfg
 
 
+commodore.add_command(cache_group)
 commodore.add_command(catalog_group)
 commodore.add_command(component_group)
+commodore.add_command(dependency_group)
 commodore.add_command(inventory_group)
 commodore.add_command(package_group)
 commodore.add_command(tool_group)
+commodore.add_command(commodore_daemon)
 commodore.add_command(commodore_login)
 commodore.add_command(commodore_fetch_token)
 commodore.add_command(commodore_version)
@@ -86,6 +158,10 @@ commodore.add_command(commodore_version)
 
 def main():
     multiprocessing.set_start_method("spawn")
+    run()
+
+
+def run(args: Optional[list[str]] = None):
     # `Reclass.set_thread_count()` wants 0 if it should use its internal detection logic, so we call
     # the `cpu_count()` helper with `fallback=0` to return 0 if the number of CPUs can't be
     # determined.
@@ -94,5 +170,8 @@ def main():
 
     load_dotenv(dotenv_path=find_dotenv(usecwd=True))
     commodore.main(
-        prog_name="commodore", auto_envvar_prefix="COMMODORE", max_content_width=100
+        args=args,
+        prog_name="commodore",
+        auto_envvar_prefix="COMMODORE",
+        max_content_width=100,
     )
@@ -0,0 +1,130 @@
+"""Commands which manage Commodore's shared caches"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from commodore.config import Config
+
+import commodore.cli.options as options
+
+
+@click.group(
+    name="cache",
+    short_help="Manage Commodore's shared caches.",
+)
+@options.verbosity
+@options.pass_config
+def cache_group(config: Config, verbose):
+    config.update_verbosity(verbose)
+
+
+@cache_group.command(
+    name="git-gc", short_help="Garbage collect the shared Git object cache."
+)
+@options.git_object_cache
+@click.option(
+    "--prune",
+    metavar="DATE",
+    default=None,
+    help="Prune loose objects older than DATE. Passed to `git gc --prune`. "
+    + "By default, Git's `gc.pruneExpire` setting is used.",
+)
+@options.verbosity
+@options.pass_config
+def cache_git_gc(
+    config: Config, git_object_cache: Optional[str], prune: Optional[str], verbose
+):
+    """Garbage collect the shared Git object cache.
+
+    The command never removes objects which are reachable from a ref or worktree
+    HEAD of any dependency repository which uses the cache. Dependency repositories
+    which have been deleted since the last GC are dropped from the cache's list of
+    referencing repositories.
+    """
+    config.update_verbosity(verbose)
+    if git_object_cache:
+        config.git_object_cache = Path(git_object_cache)
+    if not config.git_object_cache:
+        raise click.ClickException(
+            "No Git object cache configured. "
+            + "Please provide the cache directory with `--git-object-cache`."
+        )
+    if not config.git_object_cache.directory.is_dir():
+        raise click.ClickException(
+            f"Git object cache {config.git_object_cache.directory} doesn't exist."
+        )
+
+    click.secho(
+        f"Garbage collecting Git object cache {config.git_object_cache.directory}...",
+        bold=True,
+    )
+    live, dropped = config.git_object_cache.gc(prune=prune)
+    click.echo(f" > {live} repositories use the cache, dropped {dropped} stale entries")
+
+
+def _kustomize_cache(config: Config, kustomize_cache: Optional[str]):
+    if kustomize_cache:
+        config.kustomize_cache = Path(kustomize_cache)
+    if not config.kustomize_cache:
+        raise click.ClickException(
+            "No Kustomize cache configured. "
+            + "Please provide the cache directory with `--kustomize-cache`."
+        )
+    return config.kustomize_cache
+
+
+@cache_group.command(
+    name="kustomize-ls", short_help="List entries of the Kustomize build cache."
+)
+@options.kustomize_cache
+@options.verbosity
+@options.pass_config
+def cache_kustomize_ls(config: Config, kustomize_cache: Optional[str], verbose):
+    """List entries of the Kustomize build cache.
+
+    Entries are listed from least to most recently used.
+    """
+    config.update_verbosity(verbose)
+    cache = _kustomize_cache(config, kustomize_cache)
+    entries = cache.entries()
+    for e in entries:
+        last_used = datetime.fromtimestamp(e.last_used).isoformat(timespec="seconds")
+        click.echo(f"{e.key}  {last_used}  {e.size:>12} bytes")
+    total = sum(e.size for e in entries)
+    click.secho(f"{len(entries)} entries, {total} bytes", bold=True)
+
+
+@cache_group.command(
+    name="kustomize-prune", short_help="Prune the Kustomize build cache."
+)
+@options.kustomize_cache
+@click.option(
+    "--max-age",
+    metavar="DAYS",
+    default=30,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Remove entries which haven't been used in the last DAYS days.",
+)
+@options.verbosity
+@options.pass_config
+def cache_kustomize_prune(
+    config: Config, kustomize_cache: Optional[str], max_age: float, verbose
+):
+    """Remove entries which haven't been used recently from the Kustomize build
+    cache.
+
+    Use `--max-age 0` to remove all entries.
+    """
+    config.update_verbosity(verbose)
+    cache = _kustomize_cache(config, kustomize_cache)
+    pruned = cache.prune(max_age * 24 * 60 * 60)
+    click.echo(
+        f" > Removed {len(pruned)} entries ({sum(e.size for e in pruned)} bytes) "
+        + f"from Kustomize cache {cache.directory}"
+    )
@@ -5,12 +5,29 @@ from __future__ import annotations
 import click
 
 from pathlib import Path
+from typing import Optional
 
+from commodore import completion_cache
 from commodore.catalog import catalog_list, Migration
 from commodore.compile import compile as _compile
-from commodore.config import Config, parse_dynamic_facts_from_cli
-from commodore.helpers import clean_working_tree, lieutenant_query, ApiError
+from commodore.config import (
+    Config,
+    parse_dependency_url_rewrites,
+    parse_dynamic_facts_from_cli,
+)
+from commodore.cluster import (
+    fetch_clusters,
+    read_compile_metadata,
+    report_compile_metadata_batch,
+)
+from commodore.helpers import clean_working_tree, ApiError
 from commodore.login import login
+from commodore.refs import (
+    merge_secret_ref_indexes,
+    read_secret_ref_index,
+    write_secret_ref_index,
+)
+from commodore.worker_memory import parse_worker_memory
 
 import commodore.cli.options as options
 
@@ -39,22 +56,33 @@ def _complete_clusters(ctx: click.Context, _, incomplete: str) -> list[str]:
     config.api_token = ctx.params["api_token"]
     config.oidc_client = ctx.params["oidc_client"]
     config.oidc_discovery_url = ctx.params["oidc_discovery_url"]
+    if not config.api_url:
+        return []
+
+    ids, fresh = completion_cache.cluster_ids(config.api_url)
+    if ids is not None:
+        # Serve stale IDs immediately, and only refresh them if we have a token
+        # which doesn't require an interactive login.
+        if not fresh and config.api_token:
+            completion_cache.refresh_in_background(
+                config.api_url, config.api_token, config.request_timeout
+            )
+        return [i for i in ids if i.startswith(incomplete)]
 
     try:
         if config.api_token is None:
             login(config)
-        clusters = lieutenant_query(
-            config.api_url,
-            config.api_token,
-            "clusters",
-            "",
-            timeout=config.request_timeout,
-        )
+        clusters = fetch_clusters(config)
     except (click.ClickException, ApiError):
         # If we encounter any errors, ignore them.
         # We shouldn't print errors during completion
         return []
-    return [c["id"] for c in clusters if "id" in c and c["id"].startswith(incomplete)]
+    ids = [c["id"] for c in clusters if "id" in c]
+    try:
+        completion_cache.store_cluster_ids(config.api_url, ids)
+    except OSError:
+        pass
+    return [i for i in ids if i.startswith(incomplete)]
 
 
 @catalog_group.command(name="compile", short_help="Compile the catalog.")
@@ -174,6 +202,52 @@ def _complete_clusters(ctx: click.Context, _, incomplete: str) -> list[str]:
     + "on the system. Note that this parameter doesn't adjust the number of threads used by "
     + "reclass-rs.",
 )
+@click.option(
+    "--worker-memory",
+    metavar="SIZE",
+    default=None,
+    help="Memory budget per worker process, e.g. `2Gi`, or `auto` to use the peak memory "
+    + "usage of each target recorded by previous compilations. If provided, the number of "
+    + "worker processes is reduced so that the workers fit into the memory available to "
+    + "Commodore, taking into account cgroup memory limits. Additionally, targets which "
+    + "need more memory than the budget are only compiled concurrently as far as the "
+    + "remaining memory allows.",
+)
+@click.option(
+    "--pipeline/--no-pipeline",
+    default=False,
+    show_default=True,
+    help="With `--pipeline`, each target is postprocessed and copied into the catalog as "
+    + "soon as Kapitan has compiled it, while Kapitan continues to compile the remaining "
+    + "targets.",
+)
+@click.option(
+    "--secret-ref-index",
+    metavar="FILE",
+    type=click.Path(file_okay=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Write an index of all secret references in the cluster's inventory, and the "
+    + "targets and parameter keys in which they're used, to FILE as JSON. Indexes of "
+    + "multiple clusters can be merged with `commodore catalog merge-secret-ref-indexes`.",
+)
+@click.option(
+    "--compile-meta-file",
+    metavar="FILE",
+    type=click.Path(file_okay=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Write the compile metadata to FILE as JSON after a successful catalog push "
+    + "instead of reporting it to Lieutenant. The metadata of multiple clusters can be "
+    + "reported in one go with `commodore catalog report-compile-meta`.",
+)
+@click.option(
+    "--dependency-url-rewrite",
+    metavar="PREFIX=REPLACEMENT",
+    multiple=True,
+    help="Fetch dependencies whose URL starts with PREFIX from the URL with PREFIX "
+    + "replaced by REPLACEMENT. The rewrite is only applied when fetching, the "
+    + "dependency URLs in the inventory and catalog metadata are unchanged. Can be "
+    + "repeated. See `commodore dependency mirror`.",
+)
 @options.verbosity
 @options.pass_config
 # pylint: disable=too-many-arguments
@@ -198,6 +272,11 @@ def compile_catalog(
     dynamic_fact: str,
     force: bool,
     processes: int,
+    worker_memory: Optional[str],
+    pipeline: bool,
+    secret_ref_index: Optional[Path],
+    compile_meta_file: Optional[Path],
+    dependency_url_rewrite: tuple[str, ...],
 ):
     config.update_verbosity(verbose)
     config.api_url = api_url
@@ -216,6 +295,13 @@ def compile_catalog(
     config.dynamic_facts = parse_dynamic_facts_from_cli(dynamic_fact)
     config.force = not config.local and force
     config.processes = processes
+    config.worker_memory = parse_worker_memory(worker_memory)
+    config.pipeline = pipeline
+    config.secret_ref_index = secret_ref_index
+    config.compile_meta_file = compile_meta_file
+    config.dependency_url_rewrites = parse_dependency_url_rewrites(
+        dependency_url_rewrite
+    )
 
     if config.push and (
         config.global_repo_revision_override or config.tenant_repo_revision_override
@@ -287,3 +373,116 @@ def clusters_list_command(
             pass
 
     catalog_list(config, out, tenant=tenant, sort_by=sort_by)
+
+
+@catalog_group.command(
+    name="merge-secret-ref-indexes",
+    short_help="Merge secret ref indexes of multiple clusters.",
+)
+@click.argument(
+    "indexes",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, file_okay=True, dir_okay=False, path_type=Path),
+)
+@click.option(
+    "-o",
+    "--output",
+    metavar="FILE",
+    default="-",
+    show_default=True,
+    type=click.Path(file_okay=True, dir_okay=False, allow_dash=True, path_type=Path),
+    help="File to write the merged index to. The merged index is written to stdout if "
+    + "FILE is `-`.",
+)
+@options.verbosity
+@options.pass_config
+def merge_secret_ref_indexes_command(
+    config: Config, indexes: tuple[Path, ...], output: Path, verbose
+):
+    """Merge the secret ref indexes in INDEXES into a single index.
+
+    The indexes are written by `commodore catalog compile --secret-ref-index`.
+    The merged index lists which clusters, targets and parameter keys use each
+    secret reference.
+
+    INDEXES can also contain previously merged indexes. Indexes which are given
+    later replace all entries of the clusters they contain in the indexes which
+    are given earlier. This allows updating a merged index with the index of a
+    recompiled cluster without recompiling all other clusters.
+    """
+    config.update_verbosity(verbose)
+    merged = merge_secret_ref_indexes(read_secret_ref_index(i) for i in indexes)
+    write_secret_ref_index(merged, output)
+    if str(output) != "-":
+        click.secho(
+            f"Merged secret ref index of {len(merged['clusters'])} clusters "
+            + f"written to {output}",
+            bold=True,
+        )
+
+
+@catalog_group.command(
+    name="report-compile-meta",
+    short_help="Report compile metadata of multiple clusters to Lieutenant.",
+)
+@click.argument(
+    "files",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, file_okay=True, dir_okay=False, path_type=Path),
+)
+@options.api_url
+@options.api_token
+@options.oidc_client
+@options.oidc_discovery_url
+@click.option(
+    "-j",
+    "--parallelism",
+    default=8,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of compile metadata reports which are sent to Lieutenant concurrently.",
+)
+@options.verbosity
+@options.pass_config
+# pylint: disable=too-many-arguments
+def report_compile_meta_command(
+    config: Config,
+    files: tuple[Path, ...],
+    api_url,
+    api_token,
+    oidc_client,
+    oidc_discovery_url,
+    parallelism: int,
+    verbose,
+):
+    """Report the compile metadata in FILES to Lieutenant.
+
+    The files are written by `commodore catalog compile --compile-meta-file`.
+    If FILES contain metadata for the same cluster, the metadata in the file which
+    is given last is reported.
+
+    The metadata of all clusters is reported over a shared connection pool.
+    Requests which fail with a connection error or a transient server error are
+    retried with exponential backoff. The command fails if the metadata of any
+    cluster couldn't be reported.
+    """
+    config.update_verbosity(verbose)
+    config.api_url = api_url
+    config.api_token = api_token
+    config.oidc_client = oidc_client
+    config.oidc_discovery_url = oidc_discovery_url
+
+    metas = {}
+    for f in files:
+        metas.update(read_compile_metadata(f))
+
+    errors = report_compile_metadata_batch(config, metas, parallelism)
+    if errors:
+        for cluster_id, error in sorted(errors.items()):
+            click.secho(f" > {cluster_id}: {error}", fg="red")
+        raise click.ClickException(
+            f"Failed to report compile metadata of {len(errors)} of "
+            + f"{len(metas)} clusters"
+        )
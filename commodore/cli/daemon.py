@@ -0,0 +1,49 @@
+"""Command which runs the persistent Commodore daemon"""
+
+import os
+import sys
+
+from typing import Optional
+
+import click
+
+from commodore import daemon
+
+
+@click.command(
+    name="daemon",
+    short_help="Serve Commodore invocations from a persistent process",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    envvar=daemon.SOCKET_ENV,
+    default=None,
+    metavar="PATH",
+    type=click.Path(dir_okay=False),
+    help=(
+        "Path of the UNIX socket on which the daemon listens. "
+        + "Defaults to `$XDG_RUNTIME_DIR/commodore/daemon.sock`."
+    ),
+)
+def commodore_daemon(socket_path: Optional[str]):
+    """Serve Commodore invocations from a persistent process.
+
+    The daemon imports Commodore and Kapitan once, and runs each invocation which
+    it receives on its UNIX socket in a separate process forked from the daemon.
+    Invocations of `commodore` are forwarded to the daemon if environment variable
+    `COMMODORE_DAEMON_SOCKET` is set to the daemon's socket."""
+    if not socket_path:
+        socket_path = str(daemon.default_socket_path())
+    # The CLI has already initialized state (e.g. the reclass-rs thread pool) which
+    # can't be inherited by the forked request processes. Replace the current
+    # process with a clean interpreter which only runs the daemon.
+    os.execv(
+        sys.executable,
+        [
+            sys.executable,
+            "-c",
+            "import sys; from commodore.daemon import serve; serve(sys.argv[1])",
+            os.path.abspath(socket_path),
+        ],
+    )
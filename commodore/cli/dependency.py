@@ -0,0 +1,96 @@
+"""Commands which manage dependency repositories independent of a cluster"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+from pathlib import Path
+
+import click
+
+from commodore.config import Config
+from commodore.dependency_mgmt.mirror import (
+    discover_dependency_urls,
+    mirror_dependencies,
+    mirror_url_rewrites,
+)
+from commodore.inventory.parameters import InventoryFacts
+
+import commodore.cli.options as options
+
+
+@click.group(
+    name="dependency",
+    short_help="Manage dependency repositories independent of a cluster.",
+)
+@options.verbosity
+@options.pass_config
+def dependency_group(config: Config, verbose):
+    config.update_verbosity(verbose)
+
+
+@dependency_group.command(
+    name="mirror",
+    short_help="Mirror all dependency repositories used by a set of clusters.",
+)
+@options.inventory_values
+@click.option(
+    "-c",
+    "--cluster-values",
+    help="Values file which holds the facts of a single cluster. The inventory is "
+    + "rendered once for each cluster values file and tenant repo. Can be repeated.",
+    multiple=True,
+    type=click.Path(exists=True, file_okay=True, dir_okay=False),
+)
+@options.inventory_allow_missing_classes
+@click.argument(
+    "mirror-dir", type=click.Path(file_okay=False, dir_okay=True, path_type=Path)
+)
+@click.argument("global-config")
+@click.argument("tenant-config", nargs=-1)
+@options.verbosity
+@options.pass_config
+# pylint: disable=too-many-arguments
+def dependency_mirror(
+    config: Config,
+    verbose,
+    mirror_dir: Path,
+    global_config: str,
+    tenant_config: tuple[str, ...],
+    values: Iterable[str],
+    cluster_values: tuple[str, ...],
+    allow_missing_classes: bool,
+):
+    """Mirror all component and package repositories used by a set of clusters.
+
+    The command renders the inventory for each combination of provided tenant repo
+    and cluster values file, and mirrors all repositories referenced in
+    `parameters.components` and `parameters.packages` into MIRROR_DIR. Existing
+    mirrors are updated.
+
+    The command prints the URL rewrites which can be passed to `catalog compile
+    --dependency-url-rewrite` to fetch dependencies from the mirror.
+    """
+    config.update_verbosity(verbose)
+    extra_values = [Path(v) for v in values]
+    tenants = tenant_config or (None,)
+    clusters: tuple[Path | None, ...] = tuple(Path(c) for c in cluster_values) or (
+        None,
+    )
+    invfacts = [
+        InventoryFacts(
+            global_config,
+            t,
+            extra_values + ([c] if c else []),
+            allow_missing_classes,
+            ignore_class_notfound_warning=False,
+        )
+        for t in tenants
+        for c in clusters
+    ]
+
+    urls = discover_dependency_urls(config, invfacts)
+    mirror_dependencies(config, mirror_dir, urls)
+
+    click.secho("Use the mirror in compilations with:", bold=True)
+    for prefix, replacement in sorted(mirror_url_rewrites(mirror_dir, urls).items()):
+        click.echo(f"  --dependency-url-rewrite '{prefix}={replacement}'")
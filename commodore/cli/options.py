@@ -68,6 +68,87 @@ oidc_client = click.option(
     metavar="TEXT",
 )
 
+git_object_cache = click.option(
+    "--git-object-cache",
+    envvar="COMMODORE_GIT_OBJECT_CACHE",
+    default=None,
+    metavar="PATH",
+    type=click.Path(file_okay=False, dir_okay=True),
+    help=(
+        "Directory of a shared Git object cache which is used as an alternate object "
+        + "store for all dependency repositories, e.g. "
+        + "`$XDG_CACHE_HOME/commodore/git-objects`. "
+        + "The cache is disabled if this option isn't given."
+    ),
+)
+
+jsonnet_cache = click.option(
+    "--jsonnet-cache",
+    envvar="COMMODORE_JSONNET_CACHE",
+    default=None,
+    metavar="PATH",
+    type=click.Path(file_okay=False, dir_okay=True),
+    help=(
+        "Directory of a shared cache for Jsonnet libraries installed by "
+        + "jsonnet-bundler, e.g. `$XDG_CACHE_HOME/commodore/jsonnet`. "
+        + "The cache is disabled if this option isn't given."
+    ),
+)
+
+kapitan_dependency_cache = click.option(
+    "--kapitan-dependency-cache",
+    envvar="COMMODORE_KAPITAN_DEPENDENCY_CACHE",
+    default=None,
+    metavar="PATH",
+    type=click.Path(file_okay=False, dir_okay=True),
+    help=(
+        "Directory of a shared cache for Kapitan dependencies (Helm charts, Git "
+        + "repositories and HTTP downloads), e.g. "
+        + "`$XDG_CACHE_HOME/commodore/kapitan-dependencies`. "
+        + "The cache is disabled if this option isn't given."
+    ),
+)
+
+helm_template_cache = click.option(
+    "--helm-template-cache",
+    envvar="COMMODORE_HELM_TEMPLATE_CACHE",
+    default=None,
+    metavar="PATH",
+    type=click.Path(file_okay=False, dir_okay=True),
+    help=(
+        "Directory of a shared cache for Helm charts rendered by Kapitan's `helm` "
+        + "input type, e.g. `$XDG_CACHE_HOME/commodore/helm-template`. "
+        + "The cache is disabled if this option isn't given."
+    ),
+)
+
+kustomize_cache = click.option(
+    "--kustomize-cache",
+    envvar="COMMODORE_KUSTOMIZE_CACHE",
+    default=None,
+    metavar="PATH",
+    type=click.Path(file_okay=False, dir_okay=True),
+    help=(
+        "Directory of a shared cache for the output of `kustomize build` in the "
+        + "Kustomize wrapper, e.g. `$XDG_CACHE_HOME/commodore/kustomize`. "
+        + "The cache is disabled if this option isn't given."
+    ),
+)
+
+lieutenant_cache = click.option(
+    "--lieutenant-cache",
+    envvar="COMMODORE_LIEUTENANT_CACHE",
+    default=None,
+    metavar="PATH",
+    type=click.Path(file_okay=False, dir_okay=True),
+    help=(
+        "Directory of a cache for Lieutenant API responses, e.g. "
+        + "`$XDG_CACHE_HOME/commodore/lieutenant`. Cached responses are revalidated "
+        + "with conditional requests. "
+        + "Responses are only cached in memory if this option isn't given."
+    ),
+)
+
 github_token = click.option(
     "--github-token",
     help="GitHub API token",
@@ -3,16 +3,23 @@ from __future__ import annotations
 import json
 import os
 import textwrap
+import threading
+import time
 
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 from typing import Any, Optional, Union
 
 import click
 
 from . import __kustomize_wrapper__, __git_version__, __version__
 from .helpers import (
+    ApiError,
     lieutenant_post,
     lieutenant_query,
+    lieutenant_url,
     python3_executable,
     yaml_dump,
     yaml_load,
@@ -21,7 +28,8 @@ from .helpers import (
 from .component import component_parameters_key, Component
 from .config import Config
 from .inventory import Inventory
-from .login import login
+from .lieutenant_session import RETRY_STATUS
+from .login import login, refresh_token
 
 
 class Cluster:
@@ -122,7 +130,13 @@ class Cluster:
 
 def load_cluster_from_api(cfg: Config, cluster_id: str) -> Cluster:
     cluster_response = lieutenant_query(
-        cfg.api_url, cfg.api_token, "clusters", cluster_id, timeout=cfg.request_timeout
+        cfg.api_url,
+        cfg.api_token,
+        "clusters",
+        cluster_id,
+        timeout=cfg.request_timeout,
+        session=cfg.lieutenant_session,
+        cache=cfg.lieutenant_cache,
     )
     if "tenant" not in cluster_response:
         raise click.ClickException("cluster does not have a tenant reference")
@@ -132,10 +146,106 @@ def load_cluster_from_api(cfg: Config, cluster_id: str) -> Cluster:
         "tenants",
         cluster_response["tenant"],
         timeout=cfg.request_timeout,
+        session=cfg.lieutenant_session,
+        cache=cfg.lieutenant_cache,
     )
     return Cluster(cluster_response, tenant_response, cfg.dynamic_facts)
 
 
+def fetch_clusters(
+    cfg: Config, tenant: str = "", sort_by: Optional[str] = None
+) -> list[dict[str, Any]]:
+    """
+    List the clusters registered in Lieutenant, optionally only the clusters of
+    tenant `tenant`, with a single API request.
+
+    The cluster objects are added to the Lieutenant response cache, so that
+    subsequent requests for individual clusters don't make any API requests.
+    """
+    params = {}
+    if tenant:
+        params["tenant"] = tenant
+    if sort_by is not None:
+        params["sort_by"] = sort_by
+    clusters = lieutenant_query(
+        cfg.api_url,
+        cfg.api_token,
+        "clusters",
+        "",
+        params=params,
+        timeout=cfg.request_timeout,
+        session=cfg.lieutenant_session,
+        cache=cfg.lieutenant_cache,
+    )
+    for c in clusters:
+        if "id" in c:
+            cfg.lieutenant_cache.add(
+                lieutenant_url(cfg.api_url, "clusters", c["id"]),
+                {},
+                cfg.api_token,
+                c,
+            )
+    return clusters
+
+
+def load_clusters_from_api(
+    cfg: Config, cluster_ids: Optional[Iterable[str]] = None, tenant: str = ""
+) -> dict[str, Cluster]:
+    """
+    Load clusters `cluster_ids`, or all clusters (of tenant `tenant`), and their
+    tenants from the Lieutenant API.
+
+    Instead of fetching each cluster and tenant individually, the clusters are
+    fetched with a single list request, and the tenants are fetched with another
+    list request if the clusters belong to more than one tenant. All objects are
+    added to the Lieutenant response cache, so that subsequent calls to
+    `load_cluster_from_api()` for the loaded clusters don't make any API requests.
+
+    The Lieutenant API can only filter the cluster list by tenant. Callers which
+    know the tenant of the clusters in `cluster_ids` should pass it in `tenant`.
+    Otherwise, all clusters of the installation are listed and the clusters in
+    `cluster_ids` are selected from that list.
+    """
+    clusters = fetch_clusters(cfg, tenant=tenant)
+    if cluster_ids is not None:
+        wanted = set(cluster_ids)
+        clusters = [c for c in clusters if c.get("id") in wanted]
+        missing = wanted - {c["id"] for c in clusters}
+        if missing:
+            raise click.ClickException(
+                f"Clusters not found on Lieutenant: {', '.join(sorted(missing))}"
+            )
+    for c in clusters:
+        if "tenant" not in c:
+            raise click.ClickException(
+                f"cluster {c.get('id')} does not have a tenant reference"
+            )
+
+    tenant_ids = {c["tenant"] for c in clusters}
+    if len(tenant_ids) > 1:
+        tenants = lieutenant_query(
+            cfg.api_url,
+            cfg.api_token,
+            "tenants",
+            "",
+            timeout=cfg.request_timeout,
+            session=cfg.lieutenant_session,
+            cache=cfg.lieutenant_cache,
+        )
+        for t in tenants:
+            if t.get("id") in tenant_ids:
+                cfg.lieutenant_cache.add(
+                    lieutenant_url(cfg.api_url, "tenants", t["id"]),
+                    {},
+                    cfg.api_token,
+                    t,
+                )
+
+    # Tenants which weren't returned by the list request (or weren't listed at
+    # all) are fetched individually.
+    return {c["id"]: load_cluster_from_api(cfg, c["id"]) for c in clusters}
+
+
 def read_cluster_and_tenant(inv: Inventory) -> tuple[str, str]:
     """
     Reads the cluster and tenant ID from the current target.
@@ -239,6 +349,10 @@ def update_target(cfg: Config, target: str, component: Optional[str] = None):
     targetdata = render_target(
         cfg.inventory, target, cfg.get_components(), component=component
     )
+    if cfg.kustomize_cache and "_kustomize_wrapper" in targetdata["parameters"]:
+        targetdata["parameters"]["_kustomize_wrapper"] = str(
+            cfg.kustomize_cache.wrapper()
+        )
     yaml_dump(targetdata, file)
 
 
@@ -331,6 +445,12 @@ Compilation timestamp: {self.timestamp.isoformat(timespec="milliseconds")}
 def report_compile_metadata(
     cfg: Config, compile_meta: CompileMeta, cluster_id: str, report=False
 ):
+    _echo_compile_metadata(cfg, compile_meta, report)
+    if report:
+        _report_compile_metadata(cfg, compile_meta.as_dict(), cluster_id)
+
+
+def _echo_compile_metadata(cfg: Config, compile_meta: CompileMeta, report: bool):
     if cfg.verbose:
         if report:
             action = "will be reported to Lieutenant"
@@ -341,16 +461,152 @@ def report_compile_metadata(
             + textwrap.indent(json.dumps(compile_meta.as_dict(), indent=2), "    "),
         )
 
-    if report:
-        if cfg.api_token is None:
-            # Re-login to ensure we have a valid API token. This assumes that the only case where we
-            # call `report_compile_metadata()` and the api_token is None is when a short-lived OIDC
-            # token expired while we were compiling the catalog.
-            login(cfg)
-        lieutenant_post(
-            cfg.api_url,
-            cfg.api_token,
-            f"clusters/{cluster_id}",
-            "compileMeta",
-            post_data=compile_meta.as_dict(),
-        )
+
+def _report_compile_metadata(cfg: Config, meta: dict[str, Any], cluster_id: str):
+    if cfg.compile_meta_file:
+        _write_compile_metadata_file(cfg, meta, cluster_id)
+        return
+    if cfg.api_token is None:
+        # Re-login to ensure we have a valid API token. This assumes that the only case where we
+        # call `report_compile_metadata()` and the api_token is None is when a short-lived OIDC
+        # token expired while we were compiling the catalog.
+        login(cfg)
+    post_compile_metadata(cfg, meta, cluster_id)
+
+
+def _write_compile_metadata_file(cfg: Config, meta: dict[str, Any], cluster_id: str):
+    write_compile_metadata({cluster_id: meta}, cfg.compile_meta_file)
+    if cfg.debug:
+        click.echo(f" > Compile metadata written to {cfg.compile_meta_file}")
+
+
+def post_compile_metadata(cfg: Config, meta: dict[str, Any], cluster_id: str):
+    """Post compile metadata `meta` of cluster `cluster_id` to Lieutenant.
+
+    The request is retried with exponential backoff if Lieutenant responds with a
+    transient server error. Repeating the request is safe, since it overwrites the
+    cluster's compile metadata. Connection errors aren't retried here, since the
+    Lieutenant session already retries requests which fail to connect."""
+    for attempt in range(cfg.request_retries + 1):
+        try:
+            lieutenant_post(
+                cfg.api_url,
+                cfg.api_token,
+                f"clusters/{cluster_id}",
+                "compileMeta",
+                post_data=meta,
+                timeout=cfg.request_timeout,
+                session=cfg.lieutenant_session,
+            )
+            return
+        except ApiError as e:
+            if attempt == cfg.request_retries or e.status_code not in RETRY_STATUS:
+                raise
+            delay = cfg.request_backoff_factor * 2**attempt
+            click.echo(
+                f" > Reporting compile metadata of {cluster_id} failed: {e}, "
+                + f"retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+
+class CompileMetaReporter:
+    """Report compile metadata to Lieutenant after the catalog push.
+
+    The reporter is started as soon as the compile metadata is available. While the
+    catalog is pushed, the reporter refreshes an expired OIDC token in a background
+    thread, without user interaction. Once `submit()` is called with the result of
+    the push, the metadata is posted in the calling thread. If there's still no
+    valid API token at that point, the interactive login runs before the metadata
+    is posted."""
+
+    def __init__(self, cfg: Config, compile_meta: CompileMeta, cluster_id: str):
+        self._cfg = cfg
+        self._compile_meta = compile_meta
+        self._cluster_id = cluster_id
+        self._refresh: Optional[threading.Thread] = None
+
+    def start(self) -> CompileMetaReporter:
+        if self._cfg.push and not self._cfg.compile_meta_file:
+            self._refresh = threading.Thread(target=self._refresh_token, daemon=True)
+            self._refresh.start()
+        return self
+
+    def submit(self, report: bool):
+        """Report the compile metadata if `report` is true, i.e. if the catalog was
+        pushed successfully."""
+        _echo_compile_metadata(self._cfg, self._compile_meta, report)
+        if not report:
+            return
+        meta = self._compile_meta.as_dict()
+        if self._cfg.compile_meta_file:
+            _write_compile_metadata_file(self._cfg, meta, self._cluster_id)
+            return
+        if self._refresh is not None:
+            # The refresh doesn't wait for user input
+            self._refresh.join()
+        if self._cfg.api_token is None:
+            login(self._cfg)
+        try:
+            post_compile_metadata(self._cfg, meta, self._cluster_id)
+        except ApiError as e:
+            raise click.ClickException(
+                f"While reporting compile metadata to Lieutenant: {e}"
+            ) from e
+
+    def _refresh_token(self):
+        try:
+            refresh_token(self._cfg)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # We fall back to the interactive login when the metadata is reported
+            pass
+
+
+def read_compile_metadata(path: Union[str, Path]) -> dict[str, dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise click.ClickException(
+            f"Unable to read compile metadata {path}: {e}"
+        ) from e
+    if not isinstance(data, dict) or not isinstance(data.get("clusters"), dict):
+        raise click.ClickException(f"{path} isn't a compile metadata file")
+    return data["clusters"]
+
+
+def write_compile_metadata(metas: dict[str, dict[str, Any]], path: Union[str, Path]):
+    """Write the compile metadata `metas` of one or more clusters to `path`, so
+    that it can be reported later with `report_compile_metadata_batch()`."""
+    os.makedirs(Path(path).parent, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"clusters": metas}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def report_compile_metadata_batch(
+    cfg: Config, metas: dict[str, dict[str, Any]], parallelism: int = 8
+) -> dict[str, Exception]:
+    """Report the compile metadata of multiple clusters to Lieutenant concurrently.
+
+    All requests share the pooled Lieutenant session of `cfg`. Returns the errors
+    of the clusters whose metadata couldn't be reported."""
+    if cfg.api_token is None:
+        login(cfg)
+
+    def report(cluster_id: str) -> Optional[Exception]:
+        try:
+            post_compile_metadata(cfg, metas[cluster_id], cluster_id)
+        except ApiError as e:
+            return e
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+        results = pool.map(report, sorted(metas))
+        errors = {}
+        for cluster_id, error in zip(sorted(metas), results):
+            if error is None:
+                click.echo(f" > Reported compile metadata of {cluster_id}")
+            else:
+                errors[cluster_id] = error
+    return errors
@@ -1,18 +1,25 @@
 from __future__ import annotations
 
+import functools
+
 from collections.abc import Iterable
 from pathlib import Path
 from typing import Any
 
 import click
 
-from .catalog import fetch_catalog, clean_catalog, update_catalog
+from .catalog import (
+    fetch_catalog,
+    clean_catalog,
+    copy_target_manifests,
+    update_catalog,
+)
 from .cluster import (
     Cluster,
     CompileMeta,
+    CompileMetaReporter,
     load_cluster_from_api,
     read_cluster_and_tenant,
-    report_compile_metadata,
     update_params,
     update_target,
 )
@@ -38,7 +45,7 @@ from .helpers import (
     rm_tree_contents,
 )
 from .inventory.lint import check_removed_reclass_variables
-from .postprocess import postprocess_components
+from .postprocess import postprocess_component, postprocess_components
 from .refs import update_refs
 
 
@@ -247,7 +254,11 @@ def setup_compile_environment(config: Config) -> tuple[dict[str, Any], Iterable[
         component.render_jsonnetfile_json(cluster_parameters[ckey])
 
     if config.fetch_dependencies:
-        fetch_jsonnet_libraries(config.work_dir, deps=jsonnet_dependencies(config))
+        fetch_jsonnet_libraries(
+            config.work_dir,
+            deps=jsonnet_dependencies(config),
+            cache=config.jsonnet_cache,
+        )
 
     aliases = config.get_component_aliases()
 
@@ -258,6 +269,17 @@ def setup_compile_environment(config: Config) -> tuple[dict[str, Any], Iterable[
     return inventory, list(aliases.keys())
 
 
+def _finish_target(
+    config: Config, inventory: dict[str, Any], catalog_repo: GitRepo, target: str
+):
+    """Postprocess the compiled output of `target` and copy it into the catalog."""
+    alias = config.get_component_aliases()[target]
+    postprocess_component(
+        config, inventory[target], config.get_components()[alias], target
+    )
+    copy_target_manifests(config, target, catalog_repo)
+
+
 # pylint: disable=redefined-builtin
 def compile(config, cluster_id):
     if config.local:
@@ -277,15 +299,33 @@ def compile(config, cluster_id):
 
     clean_catalog(catalog_repo)
 
-    kapitan_compile(config, targets, search_paths=[config.vendor_dir])
-
-    postprocess_components(config, inventory, config.get_components())
+    if config.pipeline:
+        kapitan_compile(
+            config,
+            targets,
+            search_paths=[config.vendor_dir],
+            inventory=inventory,
+            on_compiled=functools.partial(
+                _finish_target, config, inventory, catalog_repo
+            ),
+        )
+        # Each target's manifests have already been copied into the catalog
+        catalog_targets: Iterable[str] = []
+    else:
+        kapitan_compile(
+            config, targets, search_paths=[config.vendor_dir], inventory=inventory
+        )
+        postprocess_components(config, inventory, config.get_components())
+        catalog_targets = targets
+    config.target_timings.save()
 
     compile_meta = CompileMeta(config)
+    reporter = CompileMetaReporter(config, compile_meta, cluster_id).start()
 
-    push_done = update_catalog(config, targets, catalog_repo, compile_meta)
-    report_compile_metadata(config, compile_meta, cluster_id, report=push_done)
+    push_done = update_catalog(config, catalog_targets, catalog_repo, compile_meta)
+    reporter.submit(push_done)
 
+    config.target_timings.report(targets)
     click.secho("Catalog compiled! 🎉", bold=True)
 
     config.print_deprecation_notices()
@@ -0,0 +1,112 @@
+"""Cache of Lieutenant cluster IDs for shell completion.
+
+Completions are served from a cache file per Lieutenant API URL. If the cache file
+is older than `TTL` seconds, the cached IDs are still used for the completion, but
+the cache is refreshed by a detached background process with
+
+    python -m commodore.completion_cache
+
+which reads the API URL, token and request timeout from the environment.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+from typing import Optional
+
+from xdg.BaseDirectory import xdg_cache_home
+
+from .normalize_url import normalize_url
+
+cache_dir = Path(xdg_cache_home) / "commodore" / "completion"
+
+# Age in seconds after which cached cluster IDs are refreshed in the background
+TTL = 60
+
+
+def cache_file(api_url: str) -> Path:
+    key = hashlib.sha256(normalize_url(api_url).encode("utf-8")).hexdigest()
+    return cache_dir / f"clusters-{key[:16]}.json"
+
+
+def cluster_ids(api_url: str) -> tuple[Optional[list[str]], bool]:
+    """Return the cached cluster IDs for `api_url`, or `None` if there are none,
+    and whether the cached IDs are fresh."""
+    try:
+        with open(cache_file(api_url), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        ids = [str(i) for i in data["ids"]]
+        fetched = float(data["fetched"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, False
+    return ids, time.time() - fetched < TTL
+
+
+def store_cluster_ids(api_url: str, ids: list[str]):
+    f = cache_file(api_url)
+    f.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    tmpf = f.with_name(f".{f.name}.{os.getpid()}.tmp")
+    with open(tmpf, "w", encoding="utf-8") as out:
+        json.dump(
+            {"api_url": normalize_url(api_url), "fetched": time.time(), "ids": ids},
+            out,
+        )
+    os.replace(tmpf, f)
+
+
+def refresh_in_background(api_url: str, api_token: str, timeout: int):
+    """Start a detached process which refreshes the cached cluster IDs for
+    `api_url`. The API token is passed in the environment, since the process
+    never logs in interactively."""
+    env = {
+        **os.environ,
+        "COMMODORE_API_URL": api_url,
+        "COMMODORE_API_TOKEN": api_token,
+        "COMMODORE_REQUEST_TIMEOUT": str(timeout),
+    }
+    subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "commodore.completion_cache"],
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def refresh(api_url: str, api_token: str, timeout: int):
+    """Fetch the cluster IDs for `api_url` and store them in the cache, unless
+    another process is already refreshing them."""
+    # pylint: disable=import-outside-toplevel
+    from .helpers import ApiError, lieutenant_query
+
+    lock = cache_file(api_url).with_suffix(".lock")
+    lock.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    with open(lock, "w", encoding="utf-8") as lockf:
+        try:
+            fcntl.flock(lockf, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        try:
+            clusters = lieutenant_query(
+                api_url, api_token, "clusters", "", timeout=timeout
+            )
+        except ApiError:
+            return
+        store_cluster_ids(api_url, [c["id"] for c in clusters if "id" in c])
+
+
+if __name__ == "__main__":
+    refresh(
+        os.environ["COMMODORE_API_URL"],
+        os.environ["COMMODORE_API_TOKEN"],
+        int(os.environ.get("COMMODORE_REQUEST_TIMEOUT", "5")),
+    )
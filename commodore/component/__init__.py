@@ -209,7 +209,9 @@ class Component:
         return component_parameters_key(self.name)
 
     def checkout(self):
-        self._dependency.checkout_component(self.name, self.version)
+        self._dependency.checkout_component(
+            self.name, self.version, sub_path=self.sub_path
+        )
 
     def register_alias(
         self,
@@ -235,12 +237,45 @@ class Component:
         dependency.register_component(alias, alias_target_dir)
 
     def checkout_alias(self, alias: str):
+        if alias not in self._aliases:
+            raise ValueError(
+                f"alias {alias} is not registered on component {self.name}"
+            )
+        aversion, asub_path, adep = self._aliases[alias]
+        adep.checkout_component(alias, aversion, sub_path=asub_path)
+
+    def alias_matches_checkout(self, alias: str) -> bool:
+        """Check whether alias `alias` resolves to the same repository, commit and
+        subpath as the component's current checkout."""
+        if alias not in self._aliases:
+            raise ValueError(
+                f"alias {alias} is not registered on component {self.name}"
+            )
+        aversion, asub_path, adep = self._aliases[alias]
+        worktree = self._dependency.get_component(self.name)
+        if (
+            adep is not self._dependency
+            or asub_path != self.sub_path
+            or not worktree
+            or not worktree.is_dir()
+        ):
+            return False
+        head_sha = GitRepo(None, worktree).head_sha
+        return adep.bare_repo.resolve_version(aversion) == head_sha
+
+    def share_alias_checkout(self, alias: str) -> bool:
+        """Use the component's checkout for alias `alias` instead of a separate
+        worktree.
+
+        Callers must ensure that the alias resolves to the component's current
+        checkout, cf. `alias_matches_checkout()`. Returns `False` if the alias has an
+        existing worktree which can't be removed safely."""
         if alias not in self._aliases:
             raise ValueError(
                 f"alias {alias} is not registered on component {self.name}"
             )
         adep = self._aliases[alias][2]
-        adep.checkout_component(alias, self._aliases[alias][0])
+        return adep.share_component_checkout(alias, self.name)
 
     def is_checked_out(self) -> bool:
         return self.target_dir is not None and self.target_dir.is_dir()
@@ -94,7 +94,7 @@ def compile_component(
         )
         component.render_jsonnetfile_json(component_params)
         # Fetch Jsonnet libs
-        fetch_jsonnet_libraries(component_path)
+        fetch_jsonnet_libraries(component_path, cache=config.jsonnet_cache)
 
         # Compile component
         kapitan_compile(
@@ -104,6 +104,7 @@ def compile_component(
             search_paths=search_paths,
             fake_refs=True,
             reveal=True,
+            inventory=nodes,
         )
         click.echo(
             f" > Component compiled to {output_path / 'compiled' / instance_name}"
@@ -6,7 +6,7 @@ import textwrap
 
 from enum import Enum
 from pathlib import Path as P
-from typing import Any, Iterable, Optional
+from typing import Any, Iterable, Optional, Union
 
 import click
 import jwt
@@ -16,9 +16,17 @@ import requests
 from commodore.component import Component, component_parameters_key
 from .normalize_url import normalize_url
 from .gitrepo import GitRepo
+from .gitrepo.object_cache import GitObjectCache
+from .helm_template_cache import HelmTemplateCache
+from .jsonnet_cache import JsonnetBundlerCache
+from .kapitan_dependency_cache import KapitanDependencyCache
+from .kustomize_cache import KustomizeCache
+from .lieutenant_cache import LieutenantCache
+from .lieutenant_session import DEFAULT_BACKOFF_FACTOR, DEFAULT_RETRIES, new_session
 from .inventory import Inventory
 from .multi_dependency import MultiDependency, dependency_key
 from .package import Package
+from .target_timings import TIMINGS_FILE, TargetTimings
 from . import tokencache
 
 
@@ -101,9 +109,21 @@ class Config:
     _dynamic_facts: dict[str, Any]
     _github_token: Optional[str]
     _request_timeout: int
+    _request_retries: int
+    _request_backoff_factor: float
+    _oidc_callback_port: int
+    _lieutenant_session: Optional[requests.Session]
+    _lieutenant_cache: Optional[LieutenantCache]
     _managed_tools: dict[str, str]
     _api_token: Optional[str]
+    _parsed_api_token: Optional[tuple[str, Optional[float]]]
     _processes: int
+    _git_object_cache: Optional[GitObjectCache]
+    _jsonnet_cache: Optional[JsonnetBundlerCache]
+    _kapitan_dependency_cache: Optional[KapitanDependencyCache]
+    _helm_template_cache: Optional[HelmTemplateCache]
+    _kustomize_cache: Optional[KustomizeCache]
+    _dependency_url_rewrites: dict[str, str]
 
     oidc_client: Optional[str]
     oidc_discovery_url: Optional[str]
@@ -120,6 +140,7 @@ class Config:
     ):
         self._work_dir = work_dir.resolve()
         self.api_url = api_url
+        self._parsed_api_token = None
         self.api_token = api_token
         self.oidc_client = None
         self.oidc_discovery_url = None
@@ -144,8 +165,24 @@ class Config:
         self._dynamic_facts = {}
         self._github_token = None
         self._request_timeout = 5
+        self._request_retries = DEFAULT_RETRIES
+        self._request_backoff_factor = DEFAULT_BACKOFF_FACTOR
+        self._oidc_callback_port = 18000
+        self._lieutenant_session = None
+        self._lieutenant_cache = None
         self._managed_tools = {}
         self._processes = 0
+        self._worker_memory = None
+        self._pipeline = False
+        self._secret_ref_index = None
+        self._compile_meta_file = None
+        self._git_object_cache = None
+        self._jsonnet_cache = None
+        self._kapitan_dependency_cache = None
+        self._helm_template_cache = None
+        self._kustomize_cache = None
+        self._target_timings = None
+        self._dependency_url_rewrites = {}
 
     @property
     def verbose(self):
@@ -217,19 +254,19 @@ class Config:
             # NOTE(sg): This assumes that users of this property call `login.login()` if they see
             # that the property is None. Callers that don't do so must expect failed API operations
             # when Commodore is invoked with a short-lived OIDC token.
-            try:
-                # We don't verify the signature, we just want to know if the token is expired.
-                t = jwt.decode(
+            #
+            # The token is only decoded once, afterwards we only check the expiry.
+            if (
+                self._parsed_api_token is None
+                or self._parsed_api_token[0] != self._api_token
+            ):
+                self._parsed_api_token = (
                     self._api_token,
-                    algorithms=["RS256"],
-                    options={"verify_signature": False},
+                    _token_expiry(self._api_token),
                 )
-                if "exp" in t and t["exp"] < time.time() + 10:
-                    self._api_token = None
-                # Here: tokens without 'exp' don't expire
-            except jwt.exceptions.InvalidTokenError:
-                # Assume that unparseable tokens are long-lived.
-                pass
+            exp = self._parsed_api_token[1]
+            if exp is not None and exp < time.time() + 10:
+                self._api_token = None
 
         return self._api_token
 
@@ -321,6 +358,60 @@ class Config:
     def request_timeout(self, timeout: int):
         self._request_timeout = timeout
 
+    @property
+    def request_retries(self) -> int:
+        return self._request_retries
+
+    @request_retries.setter
+    def request_retries(self, retries: int):
+        self._request_retries = retries
+        self._lieutenant_session = None
+
+    @property
+    def request_backoff_factor(self) -> float:
+        return self._request_backoff_factor
+
+    @request_backoff_factor.setter
+    def request_backoff_factor(self, backoff_factor: float):
+        self._request_backoff_factor = backoff_factor
+        self._lieutenant_session = None
+
+    @property
+    def oidc_callback_port(self) -> int:
+        """Port of the local server which receives the OIDC login callback. Port 0
+        selects a free port."""
+        return self._oidc_callback_port
+
+    @oidc_callback_port.setter
+    def oidc_callback_port(self, port: int):
+        self._oidc_callback_port = port
+
+    @property
+    def lieutenant_session(self) -> requests.Session:
+        """Pooled HTTP session for requests to the Lieutenant API, which retries
+        idempotent requests according to `request_retries` and
+        `request_backoff_factor`, and prints the duration of each request if
+        verbose output is enabled."""
+        if self._lieutenant_session is None:
+            self._lieutenant_session = new_session(
+                self._request_retries,
+                self._request_backoff_factor,
+                log_timing=lambda: self.debug,
+            )
+        return self._lieutenant_session
+
+    @property
+    def lieutenant_cache(self) -> LieutenantCache:
+        """Cache for responses of Lieutenant API GET requests. Responses are only
+        cached in memory, unless a cache directory is configured."""
+        if self._lieutenant_cache is None:
+            self._lieutenant_cache = LieutenantCache()
+        return self._lieutenant_cache
+
+    @lieutenant_cache.setter
+    def lieutenant_cache(self, cache_dir: Optional[P]):
+        self._lieutenant_cache = LieutenantCache(cache_dir)
+
     @property
     def managed_tools(self) -> dict[str, str]:
         return self._managed_tools
@@ -337,6 +428,123 @@ class Config:
     def processes(self, processes: int):
         self._processes = processes
 
+    @property
+    def worker_memory(self) -> Union[int, str, None]:
+        """Memory budget per compile worker in bytes, `auto` to use the recorded peak
+        RSS of the targets, or `None` to not take memory into account when selecting
+        the number of compile workers."""
+        return self._worker_memory
+
+    @worker_memory.setter
+    def worker_memory(self, worker_memory: Union[int, str, None]):
+        self._worker_memory = worker_memory
+
+    @property
+    def pipeline(self) -> bool:
+        """Whether each target is postprocessed and copied into the catalog as soon
+        as Kapitan has compiled it."""
+        return self._pipeline
+
+    @pipeline.setter
+    def pipeline(self, pipeline: bool):
+        self._pipeline = pipeline
+
+    @property
+    def secret_ref_index(self) -> Optional[P]:
+        """Path of the file to which the secret ref index of the compiled cluster is
+        written, if any"""
+        return self._secret_ref_index
+
+    @secret_ref_index.setter
+    def secret_ref_index(self, secret_ref_index: Optional[P]):
+        self._secret_ref_index = secret_ref_index
+
+    @property
+    def compile_meta_file(self) -> Optional[P]:
+        """Path of the file to which the compile metadata of the compiled cluster is
+        written instead of reporting it to Lieutenant, if any"""
+        return self._compile_meta_file
+
+    @compile_meta_file.setter
+    def compile_meta_file(self, compile_meta_file: Optional[P]):
+        self._compile_meta_file = compile_meta_file
+
+    @property
+    def git_object_cache(self) -> Optional[GitObjectCache]:
+        return self._git_object_cache
+
+    @git_object_cache.setter
+    def git_object_cache(self, cache_dir: Optional[P]):
+        if cache_dir:
+            self._git_object_cache = GitObjectCache(cache_dir)
+        else:
+            self._git_object_cache = None
+
+    @property
+    def jsonnet_cache(self) -> Optional[JsonnetBundlerCache]:
+        return self._jsonnet_cache
+
+    @jsonnet_cache.setter
+    def jsonnet_cache(self, cache_dir: Optional[P]):
+        if cache_dir:
+            self._jsonnet_cache = JsonnetBundlerCache(cache_dir)
+        else:
+            self._jsonnet_cache = None
+
+    @property
+    def kapitan_dependency_cache(self) -> Optional[KapitanDependencyCache]:
+        return self._kapitan_dependency_cache
+
+    @kapitan_dependency_cache.setter
+    def kapitan_dependency_cache(self, cache_dir: Optional[P]):
+        if cache_dir:
+            self._kapitan_dependency_cache = KapitanDependencyCache(cache_dir)
+        else:
+            self._kapitan_dependency_cache = None
+
+    @property
+    def helm_template_cache(self) -> Optional[HelmTemplateCache]:
+        return self._helm_template_cache
+
+    @helm_template_cache.setter
+    def helm_template_cache(self, cache_dir: Optional[P]):
+        if cache_dir:
+            self._helm_template_cache = HelmTemplateCache(cache_dir)
+        else:
+            self._helm_template_cache = None
+
+    @property
+    def kustomize_cache(self) -> Optional[KustomizeCache]:
+        return self._kustomize_cache
+
+    @kustomize_cache.setter
+    def kustomize_cache(self, cache_dir: Optional[P]):
+        if cache_dir:
+            self._kustomize_cache = KustomizeCache(cache_dir)
+        else:
+            self._kustomize_cache = None
+
+    @property
+    def target_timings(self) -> TargetTimings:
+        """Per-target compile and postprocessing durations recorded in the working
+        directory."""
+        path = self.work_dir / TIMINGS_FILE
+        if self._target_timings is None or self._target_timings.path != path:
+            self._target_timings = TargetTimings(path)
+        return self._target_timings
+
+    @property
+    def dependency_url_rewrites(self) -> dict[str, str]:
+        """URL prefixes which are rewritten when fetching dependency repositories.
+
+        Keys are the original URL prefixes, values are the replacement prefixes, e.g.
+        a local mirror created with `commodore dependency mirror`."""
+        return self._dependency_url_rewrites
+
+    @dependency_url_rewrites.setter
+    def dependency_url_rewrites(self, rewrites: dict[str, str]):
+        self._dependency_url_rewrites = rewrites
+
     @property
     def inventory(self):
         return self._inventory
@@ -388,6 +596,8 @@ class Config:
                 self.inventory.dependencies_dir,
                 author_name=self.username,
                 author_email=self.usermail,
+                object_cache=self.git_object_cache,
+                url_rewrites=self.dependency_url_rewrites,
             )
 
         dep = self._dependency_repos[depkey]
@@ -476,7 +686,7 @@ class Config:
             and self.api_url is not None
         ):
             try:
-                r = requests.get(
+                r = self.lieutenant_session.get(
                     normalize_url(self.api_url), timeout=self.request_timeout
                 )
                 api_cfg = json.loads(r.text)
@@ -488,6 +698,22 @@ class Config:
                 click.echo(f" > Unable to auto-discover OIDC config: {e}")
 
 
+def _token_expiry(token: str) -> Optional[float]:
+    """Return the expiry timestamp of JWT `token`, or `None` if it doesn't expire."""
+    try:
+        # We don't verify the signature, we just want to know if the token is expired.
+        t = jwt.decode(
+            token,
+            algorithms=["RS256"],
+            options={"verify_signature": False},
+        )
+    except jwt.exceptions.InvalidTokenError:
+        # Assume that unparseable tokens are long-lived.
+        return None
+    # Here: tokens without 'exp' don't expire
+    return t.get("exp")
+
+
 def _component_is_aliasable(cluster_parameters: dict, component_name: str):
     ckey = component_parameters_key(component_name)
     cmeta = cluster_parameters[ckey].get("_metadata", {})
@@ -507,6 +733,21 @@ def _component_supports_alias_version(
     return cmeta.get("multi_version", False) and ameta.get("multi_version", False)
 
 
+def parse_dependency_url_rewrites(raw_rewrites: Iterable[str]) -> dict[str, str]:
+    """Parse dependency URL rewrites provided on the command line.
+
+    The function expects each raw rewrite to be of the form `prefix=replacement`."""
+    rewrites: dict[str, str] = {}
+    for r in raw_rewrites:
+        prefix, sep, replacement = r.partition("=")
+        if not sep or not prefix or not replacement:
+            raise click.ClickException(
+                f"Malformed dependency URL rewrite '{r}', expected 'PREFIX=REPLACEMENT'"
+            )
+        rewrites[prefix] = replacement
+    return rewrites
+
+
 def set_fact_value(facts: dict[str, Any], raw_key: str, value: Any) -> None:
     """Set value for nested fact at `raw_key` (expected form `path.to.key`) to `value`.
 
@@ -0,0 +1,291 @@
+"""Persistent Commodore daemon which serves CLI invocations over a UNIX socket.
+
+The daemon imports Commodore, Kapitan and the Kapitan input types once, and forks
+a fresh process for each request. Requests are therefore fully isolated from each
+other, but don't pay the interpreter and import startup cost.
+
+The client side of this module is the `commodore` entrypoint. It only uses the
+standard library and Click, so that forwarding an invocation to the daemon doesn't
+import any of the heavy dependencies. Invocations are forwarded if environment variable
+`COMMODORE_DAEMON_SOCKET` is set. The client passes its stdin, stdout and stderr
+file descriptors to the daemon, so that the output of the request is written
+directly to the client's terminal.
+"""
+
+from __future__ import annotations
+
+import importlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import sys
+
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import click
+
+SOCKET_ENV = "COMMODORE_DAEMON_SOCKET"
+
+# Modules which are imported by the daemon and by the forkserver which starts
+# Kapitan's compile workers.
+PRELOAD = [
+    "commodore.cli",
+    "kapitan.targets",
+    "kapitan.inputs.copy",
+    "kapitan.inputs.external",
+    "kapitan.inputs.helm",
+    "kapitan.inputs.jinja2",
+    "kapitan.inputs.jsonnet",
+    "kapitan.inputs.kadet",
+    "kapitan.inputs.remove",
+]
+
+_LENGTH = struct.Struct("!I")
+
+# Global options of the `commodore` command which take a value. Used to find the
+# subcommand in the command line without importing the CLI.
+GLOBAL_OPTIONS_WITH_VALUE = {
+    "-d",
+    "--working-dir",
+    "--request-timeout",
+    "--request-retries",
+    "--request-backoff-factor",
+    "--oidc-callback-port",
+    "--git-object-cache",
+    "--jsonnet-cache",
+    "--kapitan-dependency-cache",
+    "--helm-template-cache",
+    "--kustomize-cache",
+    "--lieutenant-cache",
+}
+
+
+def default_socket_path() -> Path:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "commodore" / "daemon.sock"
+    return Path.home() / ".cache" / "commodore" / "daemon.sock"
+
+
+def forward(socket_path: Path, argv: list[str]) -> Optional[int]:
+    """Run the Commodore invocation `argv` in the daemon listening on
+    `socket_path`, and return its exit code.
+
+    Returns `None` if the daemon isn't reachable."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(socket_path))
+    except OSError:
+        sock.close()
+        return None
+
+    request = json.dumps(
+        {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+    ).encode("utf-8")
+    with sock, sock.makefile("r", encoding="utf-8") as responses:
+        socket.send_fds(sock, [_LENGTH.pack(len(request))], [0, 1, 2])
+        sock.sendall(request)
+        pid = None
+        try:
+            for line in responses:
+                response = json.loads(line)
+                if "pid" in response:
+                    pid = response["pid"]
+                if "exit" in response:
+                    return response["exit"]
+        except KeyboardInterrupt:
+            if pid:
+                os.kill(pid, signal.SIGINT)
+            return 130
+    click.secho(
+        f"Commodore daemon at {socket_path} closed the connection unexpectedly",
+        fg="red",
+        err=True,
+    )
+    return 1
+
+
+def subcommand(argv: list[str]) -> Optional[str]:
+    """Return the subcommand of the Commodore invocation `argv`, if any."""
+    args = iter(argv)
+    for arg in args:
+        if arg == "--":
+            return next(args, None)
+        if arg.startswith("-"):
+            if arg in GLOBAL_OPTIONS_WITH_VALUE:
+                next(args, None)
+            continue
+        return arg
+    return None
+
+
+def main():
+    """Entrypoint for the `commodore` command."""
+    socket_path = os.environ.get(SOCKET_ENV)
+    argv = sys.argv[1:]
+    if socket_path and subcommand(argv) != "daemon":
+        exit_code = forward(Path(socket_path), argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+        click.secho(
+            f"Commodore daemon not reachable at {socket_path}, running locally",
+            fg="yellow",
+            err=True,
+        )
+
+    # pylint: disable=import-outside-toplevel
+    from commodore.cli import main as cli_main
+
+    cli_main()
+
+
+def serve(socket_path: Union[str, Path]):
+    """Serve Commodore invocations on the UNIX socket at `socket_path` until the
+    daemon is interrupted.
+
+    The daemon itself never runs any Commodore code, so that each forked request
+    process starts from the same clean state. This is also required since the
+    reclass-rs thread pool and Kapitan's worker processes can't be shared across
+    `fork()`."""
+    socket_path = Path(socket_path)
+    for module in PRELOAD:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+    socket_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    # Bind to a temporary path and move the socket into place once it's listening,
+    # so that clients never see a socket which refuses connections.
+    tmp_path = socket_path.with_name(f".{socket_path.name}.{os.getpid()}")
+    tmp_path.unlink(missing_ok=True)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(str(tmp_path))
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    os.replace(tmp_path, socket_path)
+    # Reap request processes automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    print(f"Commodore daemon listening on {socket_path}", flush=True)
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                request, fds = _receive(conn)
+            except (OSError, ValueError):
+                conn.close()
+                continue
+            if os.fork() == 0:
+                server.close()
+                _run_request(conn, request, fds)
+            conn.close()
+            for fd in fds:
+                os.close(fd)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        socket_path.unlink(missing_ok=True)
+
+
+def _receive(conn: socket.socket) -> tuple[dict[str, Any], list[int]]:
+    if hasattr(socket, "SO_PEERCRED"):
+        creds = conn.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+        )
+        _, uid, _ = struct.unpack("3i", creds)
+        if uid != os.getuid():
+            raise ValueError(f"Request from foreign user {uid}")
+
+    header, fds, _, _ = socket.recv_fds(conn, _LENGTH.size, 3)
+    if len(header) != _LENGTH.size or len(fds) != 3:
+        for fd in fds:
+            os.close(fd)
+        raise ValueError("Malformed request")
+    (length,) = _LENGTH.unpack(header)
+    data = b""
+    while len(data) < length:
+        chunk = conn.recv(length - len(data))
+        if not chunk:
+            break
+        data += chunk
+    try:
+        return json.loads(data), fds
+    except ValueError:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+def _run_request(conn: socket.socket, request: dict[str, Any], fds: list[int]):
+    """Run a single request in a forked process. Never returns."""
+    exit_code = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        _send(conn, {"pid": os.getpid()})
+
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        sys.stdin = open(0, "r", encoding="utf-8", closefd=False)
+        sys.stdout = open(1, "w", encoding="utf-8", buffering=1, closefd=False)
+        sys.stderr = open(2, "w", encoding="utf-8", buffering=1, closefd=False)
+
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+
+        # Kapitan's compile workers are started from a forkserver which has the
+        # same modules preloaded as the daemon. The forkserver is started eagerly,
+        # so that it's ready by the time Kapitan compiles the catalog.
+        multiprocessing.set_start_method("forkserver", force=True)
+        multiprocessing.set_forkserver_preload(PRELOAD)
+        # pylint: disable=import-outside-toplevel
+        from multiprocessing import forkserver
+
+        forkserver.ensure_running()
+
+        from commodore.cli import run
+
+        try:
+            run(request["argv"])
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = _exit_code(e.code)
+    except BaseException:  # pylint: disable=broad-exception-caught
+        import traceback
+
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            _send(conn, {"exit": exit_code})
+        finally:
+            os._exit(exit_code)
+
+
+def _exit_code(code: Any) -> int:
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _send(conn: socket.socket, message: dict[str, Any]):
+    try:
+        conn.sendall(json.dumps(message).encode("utf-8") + b"\n")
+    except OSError:
+        pass
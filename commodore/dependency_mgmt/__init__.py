@@ -164,9 +164,23 @@ def fetch_component(cfg: Config, dependencies: Iterable[Component]):
 
 
 def setup_alias(cfg: Config, aliases: Iterable[tuple[str, Component]]):
+    """
+    Set up checkouts for component aliases.
+
+    Aliases which resolve to the same commit and subpath as their component share the
+    component's checkout through a symlink. Aliases which use a different version, or
+    whose existing separate worktree has local changes, get their own worktree.
+    """
     for alias, c in aliases:
         try:
-            c.checkout_alias(alias)
+            if c.alias_matches_checkout(alias) and c.share_alias_checkout(alias):
+                if cfg.debug:
+                    click.echo(
+                        f" > Sharing checkout of component {c.name} "
+                        + f"with instance {alias}"
+                    )
+            else:
+                c.checkout_alias(alias)
         except RefError as e:
             raise ClickException(f"while setting up component instance {alias}: {e}")
         create_alias_symlinks(cfg, c, alias)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 import json
+import shutil
 from collections.abc import Iterable
 from pathlib import Path
 from subprocess import call  # nosec
@@ -10,6 +11,7 @@ from typing import Optional
 import click
 
 from commodore.config import Config
+from commodore.jsonnet_cache import JsonnetBundlerCache, inputs_digest
 
 
 def jsonnet_dependencies(config: Config) -> Iterable:
@@ -65,21 +67,123 @@ def write_jsonnetfile(file: Path, deps: Iterable):
         f.write("\n")
 
 
-def fetch_jsonnet_libraries(cwd: Path, deps: Optional[Iterable] = None):
+def _local_directory(dep: dict) -> Optional[str]:
+    return dep.get("source", {}).get("local", {}).get("directory")
+
+
+def _needs_jsonnet_bundler(cwd: Path, dep: dict) -> bool:
+    """Check whether `dep` can't be installed by `link_local_dependencies()`.
+
+    This is the case for all non-local dependencies and for local dependencies which
+    have a `jsonnetfile.json` with dependencies of their own."""
+    directory = _local_directory(dep)
+    if directory is None:
+        return True
+    jsonnetfile = cwd / directory / "jsonnetfile.json"
+    if not jsonnetfile.is_file():
+        return False
+    try:
+        with open(jsonnetfile, "r", encoding="utf-8") as f:
+            return len(json.load(f).get("dependencies") or []) > 0
+    except (json.JSONDecodeError, AttributeError):
+        # Let jsonnet-bundler report the broken jsonnetfile
+        return True
+
+
+def link_local_dependencies(cwd: Path, deps: Iterable, prune: bool = True):
+    """Create the same `vendor/` symlinks which jsonnet-bundler creates for local
+    dependencies.
+
+    Existing symlinks are only replaced if their target doesn't match. With `prune`,
+    all other entries in `vendor/` are removed, as jsonnet-bundler would."""
+    vendor_dir = cwd / "vendor"
+    desired: dict[str, str] = {}
+    for dep in deps:
+        directory = _local_directory(dep)
+        if directory is None:
+            raise ValueError(f"Can't link non-local Jsonnet dependency {dep}")
+        desired[os.path.basename(os.path.normpath(directory))] = os.path.relpath(
+            cwd / directory, start=vendor_dir
+        )
+
+    os.makedirs(vendor_dir, exist_ok=True)
+    for entry in vendor_dir.iterdir():
+        if entry.name in desired:
+            if entry.is_symlink() and os.readlink(entry) == desired[entry.name]:
+                del desired[entry.name]
+                continue
+        elif not prune:
+            continue
+        if entry.is_dir() and not entry.is_symlink():
+            shutil.rmtree(entry)
+        else:
+            entry.unlink()
+
+    for name, target in desired.items():
+        os.symlink(target, vendor_dir / name)
+
+
+def fetch_jsonnet_libraries(
+    cwd: Path,
+    deps: Optional[Iterable] = None,
+    cache: Optional[JsonnetBundlerCache] = None,
+):
     """
     Download Jsonnet libraries using Jsonnet-Bundler.
+
+    If `deps` is given, Jsonnet-Bundler is only invoked for dependencies which
+    require it, cf. `_needs_jsonnet_bundler()`. All other dependencies are linked
+    into `vendor/` directly.
+
+    If `cache` is given, Jsonnet-Bundler isn't invoked if the cache has a recorded
+    result for unchanged inputs, or if the cache has stored packages for the
+    resolved versions of all dependencies. Otherwise, the packages installed by
+    Jsonnet-Bundler are stored in the cache. The result of the Jsonnet-Bundler run
+    is only recorded if all dependencies are pinned to a commit SHA.
     """
     jsonnetfile = cwd / "jsonnetfile.json"
+    # To make sure we don't use any stale lock files
+    lock_file = cwd / "jsonnetfile.lock.json"
+
+    local_deps: list = []
     if deps:
-        write_jsonnetfile(jsonnetfile, deps)
+        deps = list(deps)
+        local_deps = [d for d in deps if not _needs_jsonnet_bundler(cwd, d)]
+        jb_deps = [d for d in deps if _needs_jsonnet_bundler(cwd, d)]
+        if not jb_deps:
+            write_jsonnetfile(jsonnetfile, deps)
+            if lock_file.exists():
+                lock_file.unlink()
+            link_local_dependencies(cwd, local_deps)
+            return
+        write_jsonnetfile(jsonnetfile, jb_deps)
 
     if not jsonnetfile.exists():
         click.secho("No jsonnetfile.json found, skipping Jsonnet Bundler install.")
         return
 
+    if cache:
+        digest = inputs_digest(cwd, jsonnetfile)
+        if digest and cache.restore(cwd, digest):
+            click.secho(" > Using cached jsonnet-bundler result", fg="green")
+        elif cache.link(cwd, jsonnetfile):
+            click.secho(" > Using cached jsonnet-bundler packages", fg="green")
+        else:
+            # `vendor/` may contain symlinks into the cache from a previous run
+            cache.unlink_packages(cwd)
+            _jsonnet_bundler_install(cwd, lock_file)
+            cache.store(cwd, digest)
+    else:
+        _jsonnet_bundler_install(cwd, lock_file)
+
+    # Jsonnet-Bundler removes all entries from `vendor/` which it doesn't know about,
+    # so we link the remaining local dependencies after running it.
+    if local_deps:
+        link_local_dependencies(cwd, local_deps, prune=False)
+
+
+def _jsonnet_bundler_install(cwd: Path, lock_file: Path):
     try:
-        # To make sure we don't use any stale lock files
-        lock_file = cwd / "jsonnetfile.lock.json"
         if lock_file.exists():
             lock_file.unlink()
         if call(["jb", "install"], cwd=cwd) != 0:
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from git import GitCommandError, Repo
+from url_normalize.tools import deconstruct_url
+
+from commodore.config import Config
+from commodore.inventory.parameters import InventoryFacts
+from commodore.inventory.render import extract_components, extract_packages
+from commodore.multi_dependency import dependency_key
+from commodore.normalize_url import normalize_git_url
+
+
+def discover_dependency_urls(
+    cfg: Config, invfacts: Iterable[InventoryFacts]
+) -> set[str]:
+    """Collect the URLs of all components and packages in the provided inventories.
+
+    Each `InventoryFacts` object is rendered separately, so callers can provide one
+    object per cluster (or per tenant) whose dependencies should be collected."""
+    urls: set[str] = set()
+    for facts in invfacts:
+        try:
+            deps = list(extract_components(cfg, facts).values()) + list(
+                extract_packages(cfg, facts).values()
+            )
+        except ValueError as e:
+            raise click.ClickException(f"While extracting dependencies: {e}") from e
+        for spec in deps:
+            if isinstance(spec, dict) and spec.get("url"):
+                urls.add(normalize_git_url(spec["url"]))
+    return urls
+
+
+def mirror_dir(mirror_base: Path, repo_url: str) -> Path:
+    """Return the directory of the mirror of `repo_url` in `mirror_base`.
+
+    Mirrors use the same scheme-agnostic layout as `dependencies/.repos`."""
+    return mirror_base / dependency_key(repo_url)
+
+
+def mirror_repository(mirror_base: Path, repo_url: str) -> Path:
+    """Create or update a mirror clone of `repo_url` in `mirror_base`."""
+    target = mirror_dir(mirror_base, repo_url)
+    if (target / "HEAD").exists():
+        r = Repo(target)
+        r.remote().set_url(repo_url)
+        r.git.fetch("--prune", "--quiet", "origin")
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        Repo.clone_from(repo_url, target, mirror=True)
+    return target
+
+
+def _mirror_one(mirror_base: Path, repo_url: str) -> Optional[str]:
+    try:
+        mirror_repository(mirror_base, repo_url)
+    except GitCommandError as e:
+        return f"{repo_url}: {e.stderr.strip() or e}"
+    return None
+
+
+def mirror_dependencies(cfg: Config, mirror_base: Path, urls: Iterable[str]):
+    """Mirror all repositories in `urls` into `mirror_base` in parallel.
+
+    Raises a `ClickException` listing all repositories which couldn't be mirrored,
+    after all other repositories have been mirrored."""
+    mirror_base = mirror_base.resolve()
+    urls = sorted(urls)
+    click.secho(
+        f"Mirroring {len(urls)} dependency repositories to {mirror_base}...",
+        bold=True,
+    )
+    with ThreadPoolExecutor() as exe:
+        errors = [
+            e
+            for e in exe.map(lambda u: _mirror_one(mirror_base, u), urls)
+            if e is not None
+        ]
+    if cfg.debug:
+        for u in urls:
+            click.echo(f" > {u} -> {mirror_dir(mirror_base, u)}")
+    if errors:
+        raise click.ClickException(
+            "Failed to mirror repositories:\n" + "\n".join(f" > {e}" for e in errors)
+        )
+
+
+def mirror_url_rewrites(mirror_base: Path, urls: Iterable[str]) -> dict[str, str]:
+    """Compute URL prefix rewrites which redirect `urls` to their mirrors.
+
+    The rewrites can be passed to `catalog compile --dependency-url-rewrite`."""
+    mirror_base = mirror_base.resolve()
+    rewrites: dict[str, str] = {}
+    for u in urls:
+        parts = deconstruct_url(normalize_git_url(u))
+        if not parts.host:
+            # URLs without host (e.g. `file://` URLs) are rewritten individually
+            rewrites[u] = f"file://{mirror_dir(mirror_base, u)}"
+            continue
+        prefix = u[: u.index(parts.host) + len(parts.host)]
+        port = f":{parts.port}" if parts.port else ""
+        rewrites[f"{prefix}{port}/"] = f"file://{mirror_base}/{parts.host}/"
+    return rewrites
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import hashlib
+import json
+import os
 import re
 import shutil
 
@@ -11,7 +13,15 @@ from typing import Optional
 
 import click
 
-from git import Actor, BadName, FetchInfo, GitCommandError, PushInfo, Repo
+from git import (
+    Actor,
+    BadName,
+    FetchInfo,
+    GitCommandError,
+    PushInfo,
+    Reference,
+    Repo,
+)
 from git.objects import Tree
 
 from url_normalize.tools import deconstruct_url
@@ -31,6 +41,8 @@ class MergeConflict(ValueError):
 
 CommitInfo = namedtuple("CommitInfo", ["commit", "branch", "tag"])
 
+REMOTE_REFS_FILE = "commodore-remote-refs.json"
+
 
 class GitRepo:
     _repo: Repo
@@ -74,6 +86,7 @@ class GitRepo:
         author_email: Optional[str] = None,
         config=None,
         bare=False,
+        url_rewrites: Optional[dict[str, str]] = None,
     ):
         if not force_init and targetdir.exists():
             self._repo = Repo(targetdir)
@@ -83,6 +96,10 @@ class GitRepo:
         if remote:
             self.remote = remote
 
+        self._url_rewrites = url_rewrites or {}
+        if self._url_rewrites:
+            self._repo.git.update_environment(**_url_rewrite_env(self._url_rewrites))
+
         self._author = None
         self._author_name = author_name
         self._author_email = author_email
@@ -198,7 +215,7 @@ class GitRepo:
         return version.replace(self._remote_prefix(), "", 1)
 
     def _find_commit_for_version(
-        self, version: str, remote_heads: Iterable[FetchInfo]
+        self, version: str, remote_heads: Iterable[FetchInfo | Reference]
     ) -> CommitInfo:
         remote_prefix = self._remote_prefix()
         for head in remote_heads:
@@ -223,11 +240,134 @@ class GitRepo:
 
         return CommitInfo(commit=commit, branch=branch, tag=tag)
 
+    def resolve_version(self, version: Optional[str]) -> Optional[str]:
+        """Resolve `version` to a commit SHA without fetching.
+
+        Remote branches take precedence over tags, which take precedence over
+        arbitrary revisions. Returns `None` if `version` can't be resolved."""
+        if version is None:
+            version = self._default_version()
+        for rev in (
+            f"{self._remote_prefix()}{version}",
+            f"refs/tags/{version}",
+            version,
+        ):
+            try:
+                return self._repo.git.rev_parse("--verify", "-q", f"{rev}^{{commit}}")
+            except GitCommandError:
+                continue
+        return None
+
     def fetch(
         self, remote: str = "origin", tags: bool = True, prune: bool = True
     ) -> Iterable[FetchInfo]:
         return self._repo.remote(remote).fetch(tags=tags, prune=prune)
 
+    @property
+    def _remote_refs_file(self) -> Path:
+        return Path(self._repo.common_dir) / REMOTE_REFS_FILE
+
+    def _read_remote_fingerprints(self) -> dict[str, str]:
+        try:
+            with open(self._remote_refs_file, "r", encoding="utf-8") as f:
+                fingerprints = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if not isinstance(fingerprints, dict):
+            return {}
+        return fingerprints
+
+    def _write_remote_fingerprint(self, remote: str, fingerprint: str):
+        fingerprints = self._read_remote_fingerprints()
+        fingerprints[remote] = fingerprint
+        # Write to a temp file and rename, so that concurrent readers (e.g. a worktree
+        # checkout of the same bare repo) never see a partially written file.
+        tmpf = self._remote_refs_file.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmpf, "w", encoding="utf-8") as f:
+            json.dump(fingerprints, f)
+        tmpf.replace(self._remote_refs_file)
+
+    def _local_remote_refs(self, remote: str) -> list[Reference]:
+        """Return local remote-tracking branches and tags of the repo.
+
+        The returned references provide the same `name` and `commit` attributes as the
+        `FetchInfo` objects returned by `fetch()`."""
+        try:
+            heads: list[Reference] = list(self._repo.remote(remote).refs)
+        except AssertionError:
+            # Older GitPython versions raise an AssertionError for remotes without refs
+            heads = []
+        return heads + list(self._repo.tags)
+
+    def _is_local_commit(self, version: str) -> bool:
+        if not re.fullmatch(r"[0-9a-f]{40}", version):
+            return False
+        try:
+            self._repo.git.cat_file("-e", f"{version}^{{commit}}")
+        except GitCommandError:
+            return False
+        return True
+
+    def _requested_ref_unchanged(
+        self, remote: str, version: str, advertised: dict[str, str]
+    ) -> bool:
+        candidates = [
+            (f"refs/heads/{version}", f"refs/remotes/{remote}/{version}"),
+            (f"refs/tags/{version}", f"refs/tags/{version}"),
+        ]
+        for remote_ref, local_ref in candidates:
+            if remote_ref not in advertised:
+                continue
+            try:
+                local_sha = self._repo.git.rev_parse("--verify", "-q", local_ref)
+            except GitCommandError:
+                return False
+            return local_sha == advertised[remote_ref]
+        return False
+
+    def fetch_if_changed(
+        self, remote: str = "origin", version: Optional[str] = None
+    ) -> Iterable[FetchInfo | Reference]:
+        """Fetch from `remote`, unless the remote refs haven't changed since the last
+        fetch.
+
+        If `version` is a commit SHA which is present locally, we don't contact the
+        remote at all. Otherwise, we compare the current `ls-remote` ref advertisement
+        with the one we've seen before the last fetch and skip the fetch if it's
+        identical, or if the ref for the requested `version` is unchanged.
+
+        If the fetch is skipped, the local remote-tracking branches and tags are
+        returned instead of the `FetchInfo` objects of a fetch."""
+        if version and self._is_local_commit(version):
+            return self._local_remote_refs(remote)
+
+        remote_url = self._repo.remote(remote).url
+        try:
+            advertisement = self._repo.git.ls_remote(remote)
+        except GitCommandError:
+            # Let the regular fetch surface any errors
+            return self.fetch(remote=remote)
+
+        # We include the remote URL in the fingerprint, since the remote-tracking refs
+        # are overwritten when the remote's URL changes.
+        fingerprint = hashlib.sha256(
+            f"{remote_url}\n{advertisement}".encode("utf-8")
+        ).hexdigest()
+        if self._read_remote_fingerprints().get(remote) == fingerprint:
+            return self._local_remote_refs(remote)
+
+        if version:
+            advertised = {}
+            for line in advertisement.splitlines():
+                sha, _, ref = line.partition("\t")
+                advertised[ref] = sha
+            if self._requested_ref_unchanged(remote, version, advertised):
+                return self._local_remote_refs(remote)
+
+        remote_heads = self.fetch(remote=remote)
+        self._write_remote_fingerprint(remote, fingerprint)
+        return remote_heads
+
     def has_local_branches(self) -> bool:
         if len(self.repo.remotes) == 0:
             # If we don't have a remote, the fact that we have local branches is
@@ -235,7 +375,9 @@ class GitRepo:
             return False
         local_heads = set(h.name for h in self.repo.heads)
         remote_prefix = self._remote_prefix()
-        remote_heads = set(h.name.replace(remote_prefix, "", 1) for h in self.fetch())
+        remote_heads = set(
+            h.name.replace(remote_prefix, "", 1) for h in self.fetch_if_changed()
+        )
         return len(local_heads - remote_heads) > 0
 
     def has_local_changes(self) -> bool:
@@ -257,22 +399,77 @@ class GitRepo:
             len(list(self.repo.iter_commits(f"{tracking_branch}..{active_branch}"))) > 0
         )
 
-    def _create_worktree(self, worktree: Path, version: str):
+    def _create_worktree(self, worktree: Path, version: str, sparse_path: str = ""):
         """Create worktree.
 
+        If `sparse_path` is given, the worktree is created as a sparse checkout of
+        that path, see `update_sparse_checkout()`.
+
         This method expects `worktree` to not exist."""
 
         # We need to use `git.execute()` for the worktree commands as GitPython only has
         # basic support for worktrees.
         self._repo.git.execute(["git", "worktree", "prune"])
-        cmd = ["git", "worktree", "add", "-f", str(worktree), version]
+        cmd = ["git", "worktree", "add", "-f"]
+        if sparse_path:
+            # Don't populate the working tree before the sparse checkout patterns are
+            # in place.
+            cmd.append("--no-checkout")
+        cmd.extend([str(worktree), version])
         try:
             self._repo.git.execute(cmd)
         except GitCommandError as e:
             # Assume that GitCommandError is only caused by invalid versions
             raise RefError(f"Failed to checkout revision '{version}'") from e
 
-    def _migrate_to_worktree(self, wtr: GitRepo, worktree: Path, version: str):
+        if sparse_path:
+            wtr = GitRepo(
+                None,
+                worktree,
+                author_name=self.author.name,
+                author_email=self.author.email,
+            )
+            wtr.update_sparse_checkout(sparse_path)
+
+    def update_sparse_checkout(self, sparse_path: str):
+        """Limit the working tree of this worktree to `sparse_path`.
+
+        We use cone-mode patterns, so all files in the repository root are always
+        checked out in addition to the contents of `sparse_path`. If `sparse_path` is
+        empty, a previously configured sparse checkout is expanded to the full tree.
+
+        NOTE: We don't use `git sparse-checkout`, since it enables
+        `extensions.worktreeConfig` and moves `core.bare` out of the bare repo's
+        config, which breaks GitPython's detection of bare repos. Instead, we enable
+        sparse checkouts in the shared config and write the worktree's
+        `info/sparse-checkout` file ourselves. Worktrees without that file are
+        unaffected by the shared config and always get a full checkout.
+        """
+        sparse_file = Path(self._repo.git_dir) / "info" / "sparse-checkout"
+        sparse_path = sparse_path.strip("/")
+        if sparse_path in ("", "."):
+            if not sparse_file.exists():
+                return
+            patterns = "/*\n"
+        else:
+            self._repo.git.config("core.sparseCheckout", "true")
+            self._repo.git.config("core.sparseCheckoutCone", "true")
+            patterns = _cone_patterns(sparse_path)
+
+        if sparse_file.exists() and self._repo.head.is_valid():
+            with open(sparse_file, "r", encoding="utf-8") as f:
+                if f.read() == patterns and self._repo.git.ls_files():
+                    # Patterns are unchanged, and the index is populated.
+                    return
+
+        sparse_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(sparse_file, "w", encoding="utf-8") as f:
+            f.write(patterns)
+        self._repo.git.read_tree("-mu", "HEAD")
+
+    def _migrate_to_worktree(
+        self, wtr: GitRepo, worktree: Path, version: str, sparse_path: str = ""
+    ):
         """Migrate non-worktree checkout to worktree."""
         if wtr.has_local_branches() or wtr.has_local_changes():
             raise click.ClickException(
@@ -282,9 +479,11 @@ class GitRepo:
             )
         click.secho(f" > Removing non-worktree based checkout {worktree}", fg="yellow")
         shutil.rmtree(worktree)
-        self._create_worktree(worktree, version)
+        self._create_worktree(worktree, version, sparse_path=sparse_path)
 
-    def _update_worktree_remote(self, wtr: GitRepo, worktree: Path, version: str):
+    def _update_worktree_remote(
+        self, wtr: GitRepo, worktree: Path, version: str, sparse_path: str = ""
+    ):
         """Update existing worktree checkout to new remote.
 
         Updating the remote for a worktree needs special handling, since we generally
@@ -303,57 +502,79 @@ class GitRepo:
             fg="green",
         )
         wtr.repo.git.execute(["git", "worktree", "remove", str(worktree)])
-        self._create_worktree(worktree, version)
+        self._create_worktree(worktree, version, sparse_path=sparse_path)
 
-    def _checkout_existing_worktree(self, worktree: Path, version: str):
+    def _checkout_existing_worktree(
+        self, worktree: Path, version: str, sparse_path: str = ""
+    ):
         """Perform checkout if requested worktree directory already exists.
 
         The heavy work is generally done by `_migrate_to_worktree()`,
         `_update_worktree_remote()` or `checkout()`.
         """
         wtr = GitRepo(
-            None, worktree, author_name=self.author.name, author_email=self.author.email
+            None,
+            worktree,
+            author_name=self.author.name,
+            author_email=self.author.email,
+            url_rewrites=self._url_rewrites,
         )
         if not wtr.repo.has_separate_working_tree():
             # If the worktree's common dir is stored in the repository working tree
             # root, we're migrating from a non-worktree checkout to a worktree checkout.
-            self._migrate_to_worktree(wtr, worktree, version)
+            self._migrate_to_worktree(wtr, worktree, version, sparse_path=sparse_path)
         elif wtr.remote != self.remote:
             # If the existing directory is already a worktree, but we're using a
             # different remote for the requested worktree, we need to recreate the
             # worktree from the new remote's bare clone.
-            self._update_worktree_remote(wtr, worktree, version)
+            self._update_worktree_remote(
+                wtr, worktree, version, sparse_path=sparse_path
+            )
         else:
             # Otherwise, we just need to update the worktree's version. We simply use
             # `checkout()` in the worktree to do so.
             wtr.checkout(version)
+            wtr.update_sparse_checkout(sparse_path)
 
-    def checkout_worktree(self, worktree: Path, version: Optional[str]):
+    def checkout_worktree(
+        self, worktree: Path, version: Optional[str], sparse_path: str = ""
+    ):
         """Create worktree if it doesn't exist and check out `version` in it.
 
         If `version` is not provided, the remote's default branch is checked out.
 
+        If `sparse_path` is provided, only that path and the files in the repository
+        root are checked out in the worktree.
+
         If a repo which isn't a worktree of `self` is found in the requested worktree
         location, the method will try to replace the old checkout with the requested
         worktree unless there's any local changes (untracked files, uncommitted changes,
         or branches which don't exist upstream).
+
+        If the requested worktree location is a symlink to a shared checkout, the
+        symlink is replaced with a separate worktree.
         """
         # Try to fetch remote heads, so we can actually check them out
         try:
-            _ = self.fetch()
+            _ = self.fetch_if_changed(version=version)
         except ValueError:
             pass
 
         if version is None:
             version = self._default_version()
 
+        # Never check out a version through a symlink, since that would modify the
+        # shared checkout the symlink points to.
+        if worktree.is_symlink():
+            worktree.unlink()
+
         # If the worktree directory exists, use `_checkout_existing_worktree()`
         if worktree.is_dir():
-            self._checkout_existing_worktree(worktree, version)
+            self._checkout_existing_worktree(worktree, version, sparse_path=sparse_path)
             return
 
         # If the worktree directory doesn't exist yet, create the worktree
-        self._create_worktree(worktree, version)
+        self._create_worktree(worktree, version, sparse_path=sparse_path)
 
     def initialize_worktree(
         self, worktree: Path, initial_branch: Optional[str] = None
@@ -408,7 +629,7 @@ class GitRepo:
         return worktrees
 
     def checkout(self, version: Optional[str] = None):
-        remote_heads = self.fetch()
+        remote_heads = self.fetch_if_changed(version=version)
         if not remote_heads:
             # GitPython's fetch-info parsing chokes on lines like
             # "   (refs/remotes/origin/HEAD has become dangling)"
@@ -576,3 +797,32 @@ class GitRepo:
 
     def reset(self, working_tree: bool = False):
         self._repo.head.reset(working_tree=working_tree)
+
+
+def _url_rewrite_env(url_rewrites: dict[str, str]) -> dict[str, str]:
+    """Render Git `url.<base>.insteadOf` config for `url_rewrites` as environment
+    variables.
+
+    The keys of `url_rewrites` are URL prefixes which are replaced with the
+    corresponding values. We pass the config through the environment, so that the
+    rewrites are never persisted in the repo config, and the repo's remote URL stays
+    unchanged."""
+    env = {"GIT_CONFIG_COUNT": str(len(url_rewrites))}
+    for i, (prefix, replacement) in enumerate(sorted(url_rewrites.items())):
+        env[f"GIT_CONFIG_KEY_{i}"] = f"url.{replacement}.insteadOf"
+        env[f"GIT_CONFIG_VALUE_{i}"] = prefix
+    return env
+
+
+def _cone_patterns(sparse_path: str) -> str:
+    """Render cone-mode sparse checkout patterns for directory `sparse_path`.
+
+    The patterns include all files in the repository root and in each parent
+    directory of `sparse_path`, and the full contents of `sparse_path`."""
+    patterns = ["/*", "!/*/"]
+    parts = sparse_path.split("/")
+    for i in range(1, len(parts)):
+        prefix = "/".join(parts[:i])
+        patterns.extend([f"/{prefix}/", f"!/{prefix}/*/"])
+    patterns.append(f"/{sparse_path}/")
+    return "\n".join(patterns) + "\n"
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from git import GitCommandError, Repo
+
+from . import _url_rewrite_env
+
+REFS_PREFIX = "refs/commodore"
+REFERRERS_FILE = "commodore-referrers"
+LOCKS_DIR = "commodore-locks"
+
+
+class GitObjectCache:
+    """Machine-wide Git object store which is shared by dependency bare repos.
+
+    The cache is a single bare repository. Each dependency URL gets its own ref
+    namespace `refs/commodore/deps/<hash>/` in the cache, and dependency repos use the
+    cache's object directory through Git alternates (`objects/info/alternates`).
+
+    Updates of the cache are serialized per dependency with `flock()` locks stored
+    in the cache directory. All updates hold a shared lock on the GC lock, so that
+    `gc()` can take an exclusive lock to ensure it doesn't run concurrently with any
+    updates.
+    """
+
+    _dir: Path
+    _repo: Optional[Repo]
+
+    def __init__(self, directory: Path):
+        self._dir = directory.expanduser().resolve()
+        self._repo = None
+
+    @property
+    def directory(self) -> Path:
+        return self._dir
+
+    @property
+    def objects_dir(self) -> Path:
+        return self._dir / "objects"
+
+    @property
+    def referrers_file(self) -> Path:
+        return self._dir / REFERRERS_FILE
+
+    @property
+    def repo(self) -> Repo:
+        if not self._repo:
+            os.makedirs(self._dir, exist_ok=True)
+            with self._lock("init"):
+                if (self._dir / "HEAD").exists():
+                    self._repo = Repo(self._dir)
+                else:
+                    self._repo = Repo.init(
+                        self._dir, bare=True, initial_branch="master"
+                    )
+        return self._repo
+
+    @contextmanager
+    def _lock(self, name: str, exclusive: bool = True) -> Iterator[None]:
+        lockdir = self._dir / LOCKS_DIR
+        os.makedirs(lockdir, exist_ok=True)
+        with open(lockdir / f"{name}.lock", "a", encoding="utf-8") as lockf:
+            fcntl.flock(lockf, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockf, fcntl.LOCK_UN)
+
+    def update(
+        self, repo_url: str, key: str, url_rewrites: Optional[dict[str, str]] = None
+    ):
+        """Fetch branches and tags of `repo_url` into the ref namespace for `key`.
+
+        Errors during the fetch are reported, but not raised, since the dependency
+        repo's own fetch will still download any objects missing from the cache.
+        """
+        ns = _namespace(key)
+        refspecs = [
+            f"+refs/heads/*:{REFS_PREFIX}/deps/{ns}/heads/*",
+            f"+refs/tags/*:{REFS_PREFIX}/deps/{ns}/tags/*",
+        ]
+        repo = self.repo
+        env = _url_rewrite_env(url_rewrites) if url_rewrites else {}
+        with self._lock("gc", exclusive=False), self._lock(f"dep-{ns}"):
+            try:
+                with repo.git.custom_environment(**env):
+                    repo.git.execute(
+                        ["git", "fetch", "--quiet", "--no-tags", "--prune", repo_url]
+                        + refspecs
+                    )
+            except GitCommandError as e:
+                click.secho(
+                    f" > Unable to update shared Git object cache for {repo_url}: {e}",
+                    fg="yellow",
+                )
+
+    def is_linked(self, repo_dir: Path) -> bool:
+        """Check whether the bare repo in `repo_dir` uses the cache as alternate."""
+        alternates = repo_dir / "objects" / "info" / "alternates"
+        if not alternates.is_file():
+            return False
+        with open(alternates, "r", encoding="utf-8") as f:
+            return str(self.objects_dir) in (line.strip() for line in f)
+
+    def link(self, repo_dir: Path, key: str):
+        """Configure the bare repo in `repo_dir` to use the cache as alternate and
+        register it as a referrer of the cache, so that `gc()` respects its refs."""
+        repo_dir = repo_dir.resolve()
+        if not self.is_linked(repo_dir):
+            infodir = repo_dir / "objects" / "info"
+            os.makedirs(infodir, exist_ok=True)
+            with open(infodir / "alternates", "a", encoding="utf-8") as f:
+                f.write(f"{self.objects_dir}\n")
+
+        # Make sure the cache repo exists before we take any locks.
+        _ = self.repo
+        with self._lock("gc", exclusive=False), self._lock("referrers"):
+            referrers = self._read_referrers()
+            if referrers.get(repo_dir) != key:
+                with open(self.referrers_file, "a", encoding="utf-8") as f:
+                    f.write(f"{key}\t{repo_dir}\n")
+
+    def _read_referrers(self) -> dict[Path, str]:
+        referrers: dict[Path, str] = {}
+        if not self.referrers_file.is_file():
+            return referrers
+        with open(self.referrers_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if "\t" not in line:
+                    continue
+                key, path = line.rstrip("\n").split("\t", maxsplit=1)
+                referrers[Path(path)] = key
+        return referrers
+
+    def _write_referrers(self, referrers: dict[Path, str]):
+        tmpf = self.referrers_file.with_suffix(".tmp")
+        with open(tmpf, "w", encoding="utf-8") as f:
+            for path, key in sorted(referrers.items()):
+                f.write(f"{key}\t{path}\n")
+        os.replace(tmpf, self.referrers_file)
+
+    def _delete_refs(self, prefix: str, keep: Optional[set[str]] = None):
+        refs = self.repo.git.execute(
+            ["git", "for-each-ref", "--format=%(refname)", prefix],
+            as_process=False,
+            with_extended_output=False,
+            stdout_as_string=True,
+        ).splitlines()
+        for r in refs:
+            if keep and any(r.startswith(k) for k in keep):
+                continue
+            self.repo.git.execute(["git", "update-ref", "-d", r])
+
+    def _pin_referrer(self, repo_dir: Path):
+        """Create refs in the cache for all refs and worktree HEADs of `repo_dir`.
+
+        We fetch the tips from the referrer, so that objects which only exist in the
+        referrer (e.g. local commits) don't reference pruned objects in the cache.
+        """
+        r = Repo(repo_dir)
+        tips = set(
+            r.git.execute(
+                ["git", "for-each-ref", "--format=%(objectname)"],
+                as_process=False,
+                with_extended_output=False,
+                stdout_as_string=True,
+            ).splitlines()
+        )
+        wt_list = r.git.execute(
+            ["git", "worktree", "list", "--porcelain"],
+            as_process=False,
+            with_extended_output=False,
+            stdout_as_string=True,
+        ).splitlines()
+        for line in wt_list:
+            if line.startswith("HEAD "):
+                tips.add(line.split(" ", maxsplit=1)[1])
+        tips.discard("")
+        if not tips:
+            return
+
+        ns = _namespace(str(repo_dir))
+        refspecs = [f"{t}:{REFS_PREFIX}/referrers/{ns}/{t}" for t in sorted(tips)]
+        self.repo.git.execute(
+            [
+                "git",
+                "fetch",
+                "--quiet",
+                "--no-tags",
+                "--no-write-fetch-head",
+                str(repo_dir),
+            ]
+            + refspecs
+        )
+
+    def gc(self, prune: Optional[str] = None) -> tuple[int, int]:
+        """Garbage collect the cache without dropping objects used by any referrer.
+
+        Referrers which don't exist anymore or don't use the cache anymore are
+        dropped, and ref namespaces of dependencies which aren't used by any remaining
+        referrer are deleted before running `git gc`.
+
+        Returns a tuple of the number of live and dropped referrers.
+        """
+        _ = self.repo
+        with self._lock("gc"), self._lock("referrers"):
+            referrers = self._read_referrers()
+            live = {
+                p: k for p, k in referrers.items() if p.is_dir() and self.is_linked(p)
+            }
+            self._write_referrers(live)
+
+            used_deps = {
+                f"{REFS_PREFIX}/deps/{_namespace(k)}/" for k in set(live.values())
+            }
+            self._delete_refs(f"{REFS_PREFIX}/deps/", keep=used_deps)
+            self._delete_refs(f"{REFS_PREFIX}/referrers/")
+            for p in sorted(live.keys()):
+                try:
+                    self._pin_referrer(p)
+                except GitCommandError as e:
+                    raise click.ClickException(
+                        f"While collecting refs of {p}, aborting GC: {e}"
+                    ) from e
+
+            cmd = ["git", "gc", "--quiet"]
+            if prune:
+                cmd.append(f"--prune={prune}")
+            self.repo.git.execute(cmd)
+
+        return len(live), len(referrers) - len(live)
+
+
+def _namespace(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Optional
+
+import click
+import yaml
+
+import kapitan.inputs.helm as kapitan_helm  # type: ignore
+import kapitan.targets as kapitan_targets  # type: ignore
+from kapitan import cached  # type: ignore
+from kapitan.helm_cli import helm_version  # type: ignore
+from kapitan.inputs.cache import CacheMetrics, walk_and_hash  # type: ignore
+from kapitan.targets import _pool_init as _kapitan_pool_init  # type: ignore
+
+ENTRIES_DIR = "entries"
+
+
+class HelmTemplateCache:
+    """Shared cache for the output of Kapitan's `helm` input type.
+
+    Each rendered chart is stored in `entries/<key>`, where the key is computed from
+    the contents of the chart directory, the Helm parameters (including release name
+    and namespace), the canonicalized Helm values, the Helm flags and the Helm
+    version. Renders whose key is present in the cache are served from disk instead
+    of running `helm template`.
+
+    All writes to the cache are atomic, so the cache can be shared by concurrent
+    compilations.
+    """
+
+    _dir: Path
+    _metrics: Optional[CacheMetrics]
+
+    def __init__(self, directory: Path):
+        self._dir = directory.expanduser().resolve()
+        self._metrics = None
+
+    @property
+    def directory(self) -> Path:
+        return self._dir
+
+    def entry_dir(self, key: str) -> Path:
+        return self._dir / ENTRIES_DIR / key
+
+    @contextmanager
+    def enabled(self) -> Iterator[None]:
+        """Serve renders of Kapitan's `helm` input type from the cache while the
+        context is active, and report the cache hits and misses afterwards.
+
+        Kapitan's compile workers are started with the `spawn` method, and don't
+        inherit the patched render function. We therefore pass the cache to the
+        workers in Kapitan's `cached.args`, and wrap Kapitan's pool initializer to
+        enable the cache in each worker. The hit and miss counters are shared
+        between all workers."""
+        self._metrics = CacheMetrics()
+        render_chart = kapitan_helm.render_chart
+        pool_init = kapitan_targets._pool_init
+        cached.args.commodore_helm_template_cache = self
+        kapitan_targets._pool_init = _pool_init
+        self.install()
+        try:
+            yield
+        finally:
+            kapitan_helm.render_chart = render_chart
+            kapitan_targets._pool_init = pool_init
+            del cached.args.commodore_helm_template_cache
+        stats = self._metrics.snapshot()
+        click.echo(
+            f" > Helm template cache: {stats['hits']} hits, {stats['misses']} misses"
+        )
+
+    def install(self):
+        """Patch Kapitan's `helm` input type in the current process to use the
+        cache."""
+        render_chart = kapitan_helm.render_chart
+
+        def _cached_render_chart(*args, **kwargs):
+            return self.render_chart(render_chart, *args, **kwargs)
+
+        kapitan_helm.render_chart = _cached_render_chart
+
+    # pylint: disable=too-many-arguments
+    def render_chart(
+        self,
+        render_chart,
+        chart_dir,
+        output_path,
+        helm_path,
+        helm_params,
+        helm_values_file,
+        helm_values_files,
+        helm_flags=None,
+    ):
+        """Wrapper for Kapitan's `render_chart()` which uses the cache for renders
+        into an output directory."""
+        args = (
+            chart_dir,
+            output_path,
+            helm_path,
+            helm_params,
+            helm_values_file,
+            helm_values_files,
+            helm_flags,
+        )
+        if output_path in (None, "-") or helm_params.get("output_file"):
+            return render_chart(*args)
+
+        key = cache_key(
+            chart_dir,
+            helm_path,
+            helm_params,
+            [helm_values_file] + list(helm_values_files or []),
+            helm_flags,
+        )
+        entry = self.entry_dir(key)
+        if entry.is_dir():
+            shutil.copytree(entry, output_path, symlinks=True, dirs_exist_ok=True)
+            self._count("hit")
+            return ("", "")
+
+        self._count("miss")
+        output, error_message = render_chart(*args)
+        if not error_message:
+            self._store(Path(output_path), key)
+        return (output, error_message)
+
+    def _count(self, event: str):
+        if self._metrics is not None:
+            getattr(self._metrics, event)()
+
+    def _store(self, output_path: Path, key: str):
+        target = self.entry_dir(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmpdir = Path(tempfile.mkdtemp(dir=target.parent, prefix=f".{key}-"))
+        try:
+            shutil.copytree(output_path, tmpdir / "output", symlinks=True)
+            os.rename(tmpdir / "output", target)
+        except OSError:
+            # Another process has stored the entry concurrently
+            if not target.is_dir():
+                raise
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _pool_init(globals_cached, input_cache_metrics):
+    """Wrapper for Kapitan's compile pool initializer which enables the Helm
+    template cache in the worker."""
+    _kapitan_pool_init(globals_cached, input_cache_metrics)
+    cache = getattr(cached.args, "commodore_helm_template_cache", None)
+    if cache is not None:
+        cache.install()
+
+
+def cache_key(
+    chart_dir: str,
+    helm_path: Optional[str],
+    helm_params: dict[str, Any],
+    values_files: list[Optional[str]],
+    helm_flags: Optional[dict[str, Any]],
+) -> str:
+    """Compute the cache key for a `helm template` run.
+
+    Values files are parsed and serialized with sorted keys, so that the key
+    doesn't depend on the order in which the values were written."""
+    h = hashlib.sha256()
+    h.update(b"chart\0")
+    walk_and_hash(Path(chart_dir), None, h)
+    values = []
+    for values_file in values_files:
+        if not values_file:
+            continue
+        with open(values_file, "r", encoding="utf-8") as f:
+            values.append(yaml.safe_load(f))
+    for name, data in [
+        ("values", values),
+        ("params", helm_params),
+        ("flags", helm_flags),
+    ]:
+        h.update(f"\0{name}\0".encode("utf-8"))
+        h.update(json.dumps(data, sort_keys=True, default=str).encode("utf-8"))
+    h.update(b"\0helm_version\0")
+    h.update(helm_version(helm_path).encode("utf-8"))
+    return h.hexdigest()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import collections
+import contextlib
 import itertools
 import json
 import shutil
@@ -23,14 +24,19 @@ from kapitan import cached  # type: ignore
 from kapitan import targets as kapitan_targets  # type: ignore
 from kapitan import defaults  # type: ignore
 from kapitan.cached import reset_cache as reset_reclass_cache  # type: ignore
+from kapitan.inventory.backends.reclass_rs import ReclassRsInventory  # type: ignore
 from kapitan.refs.base import RefController, PlainRef  # type: ignore
 from kapitan.refs.secrets.vaultkv import VaultBackend  # type: ignore
 
 from reclass_rs import Reclass
 
-from commodore import __install_dir__
+from commodore import __install_dir__, kapitan_pipeline
 from commodore.config import Config
+from commodore.kapitan_dependency_cache import kapitan_dependencies
+from commodore.lieutenant_cache import LieutenantCache
+from commodore.lieutenant_session import default_session
 from commodore.normalize_url import normalize_url
+from commodore.worker_memory import WorkerPlan, plan_workers
 
 
 class FakeVaultBackend(VaultBackend):
@@ -43,7 +49,12 @@ class FakeVaultBackend(VaultBackend):
 
 
 class ApiError(Exception):
-    pass
+    """Error response from the Lieutenant API. `status_code` is the HTTP status of
+    the response, if a response was received."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
 
 
 class IndentedListDumper(yaml.Dumper):
@@ -97,6 +108,14 @@ def yaml_dump(obj, file):
         yaml.dump(obj, outf, Dumper=IndentedListDumper)
 
 
+def yaml_dumps(obj) -> str:
+    """
+    Dump obj as single-document YAML string
+    """
+    yaml.add_representer(str, _represent_str)
+    return yaml.dump(obj, Dumper=IndentedListDumper)
+
+
 def yaml_dump_all(obj, file):
     """
     Dump obj as multi-document YAML
@@ -111,6 +130,10 @@ class RequestMethod(Enum):
     POST = "POST"
 
 
+def lieutenant_url(api_url: str, api_endpoint: str, api_id: str) -> str:
+    return normalize_url(f"{api_url}/{api_endpoint}/{api_id}")
+
+
 def _lieutenant_request(
     method: RequestMethod,
     api_url: str,
@@ -119,17 +142,34 @@ def _lieutenant_request(
     api_id: str,
     params={},
     timeout=5,
+    session: Optional[requests.Session] = None,
+    cache: Optional[LieutenantCache] = None,
     **kwargs,
 ):
-    url = normalize_url(f"{api_url}/{api_endpoint}/{api_id}")
+    url = lieutenant_url(api_url, api_endpoint, api_id)
     headers = {"Authorization": f"Bearer {api_token}"}
+    if session is None:
+        session = default_session()
     try:
         if method == RequestMethod.GET:
-            r = requests.get(url, headers=headers, params=params, timeout=timeout)
+            if cache is not None:
+                return cache.fetch(
+                    url,
+                    params,
+                    api_token,
+                    lambda extra_headers: session.get(
+                        url,
+                        headers={**headers, **extra_headers},
+                        params=params,
+                        timeout=timeout,
+                    ),
+                    _handle_lieutenant_response,
+                )
+            r = session.get(url, headers=headers, params=params, timeout=timeout)
         elif method == RequestMethod.POST:
             headers["Content-Type"] = "application/json"
             data = kwargs.get("post_data", {})
-            r = requests.post(
+            r = session.post(
                 url,
                 json.dumps(data),
                 headers=headers,
@@ -148,7 +188,7 @@ def _lieutenant_request(
                 # bearer token for GET requests.
                 # Note that this wouldn't be necessary if all Lieutenant APIs would redirect us with
                 # a 308 for POST requests.
-                r = requests.post(
+                r = session.post(
                     r.headers["location"],
                     json.dumps(data),
                     headers=headers,
@@ -172,7 +212,7 @@ def _handle_lieutenant_response(r: requests.Response):
         else:
             resp = {}
     except json.JSONDecodeError as e:
-        raise ApiError("Client error: Unable to parse JSON") from e
+        raise ApiError("Client error: Unable to parse JSON", r.status_code) from e
     try:
         r.raise_for_status()
     except HTTPError as e:
@@ -182,19 +222,43 @@ def _handle_lieutenant_response(r: requests.Response):
                 extra_msg = f": {resp['reason']}"
             else:
                 extra_msg = f": {e}"
-        raise ApiError(f"API returned {r.status_code}{extra_msg}") from e
+        raise ApiError(f"API returned {r.status_code}{extra_msg}", r.status_code) from e
     else:
         return resp
 
 
-def lieutenant_query(api_url, api_token, api_endpoint, api_id, params={}, timeout=5):
+def lieutenant_query(
+    api_url,
+    api_token,
+    api_endpoint,
+    api_id,
+    params={},
+    timeout=5,
+    session=None,
+    cache=None,
+):
     return _lieutenant_request(
-        RequestMethod.GET, api_url, api_token, api_endpoint, api_id, params, timeout
+        RequestMethod.GET,
+        api_url,
+        api_token,
+        api_endpoint,
+        api_id,
+        params,
+        timeout,
+        session=session,
+        cache=cache,
     )
 
 
 def lieutenant_post(
-    api_url, api_token, api_endpoint, api_id, post_data, params={}, timeout=5
+    api_url,
+    api_token,
+    api_endpoint,
+    api_id,
+    post_data,
+    params={},
+    timeout=5,
+    session=None,
 ):
     return _lieutenant_request(
         RequestMethod.POST,
@@ -204,6 +268,7 @@ def lieutenant_post(
         api_id,
         params,
         timeout,
+        session=session,
         post_data=post_data,
     )
 
@@ -229,6 +294,32 @@ def clean_working_tree(config: Config):
     rmtree(config.catalog_dir, ignore_errors=True)
 
 
+class PrerenderedInventory(ReclassRsInventory):
+    """Kapitan inventory backend which uses the inventory that Commodore has
+    already rendered with `kapitan_inventory()`.
+
+    Falls back to rendering the inventory with reclass-rs if any target which
+    Kapitan discovers is missing from the provided inventory."""
+
+    def __init__(self, nodes: dict, **kwargs):
+        self._nodes = nodes
+        super().__init__(**kwargs)
+
+    def render_targets(self, targets=None, ignore_class_not_found: bool = False):
+        if any(name not in self._nodes for name in self.targets):
+            super().render_targets(targets, ignore_class_not_found)
+        else:
+            for name, target in self.targets.items():
+                node = self._nodes[name]
+                target.parameters = node["parameters"]
+                target.classes = node["classes"]
+                target.applications = node["applications"]
+                target.exports = node["exports"]
+        # Kapitan ships the inventory object to each compile worker, don't send the
+        # rendered inventory twice.
+        self._nodes = {}
+
+
 # pylint: disable=too-many-arguments
 def kapitan_compile(
     config: Config,
@@ -237,7 +328,23 @@ def kapitan_compile(
     search_paths=None,
     fake_refs=False,
     reveal=False,
+    inventory: Optional[dict] = None,
+    on_compiled: Optional[Callable[[str], None]] = None,
 ):
+    """Compile `targets` with Kapitan.
+
+    If the rendered `inventory` is provided, Kapitan uses it instead of rendering
+    the inventory again. Additionally, if a Kapitan dependency cache is configured,
+    the targets' Kapitan dependencies are fetched through the cache instead of by
+    Kapitan.
+
+    Targets are submitted to Kapitan longest-first, according to the compile
+    durations recorded in `config.target_timings` by previous compilations. The
+    durations of this compilation are recorded in `config.target_timings`.
+
+    If `on_compiled` is provided, it's called with the name of each target as soon
+    as the target's compiled output is available, while Kapitan continues to
+    compile the remaining targets."""
     if not output_dir:
         output_dir = config.work_dir
 
@@ -255,7 +362,31 @@ def kapitan_compile(
     if config.processes == 0:
         processes = cpu_count()
 
+    fetch_dependencies = config.fetch_dependencies
+    if fetch_dependencies and config.kapitan_dependency_cache and inventory is not None:
+        click.secho("Fetching Kapitan dependencies...", bold=True)
+        fetch_dependencies = not config.kapitan_dependency_cache.fetch_dependencies(
+            kapitan_dependencies(inventory, targets), P(output_dir), processes or 1
+        )
+
     click.secho("Compiling catalog...", bold=True)
+    timings = config.target_timings
+    targets = timings.schedule(targets)
+    worker_plan = WorkerPlan(processes or 1)
+    if config.worker_memory:
+        worker_plan = plan_workers(
+            config.worker_memory,
+            timings.peak_rss(),
+            targets,
+            processes or cpu_count(fallback=1),
+        )
+        processes = worker_plan.processes
+        click.echo(f" > Using {processes} compile workers")
+        if worker_plan.heavy_targets:
+            click.echo(
+                f" > Compiling at most {worker_plan.heavy_slots} of the targets "
+                + f"{', '.join(worker_plan.heavy_targets)} concurrently"
+            )
     # workaround the non-modifiable Namespace() default value for cached.args
     cached.args.inventory_backend = "reclass-rs"
     cached.args.inventory_path = str(config.inventory.inventory_dir)
@@ -272,23 +403,45 @@ def kapitan_compile(
     cached.args.reveal = reveal
     cached.args.cache = False
     cached.args.cache_paths = None
-    cached.args.fetch = config.fetch_dependencies
+    cached.args.fetch = fetch_dependencies
     # We always want to force-fetch when we want to fetch dependencies
     # XXX(sg): We need to set `force` because otherwise `compile_targets()` raises an exception
     # becaues the field is missing, but we can't set it to true, because otherwise
     # `compile_targets()` emits a deprecation warning.
     cached.args.force = False
-    cached.args.force_fetch = config.fetch_dependencies
+    cached.args.force_fetch = fetch_dependencies
     cached.args.validate = False
     cached.args.schemas_path = config.work_dir / "schemas"
     cached.args.jinja2_filters = defaults.DEFAULT_JINJA2_FILTERS_PATH
     cached.args.use_go_jsonnet = True
-    kapitan_targets.compile_targets(
-        inventory_path=cached.args.inventory_path,
-        search_paths=search_paths,
-        ref_controller=refController,
-        args=cached.args,
-    )
+    if (
+        inventory is not None
+        and not (config.inventory.inventory_dir / "reclass-config.yml").exists()
+    ):
+        cached.inv = PrerenderedInventory(
+            inventory, inventory_path=cached.args.inventory_path
+        )
+        cached.global_inv = cached.inv.inventory
+    with (
+        config.helm_template_cache.enabled()
+        if config.helm_template_cache
+        else contextlib.nullcontext()
+    ), timings.recording(), worker_plan.admission_control():
+        if on_compiled:
+            kapitan_pipeline.compile_targets(
+                inventory_path=cached.args.inventory_path,
+                search_paths=search_paths,
+                ref_controller=refController,
+                args=cached.args,
+                on_compiled=on_compiled,
+            )
+        else:
+            kapitan_targets.compile_targets(
+                inventory_path=cached.args.inventory_path,
+                search_paths=search_paths,
+                ref_controller=refController,
+                args=cached.args,
+            )
 
 
 def kapitan_inventory(
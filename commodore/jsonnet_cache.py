@@ -0,0 +1,415 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess  # nosec
+import tempfile
+
+from pathlib import Path
+from typing import Any, Optional
+
+import click
+
+from url_normalize.tools import deconstruct_url
+
+from commodore.normalize_url import normalize_git_url
+
+PACKAGES_DIR = "packages"
+RESOLUTIONS_DIR = "resolutions"
+
+_COMMIT_SHA = re.compile(r"^(?:[0-9a-f]{40}|[0-9a-f]{64})$")
+
+
+class JsonnetBundlerCache:
+    """Shared cache for packages installed by jsonnet-bundler.
+
+    Packages are stored in `packages/<key>`, where the key is computed from the
+    package's source and resolved version as recorded in `jsonnetfile.lock.json`.
+    The package's lock file entry and the legacy import symlinks which
+    jsonnet-bundler created for the package are stored in `packages/<key>.json`.
+    This allows us to create `vendor/` from the stored packages without running
+    jsonnet-bundler, if we can resolve the versions of all dependencies to commits
+    which are already stored, cf. `link()`.
+
+    Additionally, the cache stores the result of each jsonnet-bundler run in
+    `resolutions/<digest>.json`, where the digest is computed from the
+    `jsonnetfile.json` files which were used as inputs for the run. A recorded result
+    consists of the lock file, the package keys for all installed packages, and the
+    symlinks created by jsonnet-bundler in `vendor/`. This allows us to create
+    `vendor/` without resolving any versions if the inputs are unchanged. Results
+    are only recorded if all remote dependencies, including the dependencies of
+    remote packages, are pinned to a commit SHA, since jsonnet-bundler resolves
+    branches and tags to their latest commit on each run.
+
+    All writes to the cache are atomic, so the cache can be shared by concurrent
+    compilations.
+    """
+
+    _dir: Path
+
+    def __init__(self, directory: Path):
+        self._dir = directory.expanduser().resolve()
+
+    @property
+    def directory(self) -> Path:
+        return self._dir
+
+    def package_dir(self, key: str) -> Path:
+        return self._dir / PACKAGES_DIR / key
+
+    def _package_meta_file(self, key: str) -> Path:
+        return self._dir / PACKAGES_DIR / f"{key}.json"
+
+    def _resolution_file(self, digest: str) -> Path:
+        return self._dir / RESOLUTIONS_DIR / f"{digest}.json"
+
+    def restore(self, cwd: Path, digest: str) -> bool:
+        """Create `vendor/` and `jsonnetfile.lock.json` in `cwd` from the recorded
+        result for `digest`.
+
+        Returns `False` without modifying `cwd` if there's no recorded result, or if
+        any of the result's packages are missing from the cache."""
+        try:
+            with open(self._resolution_file(digest), "r", encoding="utf-8") as f:
+                resolution = json.load(f)
+            packages: dict[str, str] = resolution["packages"]
+            symlinks: dict[str, str] = resolution["symlinks"]
+            lock = resolution["lock"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+            return False
+        if not all(self.package_dir(key).is_dir() for key in packages.values()):
+            return False
+
+        self._create_vendor(cwd, packages, symlinks, lock)
+        return True
+
+    def link(self, cwd: Path, jsonnetfile: Path) -> bool:
+        """Create `vendor/` and `jsonnetfile.lock.json` in `cwd` from the stored
+        packages for the dependencies in `jsonnetfile`.
+
+        The versions of all remote dependencies, including the dependencies of
+        remote packages, are resolved to commits with `git ls-remote`. Returns
+        `False` without modifying `cwd` if any version can't be resolved, if any
+        resolved package is missing from the cache, or if the dependencies can't be
+        installed in the same way as jsonnet-bundler would install them."""
+        try:
+            with open(jsonnetfile, "rb") as f:
+                content = f.read()
+            legacy_imports = json.loads(content).get("legacyImports", True)
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+            return False
+
+        vendor_dir = cwd / "vendor"
+        lock_deps: list[dict[str, Any]] = []
+        symlinks: dict[str, str] = {}
+        remote: list[dict[str, Any]] = []
+        for dep in _dependencies(content):
+            local = dep.get("source", {}).get("local", {}).get("directory")
+            if local is None:
+                remote.append(dep)
+                continue
+            dep_dir = jsonnetfile.parent / local
+            lock_deps.append(dep)
+            symlinks[os.path.basename(os.path.normpath(local))] = os.path.relpath(
+                dep_dir, start=vendor_dir
+            )
+            # Local dependencies of local dependencies are left to jsonnet-bundler
+            local_deps = _local_dependencies(dep_dir / "jsonnetfile.json")
+            if local_deps is None or local_deps:
+                return False
+            remote += _dependencies(_read_bytes(dep_dir / "jsonnetfile.json"))
+
+        packages: dict[str, str] = {}
+        resolved: dict[tuple[str, str], Optional[str]] = {}
+        while remote:
+            dep = remote.pop(0)
+            source = dep.get("source", {})
+            name = package_name(source)
+            git = source.get("git", {})
+            ref = dep.get("version") or ""
+            if not name or not ref:
+                return False
+            if (git["remote"], ref) not in resolved:
+                resolved[(git["remote"], ref)] = _resolve_version(git["remote"], ref)
+            version = resolved[(git["remote"], ref)]
+            if not version:
+                return False
+            key = package_key(source, version)
+            if name in packages:
+                if packages[name] != key:
+                    # Conflicting versions are resolved by jsonnet-bundler
+                    return False
+                continue
+            meta = self._package_meta(key)
+            if meta is None or not self.package_dir(key).is_dir():
+                return False
+            local_deps = _local_dependencies(self.package_dir(key) / "jsonnetfile.json")
+            if local_deps is None or local_deps:
+                return False
+            packages[name] = key
+            lock_deps.append(meta["lock"])
+            symlinks.update(meta["symlinks"])
+            remote += _dependencies(
+                _read_bytes(self.package_dir(key) / "jsonnetfile.json")
+            )
+
+        lock = {
+            "version": 1,
+            "dependencies": lock_deps,
+            "legacyImports": legacy_imports,
+        }
+        self._create_vendor(cwd, packages, symlinks, lock)
+        return True
+
+    def _package_meta(self, key: str) -> Optional[dict[str, Any]]:
+        try:
+            with open(self._package_meta_file(key), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if isinstance(meta["lock"], dict) and isinstance(meta["symlinks"], dict):
+                return meta
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError):
+            pass
+        return None
+
+    def _create_vendor(
+        self,
+        cwd: Path,
+        packages: dict[str, str],
+        symlinks: dict[str, str],
+        lock: dict[str, Any],
+    ):
+        vendor_dir = cwd / "vendor"
+        if vendor_dir.is_symlink():
+            vendor_dir.unlink()
+        elif vendor_dir.exists():
+            shutil.rmtree(vendor_dir)
+        vendor_dir.mkdir()
+        for name, key in packages.items():
+            (vendor_dir / name).parent.mkdir(parents=True, exist_ok=True)
+            os.symlink(self.package_dir(key), vendor_dir / name)
+        for name, target in symlinks.items():
+            os.symlink(target, vendor_dir / name)
+        _write_json_atomic(cwd / "jsonnetfile.lock.json", lock)
+
+    def unlink_packages(self, cwd: Path):
+        """Remove all symlinks to cached packages from `cwd/vendor`.
+
+        This ensures that tools which modify `vendor/` can't modify the cache through
+        the symlinks created by `restore()`."""
+        vendor_dir = cwd / "vendor"
+        if not vendor_dir.is_dir():
+            return
+        for root, dirs, files in os.walk(vendor_dir):
+            for name in dirs + files:
+                p = Path(root) / name
+                if p.is_symlink() and p.resolve().is_relative_to(self._dir):
+                    p.unlink()
+
+    def store(self, cwd: Path, digest: Optional[str]):
+        """Store all packages installed in `cwd/vendor` and record the result of the
+        jsonnet-bundler run in `cwd` for `digest`.
+
+        Packages are always stored. The result is only recorded if `digest` is
+        given, if all locked packages can be found in `vendor/`, and if no package
+        has a remote dependency which isn't pinned to a commit SHA."""
+        vendor_dir = cwd / "vendor"
+        try:
+            with open(cwd / "jsonnetfile.lock.json", "r", encoding="utf-8") as f:
+                lock = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+
+        vendor_symlinks = {
+            e.name: os.readlink(e)
+            for e in sorted(vendor_dir.iterdir())
+            if e.is_symlink()
+        }
+        packages: dict[str, str] = {}
+        reason = None
+        for dep in lock.get("dependencies") or []:
+            source = dep.get("source", {})
+            if "local" in source:
+                continue
+            name = package_name(source)
+            pkg_dir = vendor_dir / name if name else None
+            if not pkg_dir or pkg_dir.is_symlink() or not pkg_dir.is_dir():
+                reason = f"package {name} not found in vendor/"
+                continue
+            if not _pinned_dependencies(pkg_dir / "jsonnetfile.json"):
+                reason = (
+                    f"package {name} has dependencies which aren't pinned "
+                    + "to a commit SHA"
+                )
+            key = package_key(source, dep.get("version", ""))
+            legacy = {n: t for n, t in vendor_symlinks.items() if t == name}
+            self._store_package(pkg_dir, key, dep, legacy)
+            packages[name] = key
+
+        if digest is None:
+            return
+        if reason:
+            click.secho(f" > Not caching jsonnet-bundler result, {reason}", fg="yellow")
+            return
+        symlinks = {n: t for n, t in vendor_symlinks.items() if n not in packages}
+        _write_json_atomic(
+            self._resolution_file(digest),
+            {"lock": lock, "packages": packages, "symlinks": symlinks},
+        )
+
+    def _store_package(
+        self,
+        pkg_dir: Path,
+        key: str,
+        lock_dep: dict[str, Any],
+        symlinks: dict[str, str],
+    ):
+        target = self.package_dir(key)
+        if not self._package_meta_file(key).is_file():
+            _write_json_atomic(
+                self._package_meta_file(key), {"lock": lock_dep, "symlinks": symlinks}
+            )
+        if target.is_dir():
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmpdir = Path(tempfile.mkdtemp(dir=target.parent, prefix=f".{key}-"))
+        try:
+            shutil.copytree(pkg_dir, tmpdir / "pkg", symlinks=True)
+            os.rename(tmpdir / "pkg", target)
+        except OSError:
+            # Another process has stored the package concurrently
+            if not target.is_dir():
+                raise
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def package_name(source: dict[str, Any]) -> Optional[str]:
+    """Compute the path of a Git package in `vendor/` in the same way as
+    jsonnet-bundler does."""
+    git = source.get("git")
+    if not git or not git.get("remote"):
+        return None
+    url_parts = deconstruct_url(normalize_git_url(git["remote"]))
+    path = url_parts.path.strip("/").removesuffix(".git")
+    parts = [url_parts.host, path, git.get("subdir", "").strip("/")]
+    return "/".join(p for p in parts if p)
+
+
+def package_key(source: dict[str, Any], version: str) -> str:
+    """Compute the cache key for a package from its source and resolved version."""
+    data = json.dumps({"source": source, "version": version}, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def inputs_digest(cwd: Path, jsonnetfile: Path) -> Optional[str]:
+    """Compute digest of all inputs for a jsonnet-bundler run in `cwd`.
+
+    The inputs are `jsonnetfile` and the `jsonnetfile.json` of each local dependency,
+    including local dependencies of local dependencies.
+
+    Returns `None` if any remote dependency isn't pinned to a commit SHA, since
+    jsonnet-bundler would resolve such dependencies to the latest commit of the
+    requested branch or tag, and the result can't be cached."""
+    h = hashlib.sha256()
+    seen: set[Path] = set()
+    pending = [(jsonnetfile, "")]
+    while pending:
+        path, directory = pending.pop()
+        h.update(f"\0{directory}\0".encode("utf-8"))
+        if not path.is_file():
+            continue
+        with open(path, "rb") as f:
+            content = f.read()
+        h.update(content)
+        deps = _dependencies(content)
+        if not all(_is_pinned(d) for d in deps):
+            return None
+        for dep in deps:
+            local = dep.get("source", {}).get("local", {}).get("directory")
+            if not local:
+                continue
+            dep_dir = (path.parent / local).resolve()
+            if dep_dir in seen:
+                continue
+            seen.add(dep_dir)
+            pending.append(
+                (dep_dir / "jsonnetfile.json", os.path.relpath(dep_dir, cwd))
+            )
+    return h.hexdigest()
+
+
+def _dependencies(content: bytes) -> list[dict[str, Any]]:
+    try:
+        deps = json.loads(content).get("dependencies") or []
+    except (json.JSONDecodeError, AttributeError):
+        return []
+    return [d for d in deps if isinstance(d, dict)]
+
+
+def _read_bytes(path: Path) -> bytes:
+    if not path.is_file():
+        return b""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _pinned_dependencies(jsonnetfile: Path) -> bool:
+    return all(_is_pinned(d) for d in _dependencies(_read_bytes(jsonnetfile)))
+
+
+def _local_dependencies(jsonnetfile: Path) -> Optional[list[dict[str, Any]]]:
+    """Return the local dependencies in `jsonnetfile`, or `None` if `jsonnetfile`
+    exists but can't be parsed."""
+    content = _read_bytes(jsonnetfile)
+    if content:
+        try:
+            json.loads(content)
+        except json.JSONDecodeError:
+            return None
+    return [d for d in _dependencies(content) if "local" in d.get("source", {})]
+
+
+def _resolve_version(remote: str, ref: str) -> Optional[str]:
+    """Resolve branch or tag `ref` of Git repository `remote` to a commit SHA in the
+    same way as jsonnet-bundler does."""
+    if _COMMIT_SHA.match(ref):
+        return ref
+    try:
+        res = subprocess.run(  # nosec
+            ["git", "ls-remote", remote, f"refs/tags/{ref}", f"refs/heads/{ref}"],
+            capture_output=True,
+            check=True,
+            text=True,
+            timeout=30,
+        )
+    except (subprocess.SubprocessError, OSError):
+        return None
+    refs = {}
+    for line in res.stdout.splitlines():
+        sha, name = line.split()
+        refs[name] = sha
+    # Prefer the peeled commit for annotated tags
+    for name in [f"refs/tags/{ref}^{{}}", f"refs/tags/{ref}", f"refs/heads/{ref}"]:
+        if name in refs:
+            return refs[name]
+    return None
+
+
+def _is_pinned(dep: dict[str, Any]) -> bool:
+    """Check whether `dep` is a local dependency or a remote dependency whose
+    version is a full commit SHA."""
+    if "local" in dep.get("source", {}):
+        return True
+    return bool(_COMMIT_SHA.match(dep.get("version") or ""))
+
+
+def _write_json_atomic(path: Path, data: Any):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmpf = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmpf, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+        f.write("\n")
+    os.replace(tmpf, path)
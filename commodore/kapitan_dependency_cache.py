@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Optional
+
+import click
+
+from git import Repo
+from kapitan.dependency_manager.base import (  # type: ignore
+    fetch_helm_archive,
+    fetch_http_source,
+)
+from kapitan.utils import unpack_downloaded_file  # type: ignore
+
+ENTRIES_DIR = "entries"
+LOCKS_DIR = "locks"
+
+SUPPORTED_TYPES = {"git", "helm", "http", "https"}
+
+_COMMIT_SHA = re.compile(r"^[0-9a-f]{40}$")
+_VERSION_TAG = re.compile(r"^v?\d+\.\d+\.\d+")
+
+
+class KapitanDependencyCache:
+    """Persistent cache for Kapitan's external dependencies.
+
+    Each dependency is fetched once into `entries/<key>`, where the key is computed
+    from the fields which identify the dependency's content (e.g. the chart
+    repository, name and version of a Helm chart, or the URL and ref of a Git
+    repository). The dependency's output paths are then populated with a copy of
+    the cached entry.
+
+    Entries for pinned dependencies are reused across compilations. Entries for
+    unpinned dependencies are refreshed once per compilation. A dependency is
+    considered unpinned if it's a Helm chart without a version, or if it's a Git
+    repository whose ref isn't a commit SHA or a version tag. Dependencies which set
+    `force_fetch` are left to Kapitan, which always fetches them.
+
+    The cache can be shared by concurrent compilations. New entries are moved into
+    place atomically. Replacing an existing entry and copying an entry to an output
+    path hold an exclusive and a shared lock on the entry's lock file in
+    `locks/<key>` respectively, so that an entry is never replaced while it's
+    being copied.
+    """
+
+    _dir: Path
+
+    def __init__(self, directory: Path):
+        self._dir = directory.expanduser().resolve()
+
+    @contextmanager
+    def _locked(self, key: str, shared: bool) -> Iterator[None]:
+        lock_file = self._dir / LOCKS_DIR / key
+        lock_file.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(lock_file, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+        finally:
+            # Closing the file descriptor releases the lock
+            os.close(fd)
+
+    @property
+    def directory(self) -> Path:
+        return self._dir
+
+    def entry_dir(self, key: str) -> Path:
+        return self._dir / ENTRIES_DIR / key
+
+    def fetch_dependencies(
+        self, dependencies: Iterable[dict[str, Any]], output_dir: Path, parallelism: int
+    ) -> bool:
+        """Fetch `dependencies` into the cache and populate their output paths.
+
+        Returns `False` without fetching anything if any of the dependencies has a
+        type which isn't supported by the cache."""
+        # Kapitan always fetches dependencies which set `force_fetch` itself
+        deps = [d for d in dependencies if not d.get("force_fetch", False)]
+        unsupported = {d.get("type") for d in deps} - SUPPORTED_TYPES
+        if unsupported:
+            click.secho(
+                " > Not using Kapitan dependency cache, unsupported dependency types: "
+                + ", ".join(sorted(str(t) for t in unsupported)),
+                fg="yellow",
+            )
+            return False
+
+        entries: dict[str, dict[str, Any]] = {}
+        for dep in deps:
+            entries.setdefault(dependency_key(dep), dep)
+
+        to_fetch = {
+            key: dep
+            for key, dep in entries.items()
+            if not is_pinned(dep) or not self.entry_dir(key).exists()
+        }
+        click.echo(
+            f" > Fetching {len(to_fetch)} of {len(entries)} Kapitan dependencies"
+        )
+        with ThreadPoolExecutor(max_workers=max(parallelism, 1)) as exe:
+            results = exe.map(self._fetch_one, to_fetch.keys(), to_fetch.values())
+            errors = [e for e in results if e]
+        if errors:
+            raise click.ClickException(
+                "Failed to fetch Kapitan dependencies:\n" + "\n".join(errors)
+            )
+
+        for dep in deps:
+            self._populate(dep, output_dir)
+        return True
+
+    def _fetch_one(self, key: str, dep: dict[str, Any]) -> Optional[str]:
+        target = self.entry_dir(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmpdir = Path(tempfile.mkdtemp(dir=target.parent, prefix=f".{key}-"))
+        try:
+            content = _FETCHERS[dep["type"]](dep, tmpdir)
+            # Replace a stale entry. The lock ensures that concurrent readers don't
+            # copy the entry while it's swapped.
+            with self._locked(key, shared=False):
+                try:
+                    os.rename(target, tmpdir / "stale")
+                except FileNotFoundError:
+                    pass
+                os.rename(content, target)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            return f" > {dep['source']}: {e}"
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        return None
+
+    def _populate(self, dep: dict[str, Any], output_dir: Path):
+        key = dependency_key(dep)
+        src = self.entry_dir(key)
+        dst = Path(os.path.normpath(output_dir / dep["output_path"]))
+        if dst.is_dir() and not dst.is_symlink():
+            shutil.rmtree(dst)
+        elif dst.exists() or dst.is_symlink():
+            dst.unlink()
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        with self._locked(key, shared=True):
+            if dep["type"] in ("http", "https") and not dep.get("unpack", False):
+                shutil.copyfile(src / "file", dst)
+            else:
+                shutil.copytree(src, dst, symlinks=True)
+
+
+def kapitan_dependencies(
+    inventory: dict[str, Any], targets: Iterable[str]
+) -> list[dict[str, Any]]:
+    """Collect the Kapitan dependencies of `targets` from the rendered inventory."""
+    deps: list[dict[str, Any]] = []
+    for target in targets:
+        kapitan = inventory.get(target, {}).get("parameters", {}).get("kapitan", {})
+        deps.extend(kapitan.get("dependencies") or [])
+    return deps
+
+
+def dependency_key(dep: dict[str, Any]) -> str:
+    """Compute the cache key for a dependency from the fields which identify its
+    content."""
+    fields = ["type", "source"]
+    if dep["type"] == "helm":
+        fields += ["chart_name", "version"]
+    elif dep["type"] == "git":
+        fields += ["ref", "subdir", "submodules"]
+    else:
+        fields += ["unpack"]
+    data = json.dumps({f: dep.get(f) for f in fields}, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def is_pinned(dep: dict[str, Any]) -> bool:
+    if dep["type"] == "helm":
+        return bool(dep.get("version"))
+    if dep["type"] == "git":
+        ref = str(dep.get("ref") or "")
+        return bool(_COMMIT_SHA.match(ref) or _VERSION_TAG.match(ref))
+    return True
+
+
+def _fetch_helm(dep: dict[str, Any], tmpdir: Path) -> Path:
+    content = tmpdir / "content"
+    fetch_helm_archive(
+        dep.get("helm_path"),
+        dep["source"],
+        dep["chart_name"],
+        dep.get("version"),
+        str(content),
+    )
+    return content
+
+
+def _fetch_git(dep: dict[str, Any], tmpdir: Path) -> Path:
+    content = tmpdir / "content"
+    repo = Repo.clone_from(dep["source"], content)
+    if dep.get("ref"):
+        repo.git.checkout(dep["ref"])
+    if dep.get("submodules", False):
+        for submodule in repo.submodules:
+            submodule.update(init=True)
+    subdir = dep.get("subdir")
+    if not subdir:
+        return content
+    if not (content / subdir).is_dir():
+        raise ValueError(f"subdir {subdir} not found in repo")
+    return content / subdir
+
+
+def _fetch_http(dep: dict[str, Any], tmpdir: Path) -> Path:
+    content = tmpdir / "content"
+    content.mkdir()
+    (tmpdir / "download").mkdir()
+    download = tmpdir / "download" / os.path.basename(dep["source"])
+    content_type = fetch_http_source(dep["source"], str(download), "Dependency")
+    if not dep.get("unpack", False):
+        os.rename(download, content / "file")
+    elif not unpack_downloaded_file(str(download), str(content), content_type):
+        click.secho(
+            f" > {dep['source']}: Content-Type {content_type} is not supported "
+            + "for unpack",
+            fg="yellow",
+        )
+    return content
+
+
+_FETCHERS = {
+    "git": _fetch_git,
+    "helm": _fetch_helm,
+    "http": _fetch_http,
+    "https": _fetch_http,
+}
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from collections.abc import Callable
+from functools import partial
+from pathlib import Path
+
+import click
+
+import kapitan.targets as kapitan_targets  # type: ignore
+from kapitan import cached  # type: ignore
+from kapitan.dependency_manager.base import fetch_dependencies  # type: ignore
+from kapitan.errors import CompileError  # type: ignore
+from kapitan.resources import get_inventory  # type: ignore
+from kapitan.utils import available_cpu_count  # type: ignore
+
+
+def compile_targets(
+    inventory_path: str,
+    search_paths: list,
+    ref_controller,
+    args,
+    on_compiled: Callable[[str], None],
+):
+    """Compile the targets in `args.targets` with Kapitan, and call `on_compiled`
+    with the target name as soon as the target's output is available in
+    `<args.output_path>/compiled/<target>`.
+
+    This is a variant of Kapitan's `compile_targets()` which doesn't wait for all
+    targets to be compiled before making the output available. `on_compiled` runs
+    in the current process while the compile workers continue with the remaining
+    targets. Kapitan's target labels, compile cache and profiling options aren't
+    supported."""
+    temp_path = tempfile.mkdtemp(suffix=".kapitan")
+    # enable previously compiled items to be referenced in other compile inputs
+    search_paths = search_paths + [temp_path]
+    temp_compile_path = os.path.join(temp_path, "compiled")
+    compile_path = Path(args.output_path) / "compiled"
+
+    try:
+        inventory = get_inventory(inventory_path)
+        fetch = args.fetch or args.force_fetch
+        target_objs = kapitan_targets.load_target_inventory(
+            inventory, args.targets, ignore_class_not_found=fetch
+        )
+        if not target_objs:
+            raise CompileError("Error: no targets found")
+        parallelism = args.parallelism or min(len(target_objs), available_cpu_count())
+
+        fetch_objs = target_objs
+        if not fetch:
+            fetch_objs = [
+                t for t in target_objs if any(d.force_fetch for d in t.dependencies)
+            ]
+        if fetch_objs:
+            with multiprocessing.Pool(parallelism) as fetch_pool:
+                fetch_dependencies(
+                    args.output_path,
+                    fetch_objs,
+                    temp_path,
+                    args.force_fetch or not fetch,
+                    fetch_pool,
+                )
+
+        if len(target_objs) == len(inventory.targets):
+            shutil.rmtree(compile_path, ignore_errors=True)
+
+        cached.input_cache_metrics = None
+        with multiprocessing.Pool(
+            parallelism,
+            initializer=kapitan_targets._pool_init,
+            initargs=(cached.as_dict(), None),
+        ) as pool:
+            compile_start = time.time()
+            worker = partial(
+                _compile_target,
+                compile_target=kapitan_targets.compile_target,
+                search_paths=search_paths,
+                compile_path=temp_compile_path,
+                ref_controller=ref_controller,
+                args=args,
+            )
+            for target, target_path in pool.imap_unordered(worker, target_objs):
+                output = compile_path / target_path
+                shutil.rmtree(output, ignore_errors=True)
+                shutil.copytree(Path(temp_compile_path, target_path), output)
+                on_compiled(target)
+            click.echo(
+                f" > Compiled {len(target_objs)} targets in "
+                + f"{time.time() - compile_start:.2f}s"
+            )
+    finally:
+        shutil.rmtree(temp_path)
+
+
+def _compile_target(target_config, compile_target, **kwargs) -> tuple[str, str]:
+    compile_target(target_config, **kwargs)
+    return target_config.vars.target, target_config.target_full_path
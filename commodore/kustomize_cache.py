@@ -0,0 +1,282 @@
+"""Cache for the output of `kustomize build` in the Kustomize wrapper script.
+
+The wrapper script `scripts/run-kustomize` hands over to this module with
+
+    python -m commodore.kustomize_cache <CACHE_DIR> <KUSTOMIZE> <INPUT_DIR> \\
+        <OUTPUT_DIR> [kustomize args...]
+
+if environment variable `COMMODORE_KUSTOMIZE_CACHE` is set.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+import yaml
+
+from commodore import __kustomize_wrapper__
+
+ENTRIES_DIR = "entries"
+
+KUSTOMIZATION_FILES = ["kustomization.yaml", "kustomization.yml", "Kustomization"]
+
+_COMMIT_SHA = re.compile(r"^[0-9a-f]{40}$")
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    path: Path
+    size: int
+    last_used: float
+
+
+class KustomizeCache:
+    """Shared cache for the output of `kustomize build`.
+
+    Each build output is stored in `entries/<key>`, where the key is computed from
+    the contents of the kustomization input directory, the commit SHAs of all remote
+    bases and components referenced by the kustomization, the `kustomize build`
+    arguments and the Kustomize version. The modification time of each entry
+    records when it was last used.
+
+    All writes to the cache are atomic, so the cache can be shared by concurrent
+    compilations.
+    """
+
+    _dir: Path
+
+    def __init__(self, directory: Path):
+        self._dir = directory.expanduser().resolve()
+
+    @property
+    def directory(self) -> Path:
+        return self._dir
+
+    def entry_dir(self, key: str) -> Path:
+        return self._dir / ENTRIES_DIR / key
+
+    def wrapper(self) -> Path:
+        """Write a Kustomize wrapper script which enables the cache for
+        `scripts/run-kustomize`, and return its path.
+
+        Kapitan doesn't pass the environment to external input types, so the
+        cache location is baked into the generated script."""
+        wrapper = self._dir / "bin" / "run-kustomize"
+        content = "\n".join(
+            [
+                "#!/bin/sh",
+                f"export COMMODORE_KUSTOMIZE_CACHE='{self._dir}'",
+                f"export COMMODORE_PYTHON='{sys.executable}'",
+                f"exec '{__kustomize_wrapper__}' \"$@\"",
+                "",
+            ]
+        )
+        if wrapper.is_file() and wrapper.read_text(encoding="utf-8") == content:
+            return wrapper
+        wrapper.parent.mkdir(parents=True, exist_ok=True)
+        tmpf = wrapper.with_name(f".{wrapper.name}.{os.getpid()}.tmp")
+        tmpf.write_text(content, encoding="utf-8")
+        tmpf.chmod(0o755)
+        os.replace(tmpf, wrapper)
+        return wrapper
+
+    def restore(self, key: str, output_dir: Path) -> bool:
+        entry = self.entry_dir(key)
+        if not entry.is_dir():
+            return False
+        shutil.copytree(entry, output_dir, symlinks=True, dirs_exist_ok=True)
+        os.utime(entry)
+        return True
+
+    def store(self, key: str, output_dir: Path):
+        target = self.entry_dir(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmpdir = Path(tempfile.mkdtemp(dir=target.parent, prefix=f".{key}-"))
+        try:
+            shutil.copytree(output_dir, tmpdir / "output", symlinks=True)
+            os.rename(tmpdir / "output", target)
+        except OSError:
+            # Another process has stored the entry concurrently
+            if not target.is_dir():
+                raise
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def entries(self) -> list[CacheEntry]:
+        entries_dir = self._dir / ENTRIES_DIR
+        if not entries_dir.is_dir():
+            return []
+        entries = []
+        for e in entries_dir.iterdir():
+            if e.name.startswith(".") or not e.is_dir():
+                continue
+            size = sum(
+                f.stat().st_size
+                for f in e.rglob("*")
+                if f.is_file() and not f.is_symlink()
+            )
+            entries.append(CacheEntry(e.name, e, size, e.stat().st_mtime))
+        return sorted(entries, key=lambda e: e.last_used)
+
+    def prune(self, max_age: float) -> list[CacheEntry]:
+        """Remove all entries which haven't been used in the last `max_age` seconds.
+
+        Returns the removed entries."""
+        cutoff = time.time() - max_age
+        pruned = [e for e in self.entries() if e.last_used < cutoff]
+        for e in pruned:
+            shutil.rmtree(e.path)
+        return pruned
+
+
+def remote_refs(input_dir: Path) -> Optional[dict[str, str]]:
+    """Resolve the refs of all remote resources, bases and components of the
+    kustomization in `input_dir` to commit SHAs.
+
+    Kustomizations in local subdirectories of `input_dir` are processed
+    recursively. Returns `None` if any of the remote references can't be resolved,
+    if the kustomization references local paths outside `input_dir`, or if it
+    references anything which is neither a local path nor a recognized remote
+    URL."""
+    refs: dict[str, str] = {}
+    if not _collect_remote_refs(input_dir.resolve(), input_dir.resolve(), refs):
+        return None
+    return refs
+
+
+def _collect_remote_refs(
+    kustomization_dir: Path, root: Path, refs: dict[str, str]
+) -> bool:
+    kustomization: dict = {}
+    for name in KUSTOMIZATION_FILES:
+        if (kustomization_dir / name).is_file():
+            with open(kustomization_dir / name, "r", encoding="utf-8") as f:
+                kustomization = yaml.safe_load(f) or {}
+            break
+
+    for field in ["resources", "bases", "components"]:
+        for res in kustomization.get(field) or []:
+            if not isinstance(res, str):
+                continue
+            if not _is_remote(res):
+                local = (kustomization_dir / res).resolve()
+                if not local.exists():
+                    # Kustomize treats resources which aren't local paths as remote,
+                    # e.g. `gitlab.com/org/repo//path?ref=main`. We can't tell
+                    # which ref such resources resolve to.
+                    return False
+                if not local.is_relative_to(root):
+                    return False
+                if local.is_dir() and not _collect_remote_refs(local, root, refs):
+                    return False
+                continue
+            sha = _resolve_remote(res)
+            if not sha:
+                return False
+            refs[res] = sha
+    return True
+
+
+def _is_remote(resource: str) -> bool:
+    return (
+        "://" in resource
+        or resource.startswith("git@")
+        or resource.startswith("github.com/")
+    )
+
+
+def _resolve_remote(resource: str) -> Optional[str]:
+    url, _, query = resource.partition("?")
+    params = parse_qs(query)
+    ref = (params.get("ref") or params.get("version") or ["HEAD"])[0]
+    if _COMMIT_SHA.match(ref):
+        return ref
+
+    if url.startswith("github.com/"):
+        url = f"https://{url}"
+    if "://" in url:
+        parts = urlsplit(url)
+        path, _, _ = parts.path.partition("//")
+        if ".git/" in path:
+            path = path[: path.index(".git/") + 4]
+        elif path == parts.path and parts.netloc == "github.com":
+            path = "/".join(path.split("/")[:3])
+        repo = f"{parts.scheme}://{parts.netloc}{path}"
+    else:
+        repo, _, _ = url.partition("//")
+        if ".git/" in repo:
+            repo = repo[: repo.index(".git/") + 4]
+
+    try:
+        res = subprocess.run(
+            ["git", "ls-remote", repo, ref],
+            capture_output=True,
+            check=True,
+            text=True,
+            timeout=30,
+        )
+    except (subprocess.SubprocessError, OSError):
+        return None
+    # Prefer the peeled commit for annotated tags
+    lines = sorted(res.stdout.splitlines(), key=lambda line: not line.endswith("^{}"))
+    if not lines:
+        return None
+    return lines[0].split()[0]
+
+
+def cache_key(
+    kustomize: str, input_dir: Path, args: list[str], refs: dict[str, str]
+) -> str:
+    """Compute the cache key for a `kustomize build` run.
+
+    The output directory isn't part of the key, since Kapitan compiles each target
+    in a temporary directory."""
+    h = hashlib.sha256()
+    for f in sorted(p for p in input_dir.rglob("*") if p.is_file()):
+        h.update(f"\0{f.relative_to(input_dir)}\0".encode("utf-8"))
+        h.update(f.read_bytes())
+    for resource, sha in sorted(refs.items()):
+        h.update(f"\0{resource}={sha}".encode("utf-8"))
+    h.update(b"\0args\0")
+    h.update("\0".join(args).encode("utf-8"))
+    version = subprocess.run(
+        [kustomize, "version"], capture_output=True, check=False, text=True
+    )
+    h.update(b"\0version\0")
+    h.update(version.stdout.encode("utf-8"))
+    return h.hexdigest()
+
+
+def main(argv: list[str]) -> int:
+    cache_dir, kustomize, input_dir, output_dir, *args = argv
+    cache = KustomizeCache(Path(cache_dir))
+    refs = remote_refs(Path(input_dir))
+    key = None
+    if refs is not None:
+        key = cache_key(kustomize, Path(input_dir), args, refs)
+        if cache.restore(key, Path(output_dir)):
+            return 0
+
+    res = subprocess.run(
+        [kustomize, "build", input_dir, "-o", output_dir] + args, check=False
+    )
+    if res.returncode == 0 and key:
+        cache.store(key, Path(output_dir))
+    return res.returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,156 @@
+"""Response cache for GET requests to the Lieutenant API"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, Optional
+
+import requests
+
+ENTRIES_DIR = "entries"
+
+# Lifetime of cached responses for which the API doesn't provide an `ETag` or
+# `Last-Modified` header.
+DEFAULT_TTL = 60
+
+
+class LieutenantCache:
+    """Cache for responses of Lieutenant API GET requests.
+
+    Responses are kept in memory for the lifetime of the cache, so that each API
+    object is only fetched once, for example when compiling multiple clusters of
+    the same tenant.
+
+    If a cache directory is given, responses are additionally stored on disk and
+    reused by subsequent invocations. Responses with an `ETag` or `Last-Modified`
+    header are always revalidated with a conditional request. Responses without
+    validators are reused without a request for `ttl` seconds. Cached responses
+    are only reused without a request for the API token which fetched them. All
+    writes to the cache are atomic, so the cache can be shared by concurrent
+    invocations of the same user.
+    """
+
+    _dir: Optional[Path]
+    _ttl: float
+    _responses: dict[str, Any]
+
+    def __init__(self, directory: Optional[Path] = None, ttl: float = DEFAULT_TTL):
+        self._dir = directory.expanduser().resolve() if directory else None
+        self._ttl = ttl
+        self._responses = {}
+
+    @property
+    def directory(self) -> Optional[Path]:
+        return self._dir
+
+    def add(self, url: str, params: dict[str, str], api_token: str, body: Any):
+        """Add `body` as the response for `url` with query parameters `params` to
+        the in-memory cache, for example when the object was returned by a list
+        request."""
+        self._responses[self._key(url, params, api_token)] = _copy(body)
+
+    def fetch(
+        self,
+        url: str,
+        params: dict[str, str],
+        api_token: str,
+        get: Callable[[dict[str, str]], requests.Response],
+        handle_response: Callable[[requests.Response], Any],
+    ) -> Any:
+        """Return the parsed response for `url` with query parameters `params`.
+
+        `get` is called with additional request headers to fetch the response if
+        the response isn't cached or needs to be revalidated. `handle_response`
+        parses the response, and is expected to raise an exception for error
+        responses, which aren't cached."""
+        token = _hash(api_token or "")
+        key = self._key(url, params, api_token)
+        if key in self._responses:
+            return _copy(self._responses[key])
+
+        entry = self._load(url, params)
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            if (
+                not headers
+                and entry["token"] == token
+                and time.time() - entry["fetched"] < self._ttl
+            ):
+                self._responses[key] = entry["body"]
+                return _copy(entry["body"])
+
+        r = get(headers)
+        if r.status_code == 304 and entry:
+            body = entry["body"]
+        else:
+            body = handle_response(r)
+        self._responses[key] = body
+        self._store(
+            url,
+            params,
+            {
+                "url": url,
+                "params": params,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "token": token,
+                "fetched": time.time(),
+                "body": body,
+            },
+        )
+        return _copy(body)
+
+    def _key(self, url: str, params: dict[str, str], api_token: str) -> str:
+        return _hash(json.dumps([url, sorted(params.items()), _hash(api_token or "")]))
+
+    def _entry_file(self, url: str, params: dict[str, str]) -> Optional[Path]:
+        if not self._dir:
+            return None
+        key = _hash(json.dumps([url, sorted(params.items())]))
+        return self._dir / ENTRIES_DIR / f"{key}.json"
+
+    def _load(self, url: str, params: dict[str, str]) -> Optional[dict[str, Any]]:
+        entry_file = self._entry_file(url, params)
+        if not entry_file or not entry_file.is_file():
+            return None
+        try:
+            with open(entry_file, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get("url") != url:
+            return None
+        return entry
+
+    def _store(self, url: str, params: dict[str, str], entry: dict[str, Any]):
+        entry_file = self._entry_file(url, params)
+        if not entry_file:
+            return
+        entry_file.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        fd, tmpf = tempfile.mkstemp(dir=entry_file.parent, prefix=".entry-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmpf, entry_file)
+        except OSError:
+            Path(tmpf).unlink(missing_ok=True)
+
+
+def _copy(body: Any) -> Any:
+    # Callers may modify the returned objects
+    return json.loads(json.dumps(body))
+
+
+def _hash(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
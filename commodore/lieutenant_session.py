@@ -0,0 +1,67 @@
+"""Pooled HTTP sessions for requests to the Lieutenant API"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Optional
+
+import click
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+
+# Status codes which indicate a transient error of the API or a proxy in front of
+# it.
+RETRY_STATUS = [500, 502, 503, 504]
+
+_default_session: Optional[requests.Session] = None
+
+
+def new_session(
+    retries: int = DEFAULT_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    log_timing: Callable[[], bool] = lambda: False,
+) -> requests.Session:
+    """Create a session which keeps connections to the API alive, and retries
+    idempotent requests which fail with a connection error or a transient 5xx
+    status.
+
+    The delay before the n-th retry is `backoff_factor * 2^(n-1)` seconds, unless
+    the API sends a `Retry-After` header. POST requests are never retried.
+
+    If `log_timing()` returns true when a response is received, the request's
+    method, URL, status and duration are printed."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    def _log_timing(r: requests.Response, *_args, **_kwargs):
+        if log_timing():
+            click.echo(
+                f" > {r.request.method} {r.url}: {r.status_code} "
+                + f"in {r.elapsed.total_seconds():.3f}s"
+            )
+
+    session.hooks["response"].append(_log_timing)
+    return session
+
+
+def default_session() -> requests.Session:
+    """Return the session which is used for Lieutenant requests that don't specify
+    a session."""
+    global _default_session  # pylint: disable=global-statement
+    if _default_session is None:
+        _default_session = new_session()
+    return _default_session
@@ -31,7 +31,14 @@ class OIDCError(Exception):
 
 
 class OIDCCallbackServer:
-    done_queue: Queue = Queue()
+    """Local HTTP server which receives the OIDC authorization code callback.
+
+    The server socket is bound and listening when the object is constructed. Use
+    port 0 to let the OS select a free port, and `redirect_url` to get the
+    callback URL of the server."""
+
+    done_queue: Queue
+    ready: threading.Event
     thread: threading.Thread
     server: HTTPServer
 
@@ -46,6 +53,8 @@ class OIDCCallbackServer:
         self.client = client
         self.token_endpoint = token_url
         self.lieutenant_url = lieutenant_url
+        self.done_queue = Queue()
+        self.ready = threading.Event()
 
         handler = partial(
             OIDCCallbackHandler,
@@ -57,16 +66,33 @@ class OIDCCallbackServer:
         )
 
         self.server = HTTPServer(("", port), handler)
-        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread = threading.Thread(target=self._serve)
         self.thread.daemon = True
 
+    @property
+    def port(self) -> int:
+        return self.server.server_port
+
+    @property
+    def redirect_url(self) -> str:
+        return f"http://localhost:{self.port}"
+
+    def _serve(self):
+        self.ready.set()
+        self.server.serve_forever()
+
     def start(self):
+        """Start serving requests in a background thread, and wait until the thread
+        is running. Connections which arrive before that are queued by the
+        listening socket."""
         self.thread.start()
+        self.ready.wait()
 
     def join(self):
         self.done_queue.get()
         self.server.shutdown()
         self.thread.join()
+        self.server.server_close()
 
 
 class OIDCCallbackHandler(BaseHTTPRequestHandler):
@@ -74,7 +100,6 @@ class OIDCCallbackHandler(BaseHTTPRequestHandler):
     done: Queue
 
     token_url: str
-    redirect_url: str
 
     lieutenant_url: Optional[str]
 
@@ -94,7 +119,6 @@ class OIDCCallbackHandler(BaseHTTPRequestHandler):
         self.done = done_queue
         self.lieutenant_url = lieutenant_url
         self.token_url = token_url
-        self.redirect_url = "http://localhost:18000"
         self.request_timeout = request_timeout
         super().__init__(*args, **kwargs)
 
@@ -140,6 +164,12 @@ class OIDCCallbackHandler(BaseHTTPRequestHandler):
         self.close(200, success_page)
         return
 
+    @property
+    def redirect_url(self) -> str:
+        # The redirect URL must match the URL of the authorization request, which
+        # uses the port the server is actually listening on.
+        return f"http://localhost:{self.server.server_port}"
+
     def get_oidc_tokens(self, code) -> dict[str, Any]:
         token_url, headers, body = self.client.prepare_token_request(
             self.token_url,
@@ -279,6 +309,17 @@ def login(config: Config):
         # Short-circuit if we have a valid API token
         return
 
+    # Only one Commodore process refreshes the token or runs the login flow at a
+    # time. Concurrent processes wait for the lock and then pick up the new token
+    # from the token cache.
+    with tokencache.locked():
+        if config.api_token:
+            # Another process has logged in while we were waiting for the lock
+            return
+        _login(config)
+
+
+def _login(config: Config):
     client = WebApplicationClient(config.oidc_client)
     idp_cfg = get_idp_cfg(config.oidc_discovery_url, config.request_timeout)
     if refresh_tokens(config, client, idp_cfg["token_endpoint"]):
@@ -288,24 +329,17 @@ def login(config: Config):
     # Request new token through login flow if we weren't able to refresh the existing
     # token.
     server = OIDCCallbackServer(
-        client, idp_cfg["token_endpoint"], config.api_url, config.request_timeout
+        client,
+        idp_cfg["token_endpoint"],
+        config.api_url,
+        config.request_timeout,
+        port=config.oidc_callback_port,
     )
     server.start()
 
-    # Wait for server to run
-    r = requests.Response()
-    r.status_code = 500
-    while r.status_code != 200:
-        try:
-            r = requests.get(
-                "http://localhost:18000/healthz", timeout=config.request_timeout
-            )
-        except ConnectionError:
-            pass
-
     request_uri = client.prepare_request_uri(
         idp_cfg["authorization_endpoint"],
-        redirect_uri="http://localhost:18000",
+        redirect_uri=server.redirect_url,
         scope=["openid", "email", "profile"],
     )
     opened = webbrowser.open(request_uri)
@@ -318,6 +352,31 @@ def login(config: Config):
     server.join()
 
 
+def refresh_token(config: Config) -> bool:
+    """Refresh an expired API token without user interaction, if the token cache
+    has a valid refresh token.
+
+    Returns `True` if a valid API token is available afterwards."""
+    if config.api_token:
+        return True
+    config.discover_oidc_config()
+    if config.oidc_client is None or config.oidc_discovery_url is None:
+        return False
+
+    with tokencache.locked():
+        if config.api_token:
+            # Another process has refreshed the token while we were waiting for
+            # the lock
+            return True
+        client = WebApplicationClient(config.oidc_client)
+        try:
+            idp_cfg = get_idp_cfg(config.oidc_discovery_url, config.request_timeout)
+        except OIDCError:
+            return False
+        refresh_tokens(config, client, idp_cfg["token_endpoint"])
+    return config.api_token is not None
+
+
 def fetch_token(config) -> str:
     """Return cached API token if it's fresh enough.
 
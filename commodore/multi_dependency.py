@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+import os
+
 from pathlib import Path
 from typing import Optional
 
 from url_normalize.tools import deconstruct_url
 
 from commodore.gitrepo import GitRepo, normalize_git_url
+from commodore.gitrepo.object_cache import GitObjectCache
 
 
 class MultiDependency:
@@ -19,15 +22,29 @@ class MultiDependency:
         dependencies_dir: Path,
         author_name: Optional[str] = None,
         author_email: Optional[str] = None,
+        object_cache: Optional[GitObjectCache] = None,
+        url_rewrites: Optional[dict[str, str]] = None,
     ):
         repo_dir = dependency_dir(dependencies_dir, repo_url)
+        if object_cache and not object_cache.is_linked(repo_dir):
+            # Populate the shared object cache before the dependency repo fetches
+            # anything, so that the dependency repo's fetch only needs to download
+            # objects which aren't present in the shared cache yet.
+            object_cache.update(
+                normalize_git_url(repo_url),
+                dependency_key(repo_url),
+                url_rewrites=url_rewrites,
+            )
         self._repo = GitRepo(
             repo_url,
             repo_dir,
             bare=True,
             author_name=author_name,
             author_email=author_email,
+            url_rewrites=url_rewrites,
         )
+        if object_cache:
+            object_cache.link(repo_dir, dependency_key(repo_url))
         self._components = {}
         self._packages = {}
 
@@ -62,12 +79,39 @@ class MultiDependency:
         except KeyError as e:
             raise ValueError(f"can't deregister unknown component {name}") from e
 
-    def checkout_component(self, name: str, version: Optional[str]):
-        """Create or update worktree for component `name`."""
+    def checkout_component(self, name: str, version: Optional[str], sub_path: str = ""):
+        """Create or update worktree for component `name`.
+
+        If `sub_path` is given, the worktree is a sparse checkout of that path."""
         target_dir = self.get_component(name)
         if not target_dir:
             raise ValueError(f"can't checkout unknown component {name}")
-        self._repo.checkout_worktree(target_dir, version=version)
+        self._repo.checkout_worktree(target_dir, version=version, sparse_path=sub_path)
+
+    def share_component_checkout(self, name: str, source: str) -> bool:
+        """Make the checkout of component `name` a symlink to the checkout of
+        component `source`.
+
+        An existing separate worktree for `name` is removed if it's clean. Returns
+        `False` without changing anything if the existing checkout can't be removed
+        safely."""
+        target_dir = self.get_component(name)
+        source_dir = self.get_component(source)
+        if not target_dir:
+            raise ValueError(f"can't share checkout for unknown component {name}")
+        if not source_dir:
+            raise ValueError(f"can't share checkout of unknown component {source}")
+
+        if target_dir.is_symlink():
+            target_dir.unlink()
+        elif target_dir.is_dir():
+            wtr = GitRepo(None, target_dir)
+            if not wtr.repo.has_separate_working_tree() or wtr.has_local_changes():
+                return False
+            wtr.repo.git.execute(["git", "worktree", "remove", str(target_dir)])
+
+        os.symlink(os.path.relpath(source_dir, start=target_dir.parent), target_dir)
+        return True
 
     def get_package(self, name: str) -> Optional[Path]:
         return self._packages.get(name)
@@ -84,12 +128,14 @@ class MultiDependency:
         except KeyError as e:
             raise ValueError(f"can't deregister unknown package {name}") from e
 
-    def checkout_package(self, name: str, version: Optional[str]):
-        """Create or update worktree for package `name`."""
+    def checkout_package(self, name: str, version: Optional[str], sub_path: str = ""):
+        """Create or update worktree for package `name`.
+
+        If `sub_path` is given, the worktree is a sparse checkout of that path."""
         target_dir = self.get_package(name)
         if not target_dir:
             raise ValueError(f"can't checkout unknown package {name}")
-        self._repo.checkout_worktree(target_dir, version=version)
+        self._repo.checkout_worktree(target_dir, version=version, sparse_path=sub_path)
 
     def initialize_worktree(self, target_dir: Path) -> None:
         """Initialize a worktree in `target_dir`."""
@@ -87,7 +87,9 @@ class Package:
         return worktree / self._sub_path
 
     def checkout(self):
-        self._dependency.checkout_package(self._name, self._version)
+        self._dependency.checkout_package(
+            self._name, self._version, sub_path=self._sub_path
+        )
 
     def is_checked_out(self) -> bool:
         return self.target_dir is not None and self.target_dir.is_dir()
@@ -130,29 +130,34 @@ def postprocess_components(
     aliases = config.get_component_aliases()
 
     for a, cn in aliases.items():
-        c = components[cn]
         inv = kapitan_inventory.get(a)
         if not inv:
             click.echo(f" > No target exists for component {cn}, skipping...")
             continue
+        postprocess_component(config, inv, components[cn], a)
 
-        # inventory filters
-        invfilters = _get_inventory_filters(inv)
 
-        filters: list[Filter] = []
-        for fd in invfilters:
-            try:
-                filters.append(Filter.from_dict(config, c, a, fd))
-            except (KeyError, ValueError) as e:
-                filtername = fd.get("filter", "<unknown>")
-                click.secho(
-                    f" > Skipping filter '{filtername}' with invalid definition {fd}: {e}",
-                    fg="yellow",
-                )
+def postprocess_component(config: Config, inv: dict[str, Any], c: Component, a: str):
+    """Apply the postprocessing filters of component instance `a` with inventory
+    `inv` to the instance's compiled output."""
+    # inventory filters
+    invfilters = _get_inventory_filters(inv)
 
-        if len(filters) > 0 and config.debug:
-            click.echo(f" > {cn}...")
+    filters: list[Filter] = []
+    for fd in invfilters:
+        try:
+            filters.append(Filter.from_dict(config, c, a, fd))
+        except (KeyError, ValueError) as e:
+            filtername = fd.get("filter", "<unknown>")
+            click.secho(
+                f" > Skipping filter '{filtername}' with invalid definition {fd}: {e}",
+                fg="yellow",
+            )
+
+    if len(filters) > 0 and config.debug:
+        click.echo(f" > {c.name}...")
 
+    with config.target_timings.timed(a, "postprocess"):
         for f in filters:
             if config.debug:
                 click.secho(f"   > Executing filter '{f.type}:{f.filter}'")
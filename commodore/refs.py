@@ -1,16 +1,18 @@
 from __future__ import annotations
 
+import json
 import re
 import os
 from base64 import b64encode
 from pathlib import Path as P
-from typing import Optional
+from collections.abc import Iterable, Iterator
+from typing import Any, Optional
 
 import click
 
 from .component import component_parameters_key
 from .config import Config
-from .helpers import rm_tree_contents, yaml_dump
+from .helpers import yaml_dumps
 
 
 class SecretRef:
@@ -21,8 +23,9 @@ class SecretRef:
 
     _SECRET_REF = re.compile(r"\?{([^}]+)\}")
 
-    def __init__(self, key, ref):
+    def __init__(self, key, ref, target=""):
         self.keys = [key]
+        self.targets = [target]
         refelems = ref.split(":")
         self.type = refelems[0]
         self.ref = refelems[1]
@@ -35,7 +38,7 @@ class SecretRef:
         return f"{self.type}:{self.ref}"
 
     @classmethod
-    def from_value(cls, key, value) -> list[SecretRef]:
+    def from_value(cls, key, value, target="") -> list[SecretRef]:
         """
         Create a list of SecretRef objects from string `value`. All
         non-overlapping Kapitan secret references in the string are returned
@@ -43,7 +46,7 @@ class SecretRef:
         this method returns an empty list.
         """
         matches = cls._SECRET_REF.finditer(value)
-        return [SecretRef(key, m.group(1)) for m in matches]
+        return [SecretRef(key, m.group(1), target) for m in matches]
 
     def _mangle_ref(self):
         """
@@ -59,18 +62,17 @@ class SecretRef:
 
         raise NotImplementedError(f"Ref type: {self.type}")
 
-    def create_kapitan_ref(self, refdir, ref_params, debug=False):
+    def create_kapitan_ref(self, refdir, ref_params, debug=False) -> bool:
         """
         Create a Kapitan secret ref file from this reference.
 
         This method creates a secret ref file in `refdir` which Kapitan can
-        subsequently use for revealing the secret.
+        subsequently use for revealing the secret. An existing ref file is only
+        rewritten if its contents differ. Returns whether the file was written.
 
         Currently only `vaultkv` references are supported.
         """
         reffile = P(refdir, self.ref)
-        if debug:
-            click.echo(f"    > Writing to file {reffile}")
         if self.type != "vaultkv":
             raise NotImplementedError(f"ref type: {self.type}")
         params = ref_params[self.type]
@@ -80,11 +82,38 @@ class SecretRef:
             "type": self.type,
             params["key"]: params["values"],
         }
+        content = yaml_dumps(refdef)
+        try:
+            if reffile.read_text(encoding="utf-8") == content:
+                return False
+        except (FileNotFoundError, IsADirectoryError, UnicodeDecodeError):
+            pass
+        if debug:
+            click.echo(f"    > Writing to file {reffile}")
         os.makedirs(reffile.parent, exist_ok=True)
-        yaml_dump(refdef, reffile)
+        with open(reffile, "w", encoding="utf-8") as f:
+            f.write(content)
+        return True
 
-    def add_key(self, key):
+    def add_key(self, key, target=""):
         self.keys.append(key)
+        self.targets.append(target)
+
+
+def _children(params, path) -> tuple[Iterator[tuple[Any, Any]], Any, str]:
+    if isinstance(params, dict):
+        return iter(params.items()), path, "/"
+    return iter(enumerate(params)), path, "["
+
+
+def _key_path(path) -> str:
+    """Materialize key path `path` which is given as linked tuples."""
+    segments = []
+    while isinstance(path, tuple):
+        path, sep, k = path
+        segments.append(f"/{k}" if sep == "/" else f"[{k}]")
+    segments.append(path)
+    return "".join(reversed(segments))
 
 
 class RefBuilder:
@@ -102,6 +131,7 @@ class RefBuilder:
         self.inventory = inventory
         self._refs = {}
         self._ref_params = None
+        self._target = ""
 
     def _find_ref(self, key, value):
         """
@@ -110,13 +140,13 @@ class RefBuilder:
         # Only consider leaves which are of type string, other types cannot
         # contain a secret reference.
         if isinstance(value, str):
-            for r in SecretRef.from_value(key, value):
+            for r in SecretRef.from_value(key, value, self._target):
                 if self.debug:
                     click.echo(f"    > Found secret ref {r.refstr} in {value}")
                 if r.refstr in self._refs:
                     if self.trace:
                         click.echo("    > Duplicate ref, adding key to list")
-                    self._refs[r.refstr].add_key(key)
+                    self._refs[r.refstr].add_key(key, self._target)
                 else:
                     self._refs[r.refstr] = r
         elif self.trace:
@@ -124,19 +154,52 @@ class RefBuilder:
 
     def _find_refs(self, prefix, params):
         """
-        Recursively search Kapitan refs, descending into dicts and lists.
+        Search Kapitan refs, descending into dicts and lists.
+
+        The parameters are walked depth-first with an explicit stack of iterators,
+        which visits leaves in the same order as a recursive walk. Only strings
+        which contain `?{` are matched against the secret ref regex, and the key
+        path of a leaf is only materialized when the leaf contains a secret ref.
         """
         if self.trace:
-            click.echo(f" > Processing {prefix}")
+            self._find_refs_traced(prefix, params)
+            return
+        if not isinstance(params, (dict, list)):
+            self._find_ref(prefix, params)
+            return
+
+        # Key paths are linked tuples `(parent, separator, key)` with the prefix as
+        # the root.
+        stack: list[tuple[Iterator[tuple[Any, Any]], Any, str]] = [
+            _children(params, prefix)
+        ]
+        while stack:
+            it, path, sep = stack[-1]
+            for k, v in it:
+                if isinstance(v, str):
+                    if "?{" in v:
+                        self._find_ref(_key_path((path, sep, k)), v)
+                elif isinstance(v, (dict, list)):
+                    stack.append(_children(v, (path, sep, k)))
+                    break
+            else:
+                stack.pop()
+
+    def _find_refs_traced(self, prefix, params):
+        """
+        Recursively search Kapitan refs, descending into dicts and lists, and
+        print each visited key.
+        """
+        click.echo(f" > Processing {prefix}")
 
         if isinstance(params, dict):
             # Recurse for dicts
             for k, v in params.items():
-                self._find_refs(f"{prefix}/{k}", v)
+                self._find_refs_traced(f"{prefix}/{k}", v)
         elif isinstance(params, list):
             # Recurse for lists
             for idx, e in enumerate(params):
-                self._find_refs(f"{prefix}[{idx}]", e)
+                self._find_refs_traced(f"{prefix}[{idx}]", e)
         else:
             # Otherwise, handle as leaf
             self._find_ref(prefix, params)
@@ -147,6 +210,7 @@ class RefBuilder:
         Kapitan target `target`.
         """
         params = self.inventory[target]["parameters"][key]
+        self._target = target
         self._find_refs(key, params)
 
     @property
@@ -165,14 +229,43 @@ class RefBuilder:
         return self._ref_params
 
 
+def _remove_stale_refs(refdir: P, reffiles: set[P]) -> int:
+    """
+    Delete all files in `refdir` which aren't in `reffiles`, and any directories
+    which are empty afterwards. Hidden files and directories in `refdir` are kept.
+
+    Returns the number of deleted files.
+    """
+    removed = 0
+    for entry in refdir.iterdir():
+        if entry.name.startswith("."):
+            continue
+        if not entry.is_dir() or entry.is_symlink():
+            if entry not in reffiles:
+                entry.unlink()
+                removed += 1
+            continue
+        for dirpath, dirnames, filenames in os.walk(entry, topdown=False):
+            for name in filenames + [d for d in dirnames if P(dirpath, d).is_symlink()]:
+                f = P(dirpath, name)
+                if f not in reffiles:
+                    f.unlink()
+                    removed += 1
+            if not os.listdir(dirpath):
+                os.rmdir(dirpath)
+    return removed
+
+
 def update_refs(config: Config, aliases: dict[str, str], inventory: dict):
     """
     Iterate over parameters for each target, and create Kapitan secret refs
     for all ?{...} found as values in the dicts
+
+    Only ref files which are new or whose contents have changed are written, and
+    ref files for secret refs which aren't present anymore are deleted.
     """
     click.secho("Updating Kapitan secret references...", bold=True)
     os.makedirs(config.refs_dir, exist_ok=True)
-    rm_tree_contents(config.refs_dir)
 
     rb = RefBuilder(config, inventory)
 
@@ -195,9 +288,102 @@ def update_refs(config: Config, aliases: dict[str, str], inventory: dict):
         # Find references for component instance
         rb.find_refs(target, component_key)
 
+    refs = list(rb.refs)
+    # Delete stale ref files first, so that a stale ref file or directory can't
+    # shadow a directory or file which is required for the new refs.
+    removed = _remove_stale_refs(
+        config.refs_dir, {P(config.refs_dir, r.ref) for r in refs}
+    )
+
     ref_params = rb.params
+    written = 0
     # Create Kapitan references
-    for r in rb.refs:
+    for r in refs:
         if config.debug:
             click.echo(f" > Creating Kapitan reffile for secret ref {r.refstr}")
-        r.create_kapitan_ref(config.refs_dir, ref_params, debug=config.debug)
+        if r.create_kapitan_ref(config.refs_dir, ref_params, debug=config.debug):
+            written += 1
+
+    click.echo(
+        f" > {len(refs)} secret refs: {written} ref files written, "
+        + f"{removed} stale ref files removed"
+    )
+
+    if config.secret_ref_index:
+        params = inventory[bootstrap_target]["parameters"]
+        cluster_id = params[bootstrap_target]["name"]
+        write_secret_ref_index(
+            secret_ref_index(cluster_id, refs), config.secret_ref_index
+        )
+        if config.debug:
+            click.echo(f" > Secret ref index written to {config.secret_ref_index}")
+
+
+def secret_ref_index(cluster_id: str, refs: Iterable[SecretRef]) -> dict[str, Any]:
+    """
+    Build an index which maps each secret ref to the cluster, target and
+    parameter key in which the ref is used.
+    """
+    return {
+        "clusters": [cluster_id],
+        "refs": {
+            r.refstr: [
+                {"cluster": cluster_id, "target": t, "key": k}
+                for t, k in zip(r.targets, r.keys)
+            ]
+            for r in sorted(refs, key=lambda r: r.refstr)
+        },
+    }
+
+
+def merge_secret_ref_indexes(indexes: Iterable[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Merge secret ref indexes of multiple clusters into a single index.
+
+    Indexes which are merged later replace all entries of the clusters they
+    contain, so that merging an updated index of a single cluster into a merged
+    index doesn't duplicate the cluster's entries.
+    """
+    clusters: list[str] = []
+    refs: dict[str, list[dict[str, str]]] = {}
+    for index in indexes:
+        replaced = set(index.get("clusters", []))
+        clusters = [c for c in clusters if c not in replaced] + sorted(replaced)
+        refs = {
+            ref: [u for u in usages if u["cluster"] not in replaced]
+            for ref, usages in refs.items()
+        }
+        for ref, usages in index.get("refs", {}).items():
+            refs.setdefault(ref, []).extend(usages)
+
+    return {
+        "clusters": sorted(clusters),
+        "refs": {ref: usages for ref, usages in sorted(refs.items()) if usages},
+    }
+
+
+def read_secret_ref_index(path: P) -> dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError) as e:
+        raise click.ClickException(
+            f"Unable to read secret ref index {path}: {e}"
+        ) from e
+    if not isinstance(index, dict) or not isinstance(index.get("refs"), dict):
+        raise click.ClickException(f"{path} isn't a secret ref index")
+    return index
+
+
+def write_secret_ref_index(index: dict[str, Any], path: P):
+    """
+    Write secret ref index `index` as compact JSON to `path`, or to stdout if
+    `path` is `-`.
+    """
+    data = json.dumps(index, separators=(",", ":"))
+    if str(path) == "-":
+        click.echo(data)
+        return
+    os.makedirs(P(path).parent, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(data + "\n")
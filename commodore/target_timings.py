@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import click
+
+import kapitan.targets as kapitan_targets  # type: ignore
+from kapitan import cached  # type: ignore
+from kapitan.targets import compile_target as _kapitan_compile_target  # type: ignore
+
+from .worker_memory import admitted, peak_rss, reset_peak_rss
+
+TIMINGS_FILE = ".target-timings.json"
+
+PHASES = ["compile", "postprocess"]
+
+
+class TargetTimings:
+    """Per-target compile and postprocessing durations, and peak compile worker
+    RSS of the last compilation.
+
+    The durations are stored in the working directory, and are used to submit the
+    targets of subsequent compilations to Kapitan longest-first. Kapitan hands out
+    targets to its compile workers in submission order, so scheduling the longest
+    targets first avoids that a slow target which is started last extends the
+    total compile time."""
+
+    _path: Path
+    _timings: dict[str, dict[str, float]]
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._timings = {}
+        if path.is_file():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._timings = json.load(f).get("targets", {})
+            except (OSError, ValueError, AttributeError):
+                self._timings = {}
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def duration(self, target: str, phase: str = "") -> float:
+        """Return the recorded duration of `phase` for `target`, or the sum of all
+        recorded phases if no phase is given."""
+        timings = self._timings.get(target, {})
+        if phase:
+            return timings.get(phase, 0.0)
+        return sum(timings.get(p, 0.0) for p in PHASES)
+
+    def peak_rss(self) -> dict[str, int]:
+        """Return the recorded peak RSS of the compile worker for each target."""
+        return {
+            t: int(timings["peak_rss"])
+            for t, timings in self._timings.items()
+            if "peak_rss" in timings
+        }
+
+    def record(self, target: str, phase: str, seconds: float):
+        self._timings.setdefault(target, {})[phase] = round(seconds, 3)
+
+    def schedule(self, targets: Iterable[str]) -> list[str]:
+        """Order `targets` longest-first according to the recorded compile
+        durations.
+
+        Targets without recorded durations are scheduled first, since we can't
+        tell whether they're slow."""
+        targets = list(targets)
+        unknown = [t for t in targets if t not in self._timings]
+        known = [t for t in targets if t in self._timings]
+        return unknown + sorted(
+            known, key=lambda t: self.duration(t, "compile"), reverse=True
+        )
+
+    @contextmanager
+    def timed(self, target: str, phase: str) -> Iterator[None]:
+        start = time.monotonic()
+        yield
+        self.record(target, phase, time.monotonic() - start)
+
+    @contextmanager
+    def recording(self) -> Iterator[None]:
+        """Record the compile duration and peak RSS of each target which Kapitan
+        compiles while the context is active.
+
+        Kapitan's compile workers run in separate processes. The workers write
+        each target's measurements to a temporary directory which is passed to them in
+        Kapitan's `cached.args`."""
+        compile_target = kapitan_targets.compile_target
+        timings_dir = Path(tempfile.mkdtemp(prefix="commodore-timings-"))
+        cached.args.commodore_target_timings = str(timings_dir)
+        kapitan_targets.compile_target = _compile_target
+        try:
+            yield
+        finally:
+            kapitan_targets.compile_target = compile_target
+            del cached.args.commodore_target_timings
+            for f in timings_dir.iterdir():
+                stats = json.loads(f.read_text(encoding="utf-8"))
+                self.record(f.name, "compile", stats["compile"])
+                self._timings[f.name]["peak_rss"] = stats["peak_rss"]
+            shutil.rmtree(timings_dir)
+
+    def save(self):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmpf = self._path.with_name(f"{self._path.name}.{os.getpid()}.tmp")
+        with open(tmpf, "w", encoding="utf-8") as f:
+            json.dump({"targets": self._timings}, f, indent=2, sort_keys=True)
+        os.replace(tmpf, self._path)
+
+    def report(self, targets: Iterable[str], count: int = 5):
+        """Print the `count` slowest of `targets`, which are on the critical path of
+        the compilation."""
+        slowest = sorted(
+            (t for t in targets if t in self._timings),
+            key=self.duration,
+            reverse=True,
+        )[:count]
+        if not slowest:
+            return
+        click.secho("Slowest targets:", bold=True)
+        for t in slowest:
+            phases = ", ".join(
+                f"{p} {self.duration(t, p):.2f}s"
+                for p in PHASES
+                if p in self._timings[t]
+            )
+            click.echo(f" > {t}: {self.duration(t):.2f}s ({phases})")
+
+
+def _compile_target(target_config, search_paths, compile_path, ref_controller, args):
+    """Wrapper for Kapitan's `compile_target()` which records the compile duration
+    and the peak RSS of the compile worker for the target.
+
+    Heavy targets wait for an admission slot before they're compiled, see
+    `WorkerPlan.admission_control()`."""
+    target = target_config.vars.target
+    with admitted(args, target):
+        reset_peak_rss()
+        start = time.monotonic()
+        result = _kapitan_compile_target(
+            target_config, search_paths, compile_path, ref_controller, args
+        )
+        stats = {"compile": time.monotonic() - start, "peak_rss": peak_rss()}
+    timings_dir = getattr(args, "commodore_target_timings", None)
+    if timings_dir:
+        Path(timings_dir, target).write_text(json.dumps(stats), encoding="utf-8")
+    return result
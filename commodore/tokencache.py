@@ -1,32 +1,89 @@
 from __future__ import annotations
 
+import fcntl
 import json
 import os
+import tempfile
+import threading
 
+from collections.abc import Iterator
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional, TextIO
 
 import click
 from xdg.BaseDirectory import xdg_cache_home
 
 cache_name = Path(xdg_cache_home) / "commodore" / "token"
 
+# The lock file is shared by all threads of the process, see `locked()`.
+_lock_mutex = threading.Lock()
+_lock_holders = 0
+_lockf: Optional[TextIO] = None
+# Serializes updates of the cache by threads of the same process
+_save_mutex = threading.Lock()
 
-def save(lieutenant: str, token: dict[str, Any]):
+
+@contextmanager
+def locked() -> Iterator[None]:
+    """Hold an exclusive lock on the token cache while the context is active.
+
+    The lock serializes updates of the token cache by concurrent Commodore
+    processes. Readers don't need to take the lock, since the cache file is
+    replaced atomically.
+
+    The lock is held on behalf of the whole process, so that threads of a process
+    which holds the lock, such as the OIDC callback server during `login()`, can
+    still update the cache."""
+    global _lock_holders, _lockf  # pylint: disable=global-statement
+    with _lock_mutex:
+        if _lock_holders == 0:
+            lock_name = cache_name.with_name(f"{cache_name.name}.lock")
+            os.makedirs(lock_name.parent, exist_ok=True)
+            # pylint: disable=consider-using-with
+            lockf = open(lock_name, "a", encoding="utf-8")
+            try:
+                fcntl.flock(lockf, fcntl.LOCK_EX)
+            except BaseException:
+                lockf.close()
+                raise
+            _lockf = lockf
+        _lock_holders += 1
     try:
-        with open(cache_name, "r", encoding="utf-8") as f:
-            cache = json.load(f)
-    except (IOError, FileNotFoundError):
-        cache = {}
-    except json.JSONDecodeError:
-        click.secho(" > Dropping invalid JSON for token cache", fg="yellow")
-        cache = {}
+        yield
+    finally:
+        with _lock_mutex:
+            _lock_holders -= 1
+            if _lock_holders == 0 and _lockf is not None:
+                fcntl.flock(_lockf, fcntl.LOCK_UN)
+                _lockf.close()
+                _lockf = None
+
+
+def save(lieutenant: str, token: dict[str, Any]):
+    with locked(), _save_mutex:
+        try:
+            with open(cache_name, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (IOError, FileNotFoundError):
+            cache = {}
+        except json.JSONDecodeError:
+            click.secho(" > Dropping invalid JSON for token cache", fg="yellow")
+            cache = {}
 
-    cache[lieutenant] = token
+        cache[lieutenant] = token
 
-    os.makedirs(os.path.dirname(cache_name), exist_ok=True)
-    with open(cache_name, "w", encoding="utf-8") as f:
-        f.write(json.dumps(cache, indent=1))
+        os.makedirs(os.path.dirname(cache_name), exist_ok=True)
+        fd, tmpf = tempfile.mkstemp(
+            dir=cache_name.parent, prefix=f".{cache_name.name}."
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(json.dumps(cache, indent=1))
+            os.replace(tmpf, cache_name)
+        except BaseException:
+            Path(tmpf).unlink(missing_ok=True)
+            raise
 
 
 def get(lieutenant: str) -> dict[str, Any]:
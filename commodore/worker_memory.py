@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import re
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Union
+
+import click
+
+from kapitan import cached  # type: ignore
+
+# Polling interval bounds while waiting for an admission slot, in seconds
+_ADMISSION_MIN_DELAY = 0.05
+_ADMISSION_MAX_DELAY = 0.5
+
+_SIZE = re.compile(r"^(\d+)\s*([kKMGT]i?)?[bB]?$")
+_UNITS = {
+    "": 1,
+    "k": 10**3,
+    "K": 10**3,
+    "M": 10**6,
+    "G": 10**9,
+    "T": 10**12,
+    "ki": 2**10,
+    "Ki": 2**10,
+    "Mi": 2**20,
+    "Gi": 2**30,
+    "Ti": 2**40,
+}
+
+# cgroup v1 reports a huge value instead of "max" for unlimited cgroups
+_CGROUP_V1_UNLIMITED = 2**62
+
+
+def parse_worker_memory(value: Optional[str]) -> Union[int, str, None]:
+    """Parse the per-worker memory budget provided on the command line.
+
+    Accepts `auto` or a size in bytes with an optional decimal (`k`, `M`, `G`, `T`)
+    or binary (`Ki`, `Mi`, `Gi`, `Ti`) suffix."""
+    if not value:
+        return None
+    if value == "auto":
+        return value
+    m = _SIZE.match(value.strip())
+    if not m:
+        raise click.ClickException(
+            f"Malformed worker memory '{value}', expected 'auto' or a size, e.g. '2Gi'"
+        )
+    return int(m.group(1)) * _UNITS[m.group(2) or ""]
+
+
+def format_size(size: float) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024
+    return f"{size:.1f}{unit}"
+
+
+def available_memory() -> Optional[int]:
+    """Return the memory which is available to this process in bytes, or `None`
+    if it can't be determined.
+
+    Takes into account the memory which is available on the system and the
+    remaining memory of the process's cgroup (both v1 and v2)."""
+    candidates = []
+    meminfo = _read("/proc/meminfo")
+    if meminfo:
+        m = re.search(r"^MemAvailable:\s+(\d+) kB$", meminfo, re.MULTILINE)
+        if m:
+            candidates.append(int(m.group(1)) * 1024)
+    cgroup = _cgroup_available_memory()
+    if cgroup is not None:
+        candidates.append(cgroup)
+    return min(candidates, default=None)
+
+
+def _cgroup_available_memory() -> Optional[int]:
+    paths: list[tuple[str, str, str]] = []
+    for line in (_read("/proc/self/cgroup") or "").splitlines():
+        _, controllers, path = line.split(":", 2)
+        if controllers == "":
+            paths.append(
+                (
+                    f"/sys/fs/cgroup{path}".rstrip("/"),
+                    "memory.max",
+                    "memory.current",
+                )
+            )
+        elif "memory" in controllers.split(","):
+            paths.append(
+                (
+                    f"/sys/fs/cgroup/memory{path}".rstrip("/"),
+                    "memory.limit_in_bytes",
+                    "memory.usage_in_bytes",
+                )
+            )
+    # The cgroup path may not be visible inside containers, where the
+    # container's cgroup is mounted at the root instead.
+    paths += [
+        ("/sys/fs/cgroup", "memory.max", "memory.current"),
+        ("/sys/fs/cgroup/memory", "memory.limit_in_bytes", "memory.usage_in_bytes"),
+    ]
+    for directory, limit_file, usage_file in paths:
+        limit = _read(f"{directory}/{limit_file}")
+        usage = _read(f"{directory}/{usage_file}")
+        if limit is None or usage is None:
+            continue
+        if limit.strip() == "max" or int(limit) >= _CGROUP_V1_UNLIMITED:
+            return None
+        return max(int(limit) - int(usage), 0)
+    return None
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except (OSError, ValueError):
+        return None
+
+
+@dataclass
+class WorkerPlan:
+    """Number of compile workers, and the targets whose admission is throttled.
+
+    At most `heavy_slots` of the `heavy_targets` are compiled concurrently."""
+
+    processes: int
+    heavy_targets: list[str] = field(default_factory=list)
+    heavy_slots: int = 0
+
+    @contextmanager
+    def admission_control(self) -> Iterator[None]:
+        """Throttle the admission of heavy targets in Kapitan's compile workers
+        while the context is active.
+
+        Each admission slot is a lock file in a temporary directory. The directory
+        is passed to the compile workers in Kapitan's `cached.args`. Workers hold a
+        lock on one of the slots while compiling a heavy target."""
+        if not self.heavy_targets:
+            yield
+            return
+        slots_dir = tempfile.mkdtemp(prefix="commodore-admission-")
+        cached.args.commodore_heavy_targets = {
+            "dir": slots_dir,
+            "slots": self.heavy_slots,
+            "targets": self.heavy_targets,
+        }
+        try:
+            yield
+        finally:
+            del cached.args.commodore_heavy_targets
+            shutil.rmtree(slots_dir)
+
+
+def plan_workers(
+    worker_memory: Union[int, str],
+    peak_rss: dict[str, int],
+    targets: Iterable[str],
+    max_processes: int,
+) -> WorkerPlan:
+    """Select the number of compile workers so that the workers fit into the
+    available memory.
+
+    With `worker_memory` set to `auto`, the budget for each worker is the median of
+    the recorded peak RSS of `targets`. Targets whose recorded peak RSS exceeds the
+    budget are heavy. The number of heavy targets which are compiled concurrently
+    is limited to what fits into the memory which remains after all workers have
+    used their budget."""
+    targets = list(targets)
+    available = available_memory()
+    peaks = [peak_rss[t] for t in targets if peak_rss.get(t)]
+    if worker_memory == "auto":
+        if not peaks:
+            return WorkerPlan(max_processes)
+        budget = int(statistics.median(peaks))
+    else:
+        budget = int(worker_memory)
+    if available is None or budget <= 0:
+        return WorkerPlan(max_processes)
+
+    processes = max(1, min(max_processes, available // budget))
+    heavy = sorted(
+        (t for t in targets if peak_rss.get(t, 0) > budget),
+        key=lambda t: peak_rss[t],
+        reverse=True,
+    )
+    if not heavy or processes == 1:
+        return WorkerPlan(processes)
+    headroom = max(available - processes * budget, 0)
+    max_extra = peak_rss[heavy[0]] - budget
+    slots = max(1, min(processes, headroom // max_extra))
+    if slots >= processes:
+        return WorkerPlan(processes)
+    return WorkerPlan(processes, heavy, slots)
+
+
+@contextmanager
+def admitted(args, target: str) -> Iterator[None]:
+    """Wait for an admission slot in the compile worker if `target` is heavy."""
+    control = getattr(args, "commodore_heavy_targets", None)
+    if not control or target not in control["targets"]:
+        yield
+        return
+    fds = [
+        os.open(Path(control["dir"]) / f"slot-{i}", os.O_CREAT | os.O_RDWR, 0o600)
+        for i in range(control["slots"])
+    ]
+    fd = None
+    delay = _ADMISSION_MIN_DELAY
+    try:
+        # flock() can't wait for any one of multiple locks, so we poll all slots
+        # until one of them is released.
+        while fd is None:
+            for slot_fd in fds:
+                try:
+                    fcntl.flock(slot_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    fd = slot_fd
+                    break
+                except BlockingIOError:
+                    pass
+            else:
+                time.sleep(delay)
+                delay = min(2 * delay, _ADMISSION_MAX_DELAY)
+    finally:
+        for slot_fd in fds:
+            if slot_fd != fd:
+                os.close(slot_fd)
+    assert fd is not None  # nosec B101
+    try:
+        yield
+    finally:
+        # Closing the file descriptor releases the lock
+        os.close(fd)
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of the current process, if supported by the kernel."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss() -> int:
+    """Return the peak RSS of the current process in bytes since the last call to
+    `reset_peak_rss()`.
+
+    Falls back to the peak RSS over the lifetime of the process if the kernel
+    doesn't expose the peak RSS in `/proc/self/status`."""
+    status = _read("/proc/self/status") or ""
+    m = re.search(r"^VmHWM:\s+(\d+) kB$", status, re.MULTILINE)
+    if m:
+        return int(m.group(1)) * 1024
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,39 @@
+import pytest
+
+from commodore import refs
+from commodore.config import Config
+
+
+def _params(components: int, size: int):
+    def _component(c: int):
+        return {
+            "namespace": f"syn-component-{c}",
+            "secret": f"?{{vaultkv:t-tenant/c-cluster/component-{c}/secret}}",
+            "replicas": 3,
+            "resources": [
+                {
+                    "name": f"resource-{i}",
+                    "labels": {f"label-{j}": f"value-{j}" for j in range(10)},
+                    "enabled": True,
+                }
+                for i in range(size)
+            ],
+        }
+
+    return {f"component_{c}": _component(c) for c in range(components)}
+
+
+@pytest.mark.bench
+def bench_find_refs(benchmark, config: Config):
+    # About 50MB of parameters when serialized as JSON
+    params = _params(100, 1800)
+    target = config.inventory.bootstrap_target
+    inventory = {target: {"parameters": params}}
+
+    def _find_refs():
+        b = refs.RefBuilder(config, inventory)
+        for k in params:
+            b.find_refs(target, k)
+        return b.refs
+
+    assert len(benchmark(_find_refs)) == 100
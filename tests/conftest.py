@@ -17,7 +17,7 @@ import pytest
 from click.testing import CliRunner, Result
 from git import Repo
 
-from commodore import cli, tools
+from commodore import cli, completion_cache, tools
 from commodore.config import Config
 from commodore.gitrepo import GitRepo
 
@@ -52,6 +52,14 @@ def gitconfig(tmp_path: Path) -> Path:
     return gitconfig
 
 
+@pytest.fixture(autouse=True)
+def completion_cache_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Ensure that tests don't share the cluster ID completion cache."""
+    cache_dir = tmp_path / ".cache" / "commodore" / "completion"
+    monkeypatch.setattr(completion_cache, "cache_dir", cache_dir)
+    return cache_dir
+
+
 @pytest.fixture
 def cli_runner() -> RunnerFunc:
     r = CliRunner()
@@ -122,7 +130,7 @@ class MockMultiDependency:
         assert name not in self._components
         self._components[name] = target_dir
 
-    def checkout_component(self, name, version):
+    def checkout_component(self, name, version, sub_path=""):
         assert name in self._components
         assert version == "master"
         self._repo.clone(self._components[name])
@@ -131,7 +139,7 @@ class MockMultiDependency:
         assert name not in self._packages
         self._packages[name] = target_dir
 
-    def checkout_package(self, name, version):
+    def checkout_package(self, name, version, sub_path=""):
         assert name in self._packages
         assert version == "master"
         self._repo.clone(self._packages[name])
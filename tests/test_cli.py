@@ -122,3 +122,28 @@ def test_tool_install_command():
 def test_tool_upgrade_command():
     exit_status = call("commodore tool upgrade --help", shell=True)
     assert exit_status == 0
+
+
+def test_cache_git_gc_command():
+    exit_status = call("commodore cache git-gc --help", shell=True)
+    assert exit_status == 0
+
+
+def test_cache_kustomize_ls_command():
+    exit_status = call("commodore cache kustomize-ls --help", shell=True)
+    assert exit_status == 0
+
+
+def test_cache_kustomize_prune_command():
+    exit_status = call("commodore cache kustomize-prune --help", shell=True)
+    assert exit_status == 0
+
+
+def test_daemon_command():
+    exit_status = call("commodore daemon --help", shell=True)
+    assert exit_status == 0
+
+
+def test_catalog_merge_secret_ref_indexes_command():
+    exit_status = call("commodore catalog merge-secret-ref-indexes --help", shell=True)
+    assert exit_status == 0
@@ -10,6 +10,7 @@ import click
 import pytest
 import responses
 
+from commodore import completion_cache
 from commodore.cli import catalog
 from commodore.config import Config
 from test_catalog import cluster_resp
@@ -198,3 +199,94 @@ def test_cluster_complete_func_api_error():
     ctx.params["oidc_discovery_url"] = None
     completions = catalog._complete_clusters(ctx, None, "")
     assert completions == []
+
+
+@responses.activate
+def test_cluster_complete_func_cache():
+    ctx = click.Context(catalog.compile_catalog)
+    ctx.params["api_url"] = "https://syn.example.com"
+    ctx.params["api_token"] = "token"
+    ctx.params["oidc_client"] = None
+    ctx.params["oidc_discovery_url"] = None
+
+    responses.add(
+        responses.GET,
+        "https://syn.example.com/clusters/",
+        json.dumps([{"id": "c-foo"}, {"id": "c-bar"}]),
+    )
+    assert catalog._complete_clusters(ctx, None, "c-f") == ["c-foo"]
+    assert catalog._complete_clusters(ctx, None, "c-b") == ["c-bar"]
+    assert len(responses.calls) == 1
+
+    # IDs are cached per API URL
+    ctx.params["api_url"] = "https://syn.example.org"
+    assert catalog._complete_clusters(ctx, None, "c-") == []
+    assert len(responses.calls) == 2
+
+
+def test_cluster_complete_func_stale_cache():
+    ctx = click.Context(catalog.compile_catalog)
+    ctx.params["api_url"] = "https://syn.example.com"
+    ctx.params["api_token"] = "token"
+    ctx.params["oidc_client"] = None
+    ctx.params["oidc_discovery_url"] = None
+    completion_cache.store_cluster_ids("https://syn.example.com", ["c-foo"])
+
+    with mock.patch.object(completion_cache, "refresh_in_background") as refresh:
+        assert catalog._complete_clusters(ctx, None, "") == ["c-foo"]
+        refresh.assert_not_called()
+
+        with mock.patch.object(completion_cache, "TTL", 0):
+            assert catalog._complete_clusters(ctx, None, "") == ["c-foo"]
+        refresh.assert_called_once_with("https://syn.example.com", "token", 5)
+
+
+@responses.activate
+def test_completion_cache_refresh():
+    responses.add(
+        responses.GET,
+        "https://syn.example.com/clusters/",
+        json.dumps([{"id": "c-foo"}, {}]),
+    )
+    assert completion_cache.cluster_ids("https://syn.example.com") == (None, False)
+
+    completion_cache.refresh("https://syn.example.com", "token", 5)
+
+    assert completion_cache.cluster_ids("https://syn.example.com/") == (
+        ["c-foo"],
+        True,
+    )
+    assert responses.calls[0].request.headers["Authorization"] == "Bearer token"
+
+
+@responses.activate
+def test_catalog_report_compile_meta_cli(cli_runner: RunnerFunc, tmp_path: Path):
+    meta = {"lastCompile": "2024-01-01T00:00:00.000+00:00"}
+    (tmp_path / "a.json").write_text(
+        json.dumps({"clusters": {"c-1": {"lastCompile": "old"}, "c-2": meta}})
+    )
+    (tmp_path / "b.json").write_text(json.dumps({"clusters": {"c-1": meta}}))
+    for c in ["c-1", "c-2"]:
+        responses.add(
+            responses.POST,
+            f"https://syn.example.com/clusters/{c}/compileMeta",
+            status=204,
+            body=None,
+            match=[responses.matchers.json_params_matcher(meta)],
+        )
+
+    result = cli_runner(
+        [
+            "catalog",
+            "report-compile-meta",
+            "--api-url",
+            "https://syn.example.com",
+            "--api-token",
+            "token",
+            str(tmp_path / "a.json"),
+            str(tmp_path / "b.json"),
+        ]
+    )
+
+    assert result.exit_code == 0
+    assert len(responses.calls) == 2
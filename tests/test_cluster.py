@@ -5,12 +5,29 @@ Unit-tests for catalog compilation
 import click
 from unittest.mock import patch
 import pytest
+import responses
+
+from responses import matchers
 
 from commodore import compile
-from commodore.cluster import Cluster
+from commodore.cluster import (
+    Cluster,
+    fetch_clusters,
+    load_cluster_from_api,
+    load_clusters_from_api,
+)
 
 
-def lieutenant_query(api_url, api_token, api_endpoint, api_id, params={}, timeout=5):
+def lieutenant_query(
+    api_url,
+    api_token,
+    api_endpoint,
+    api_id,
+    params={},
+    timeout=5,
+    session=None,
+    cache=None,
+):
     if api_endpoint == "clusters":
         return {"id": api_id}
 
@@ -220,3 +237,74 @@ def test_dynamic_facts_fallback(api_data, dynfacts, fallback):
         assert dynfacts == cluster.dynamic_facts
     else:
         assert fallback == cluster.dynamic_facts
+
+
+@responses.activate
+def test_fetch_clusters(config, api_data):
+    clusters = [api_data["cluster"], {**api_data["cluster"], "id": "c-baz"}]
+    responses.get(
+        "https://syn.example.com/clusters/",
+        json=clusters,
+        match=[matchers.query_param_matcher({"tenant": "t-foo"})],
+    )
+    responses.get("https://syn.example.com/tenants/t-foo", json=api_data["tenant"])
+
+    assert fetch_clusters(config, tenant="t-foo") == clusters
+    assert len(responses.calls) == 1
+
+    # The listed clusters are served from the response cache
+    cluster = load_cluster_from_api(config, "c-baz")
+    assert cluster.id == "c-baz"
+    assert len(responses.calls) == 2
+
+
+def _clusters(api_data):
+    return [
+        api_data["cluster"],
+        {**api_data["cluster"], "id": "c-baz"},
+        {**api_data["cluster"], "id": "c-qux", "tenant": "t-qux"},
+    ]
+
+
+@responses.activate
+def test_load_clusters_from_api(config, api_data):
+    responses.get("https://syn.example.com/clusters/", json=_clusters(api_data))
+    responses.get(
+        "https://syn.example.com/tenants/",
+        json=[api_data["tenant"], {"id": "t-other", "displayName": "Other"}],
+    )
+    # t-qux isn't included in the tenant list, and is fetched individually
+    responses.get(
+        "https://syn.example.com/tenants/t-qux",
+        json={"id": "t-qux", "displayName": "Qux"},
+    )
+
+    clusters = load_clusters_from_api(config)
+    assert sorted(clusters.keys()) == ["c-bar", "c-baz", "c-qux"]
+    assert clusters["c-baz"].tenant_display_name == "Foo Inc."
+    assert clusters["c-qux"].tenant_display_name == "Qux"
+    assert len(responses.calls) == 3
+
+    # Clusters and tenants are served from the response cache
+    cluster = load_cluster_from_api(config, "c-bar")
+    assert cluster.catalog_repo_url == api_data["cluster"]["gitRepo"]["url"]
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_load_clusters_from_api_selection(config, api_data):
+    # The cluster list is filtered by tenant on the server
+    responses.get(
+        "https://syn.example.com/clusters/",
+        json=_clusters(api_data)[:2],
+        match=[matchers.query_param_matcher({"tenant": "t-foo"})],
+    )
+    responses.get("https://syn.example.com/tenants/t-foo", json=api_data["tenant"])
+
+    clusters = load_clusters_from_api(config, ["c-baz"], tenant="t-foo")
+    assert list(clusters.keys()) == ["c-baz"]
+    # Only a single tenant is needed, which is fetched individually
+    assert len(responses.calls) == 2
+
+    with pytest.raises(click.ClickException, match="not found on Lieutenant: c-qux"):
+        load_clusters_from_api(config, ["c-bar", "c-qux"], tenant="t-foo")
@@ -1,12 +1,15 @@
 import copy
 import os
+import threading
 
 from datetime import datetime, timedelta
 from pathlib import Path
 from unittest.mock import patch
 
+import click
 import git
 import pytest
+import requests
 import responses
 
 from responses import matchers
@@ -18,7 +21,13 @@ from commodore.gitrepo import GitRepo
 from test_dependency_mgmt import setup_aliases_upstream, _setup_packages
 
 from commodore.catalog import CompileMeta
-from commodore.cluster import report_compile_metadata
+from commodore.cluster import (
+    CompileMetaReporter,
+    read_compile_metadata,
+    report_compile_metadata,
+    report_compile_metadata_batch,
+)
+from commodore.helpers import ApiError
 
 
 def _setup_config_repos(cfg: Config, tenant="t-test-tenant"):
@@ -238,3 +247,222 @@ def test_report_compile_meta(tmp_path: Path, config: Config, capsys, report):
         assert captured.out.startswith(
             " > The following compile metadata would be reported to Lieutenant on a successful catalog push:\n"
         )
+
+
+@responses.activate
+def test_report_compile_meta_retries(tmp_path: Path, config: Config, capsys):
+    _setup_config_repos(config, "t-tenant-1234")
+    config.request_backoff_factor = 0
+    compile_meta = CompileMeta(config)
+    url = f"{config.api_url}/clusters/c-cluster-1234/compileMeta"
+    responses.add(responses.POST, url, json={"reason": "unavailable"}, status=503)
+    responses.add(responses.POST, url, status=204, body=None)
+
+    report_compile_metadata(config, compile_meta, "c-cluster-1234", True)
+
+    assert len(responses.calls) == 2
+    assert "failed: API returned 503: unavailable, retrying" in capsys.readouterr().out
+
+
+@responses.activate
+def test_report_compile_meta_no_retry_on_client_error(tmp_path: Path, config: Config):
+    _setup_config_repos(config, "t-tenant-1234")
+    config.request_backoff_factor = 0
+    compile_meta = CompileMeta(config)
+    responses.add(
+        responses.POST,
+        f"{config.api_url}/clusters/c-cluster-1234/compileMeta",
+        json={"reason": "invalid"},
+        status=400,
+    )
+
+    with pytest.raises(ApiError, match="API returned 400: invalid"):
+        report_compile_metadata(config, compile_meta, "c-cluster-1234", True)
+
+    assert len(responses.calls) == 1
+
+
+@pytest.mark.parametrize("push_done", [False, True])
+@responses.activate
+def test_compile_meta_reporter(tmp_path: Path, config: Config, push_done):
+    _setup_config_repos(config, "t-tenant-1234")
+    config.push = True
+    compile_meta = CompileMeta(config)
+    responses.add(
+        responses.POST,
+        f"{config.api_url}/clusters/c-cluster-1234/compileMeta",
+        status=204,
+        body=None,
+        match=[matchers.json_params_matcher(compile_meta.as_dict())],
+    )
+
+    reporter = CompileMetaReporter(config, compile_meta, "c-cluster-1234").start()
+    reporter.submit(push_done)
+
+    assert len(responses.calls) == (1 if push_done else 0)
+
+
+@responses.activate
+def test_compile_meta_reporter_error(tmp_path: Path, config: Config):
+    _setup_config_repos(config, "t-tenant-1234")
+    config.request_retries = 0
+    compile_meta = CompileMeta(config)
+    responses.add(
+        responses.POST,
+        f"{config.api_url}/clusters/c-cluster-1234/compileMeta",
+        status=503,
+        json={"reason": "unavailable"},
+    )
+
+    reporter = CompileMetaReporter(config, compile_meta, "c-cluster-1234").start()
+    with pytest.raises(click.ClickException) as e:
+        reporter.submit(True)
+
+    assert str(e.value) == (
+        "While reporting compile metadata to Lieutenant: API returned 503: unavailable"
+    )
+
+
+@pytest.mark.parametrize("push_done", [False, True])
+@responses.activate
+def test_compile_meta_reporter_login(tmp_path: Path, config: Config, push_done):
+    _setup_config_repos(config, "t-tenant-1234")
+    config.push = True
+    config.api_token = None
+    compile_meta = CompileMeta(config)
+    responses.add(
+        responses.POST,
+        f"{config.api_url}/clusters/c-cluster-1234/compileMeta",
+        status=204,
+        body=None,
+    )
+    refreshing = threading.Event()
+    login_threads = []
+
+    def _refresh_token(cfg):
+        refreshing.set()
+        return False
+
+    def _login(cfg):
+        login_threads.append(threading.current_thread())
+        cfg.api_token = "token"
+
+    with patch("commodore.cluster.refresh_token") as refresh, patch(
+        "commodore.cluster.login"
+    ) as login:
+        refresh.side_effect = _refresh_token
+        login.side_effect = _login
+        reporter = CompileMetaReporter(config, compile_meta, "c-cluster-1234").start()
+        assert refreshing.wait(timeout=5)
+        reporter.submit(push_done)
+
+    # The interactive login only runs if the metadata is reported, and it runs in
+    # the calling thread.
+    assert login_threads == ([threading.current_thread()] if push_done else [])
+    assert len(responses.calls) == (1 if push_done else 0)
+
+
+def test_compile_meta_reporter_nothing_to_report(tmp_path: Path, config: Config):
+    _setup_config_repos(config, "t-tenant-1234")
+    config.push = True
+    config.api_token = None
+    compile_meta = CompileMeta(config)
+    release = threading.Event()
+
+    with patch("commodore.cluster.refresh_token") as refresh, patch(
+        "commodore.cluster.login"
+    ) as login:
+        refresh.side_effect = lambda cfg: release.wait()
+        reporter = CompileMetaReporter(config, compile_meta, "c-cluster-1234").start()
+        # Doesn't wait for the pending token refresh
+        reporter.submit(False)
+        release.set()
+
+    login.assert_not_called()
+
+
+@responses.activate
+def test_report_compile_meta_retries_html_error(tmp_path: Path, config: Config):
+    _setup_config_repos(config, "t-tenant-1234")
+    config.request_backoff_factor = 0
+    compile_meta = CompileMeta(config)
+    url = f"{config.api_url}/clusters/c-cluster-1234/compileMeta"
+    responses.add(
+        responses.POST,
+        url,
+        body="<html><body>502 Bad Gateway</body></html>",
+        content_type="text/html",
+        status=502,
+    )
+    responses.add(responses.POST, url, status=204, body=None)
+
+    report_compile_metadata(config, compile_meta, "c-cluster-1234", True)
+
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_report_compile_meta_connection_error(tmp_path: Path, config: Config):
+    _setup_config_repos(config, "t-tenant-1234")
+    config.request_retries = 2
+    config.request_backoff_factor = 0
+    compile_meta = CompileMeta(config)
+    responses.add(
+        responses.POST,
+        f"{config.api_url}/clusters/c-cluster-1234/compileMeta",
+        body=requests.ConnectionError("connection refused"),
+    )
+
+    with pytest.raises(ApiError, match="Unable to connect to Lieutenant"):
+        report_compile_metadata(config, compile_meta, "c-cluster-1234", True)
+
+    # Connection errors are only retried by the Lieutenant session
+    assert len(responses.calls) <= config.request_retries + 1
+
+
+@responses.activate
+def test_compile_meta_file_batch(tmp_path: Path, config: Config, capsys):
+    _setup_config_repos(config, "t-tenant-1234")
+    config.request_backoff_factor = 0
+    compile_meta = CompileMeta(config)
+    for i in range(3):
+        config.compile_meta_file = tmp_path / f"meta-{i}.json"
+        report_compile_metadata(config, compile_meta, f"c-cluster-{i}", True)
+    # Reporting to a file doesn't call the Lieutenant API
+    assert len(responses.calls) == 0
+
+    metas = {}
+    for i in range(3):
+        metas.update(read_compile_metadata(tmp_path / f"meta-{i}.json"))
+    assert metas == {f"c-cluster-{i}": compile_meta.as_dict() for i in range(3)}
+
+    for i in range(2):
+        responses.add(
+            responses.POST,
+            f"{config.api_url}/clusters/c-cluster-{i}/compileMeta",
+            status=204,
+            body=None,
+            match=[matchers.json_params_matcher(compile_meta.as_dict())],
+        )
+    responses.add(
+        responses.POST,
+        f"{config.api_url}/clusters/c-cluster-2/compileMeta",
+        status=404,
+        json={"reason": "not found"},
+    )
+
+    errors = report_compile_metadata_batch(config, metas, parallelism=2)
+
+    assert list(errors) == ["c-cluster-2"]
+    assert str(errors["c-cluster-2"]) == "API returned 404: not found"
+    out = capsys.readouterr().out
+    assert " > Reported compile metadata of c-cluster-0\n" in out
+    assert " > Reported compile metadata of c-cluster-1\n" in out
+
+
+def test_read_compile_metadata_invalid(tmp_path: Path):
+    f = tmp_path / "meta.json"
+    f.write_text('{"foo": "bar"}')
+
+    with pytest.raises(click.ClickException, match="isn't a compile metadata file"):
+        read_compile_metadata(f)
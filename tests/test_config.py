@@ -18,6 +18,7 @@ from commodore.config import (
     Config,
     set_fact_value,
     parse_dynamic_fact_value,
+    parse_dependency_url_rewrites,
     parse_dynamic_facts_from_cli,
 )
 from commodore.package import Package
@@ -373,6 +374,23 @@ def test_expired_token_cache(test_patch):
     assert conf.api_token is None
 
 
+@patch("commodore.tokencache.get")
+def test_token_decoded_once(test_patch):
+    test_patch.side_effect = mock_get_token
+    conf = Config(P("."), api_url="https://syn.example.com")
+    with patch("commodore.config.jwt.decode", wraps=jwt.decode) as decode:
+        token = conf.api_token
+        assert token is not None
+        assert conf.api_token == token
+        assert decode.call_count == 1
+        assert test_patch.call_count == 1
+
+        # The expiry is still checked on each access
+        with patch("commodore.config.time.time", return_value=time.time() + 100):
+            assert conf.api_token is None
+        assert decode.call_count == 1
+
+
 def test_register_get_package(config: Config, tmp_path: P, mockdep):
     # No preregistered packages
     assert config.get_packages() == {}
@@ -509,6 +527,28 @@ def test_parse_dynamic_facts_from_cli(args: Iterable[str], expected: dict[str, A
     assert dynamic_facts == expected
 
 
+@pytest.mark.parametrize(
+    "args,expected",
+    [
+        ([], {}),
+        (
+            ["https://github.com/=file:///mirror/github.com/"],
+            {"https://github.com/": "file:///mirror/github.com/"},
+        ),
+        (["a=b", "a=c", "d=e=f"], {"a": "c", "d": "e=f"}),
+    ],
+)
+def test_parse_dependency_url_rewrites(args: list[str], expected: dict[str, str]):
+    assert parse_dependency_url_rewrites(args) == expected
+
+
+@pytest.mark.parametrize("arg", ["foo", "=bar", "foo="])
+def test_parse_dependency_url_rewrites_error(arg: str):
+    with pytest.raises(click.ClickException) as e:
+        parse_dependency_url_rewrites([arg])
+    assert f"Malformed dependency URL rewrite '{arg}'" in e.value.message
+
+
 @responses.activate
 @pytest.mark.parametrize(
     "api_url,discovery_resp,expected_client,expected_url",
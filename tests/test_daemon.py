@@ -0,0 +1,88 @@
+"""
+Tests for the Commodore daemon
+"""
+
+from __future__ import annotations
+
+import select
+import subprocess
+
+from pathlib import Path
+
+import pytest
+
+from commodore import __version__
+from commodore.cli import commodore
+from commodore.daemon import GLOBAL_OPTIONS_WITH_VALUE, forward, subcommand
+
+
+@pytest.fixture
+def daemon_socket(tmp_path: Path):
+    socket_path = tmp_path / "daemon.sock"
+    proc = subprocess.Popen(
+        ["commodore", "daemon", "--socket", str(socket_path)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    # The daemon prints a line once the socket is listening
+    ready, _, _ = select.select([proc.stdout], [], [], 120)
+    line = proc.stdout.readline() if ready else ""
+    if not line.startswith("Commodore daemon listening on"):
+        proc.kill()
+        proc.wait()
+        pytest.fail(
+            f"Commodore daemon didn't start (exit code {proc.returncode}): {line!r}"
+        )
+    assert socket_path.is_socket()
+    yield socket_path
+    proc.terminate()
+    proc.wait(timeout=10)
+    assert not socket_path.exists()
+
+
+def test_forward(daemon_socket: Path, capfd):
+    assert forward(daemon_socket, ["--version"]) == 0
+    assert __version__ in capfd.readouterr().out
+
+    assert forward(daemon_socket, ["catalog", "compile"]) == 2
+    assert "Error: Missing argument 'CLUSTER'." in capfd.readouterr().err
+
+
+def test_forward_env(
+    daemon_socket: Path, tmp_path: Path, capfd, monkeypatch: pytest.MonkeyPatch
+):
+    (tmp_path / "work" / "catalog").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("COMMODORE_WORKING_DIR", "work")
+
+    assert forward(daemon_socket, ["catalog", "clean"]) == 0
+    assert "Cleaning working tree" in capfd.readouterr().out
+    assert not (tmp_path / "work" / "catalog").exists()
+
+
+def test_forward_not_running(tmp_path: Path):
+    assert forward(tmp_path / "daemon.sock", ["--version"]) is None
+
+
+@pytest.mark.parametrize(
+    "argv,expected",
+    [
+        ([], None),
+        (["--version"], None),
+        (["daemon"], "daemon"),
+        (["-vvv", "-d", "daemon", "catalog", "compile", "daemon"], "catalog"),
+        (["--working-dir=work", "daemon"], "daemon"),
+        (["--request-timeout", "10", "component", "new", "daemon"], "component"),
+    ],
+)
+def test_subcommand(argv: list[str], expected):
+    assert subcommand(argv) == expected
+
+
+def test_global_options_with_value():
+    assert GLOBAL_OPTIONS_WITH_VALUE == {
+        opt
+        for p in commodore.params
+        if not getattr(p, "is_flag", False) and not getattr(p, "count", False)
+        for opt in p.opts
+    }
@@ -229,6 +229,53 @@ def test_fetch_components_aliases(
             tmp_path / "inventory" / "classes" / "defaults" / f"{alias}.yml"
         ).is_symlink()
         assert (tmp_path / "dependencies" / alias).is_dir()
+        # Aliases which use the same version as the component share its checkout
+        assert (tmp_path / "dependencies" / alias).is_symlink()
+        assert (tmp_path / "dependencies" / alias).resolve() == (
+            tmp_path / "dependencies" / component
+        )
+
+
+@patch("commodore.dependency_mgmt._read_components")
+@patch("commodore.dependency_mgmt._discover_components")
+def test_fetch_components_alias_shared_checkout(
+    patch_discover, patch_read, config: Config, tmp_path: Path
+):
+    components = ["foo"]
+    aliases = {"bar": "foo"}
+    patch_discover.return_value = (components, aliases)
+    cspecs = setup_components_upstream(tmp_path, components)
+    upstream = git.Repo(tmp_path / "upstream" / "foo")
+    master_sha = upstream.head.commit.hexsha
+    upstream.create_head("feat")
+    cspecs["bar"] = DependencySpec(cspecs["foo"].url, master_sha, "")
+    patch_read.return_value = cspecs
+    alias_dir = tmp_path / "dependencies" / "bar"
+
+    # Alias version resolves to the commit checked out for the component
+    dependency_mgmt.fetch_components(config)
+    assert alias_dir.is_symlink()
+
+    # Switching to a different version creates a separate worktree
+    upstream.git.checkout("feat")
+    (tmp_path / "upstream" / "foo" / "feat.txt").touch()
+    upstream.index.add(["feat.txt"])
+    upstream.index.commit("feat")
+    cspecs["bar"] = DependencySpec(cspecs["foo"].url, "feat", "")
+    config._dependency_repos.clear()
+    config._components.clear()
+    dependency_mgmt.fetch_components(config)
+    assert not alias_dir.is_symlink()
+    assert (alias_dir / "feat.txt").is_file()
+    assert not (tmp_path / "dependencies" / "foo" / "feat.txt").exists()
+
+    # Switching back to the component's version removes the clean worktree
+    cspecs["bar"] = DependencySpec(cspecs["foo"].url, "master", "")
+    config._dependency_repos.clear()
+    config._components.clear()
+    dependency_mgmt.fetch_components(config)
+    assert alias_dir.is_symlink()
+    assert not (alias_dir / "feat.txt").exists()
 
 
 @patch("commodore.dependency_mgmt._read_components")
@@ -289,7 +336,15 @@ def test_fetch_components_raises(
     aliases = {"bar": "foo"}
     patch_discover.return_value = (components, aliases)
     patch_read.return_value = setup_components_upstream(tmp_path, components)
-    patch_read.return_value["bar"] = patch_read.return_value["foo"]
+    # Use a different version for the alias, so that the alias gets a separate
+    # worktree instead of sharing the component's checkout.
+    upstream = git.Repo(tmp_path / "upstream" / "foo")
+    upstream.create_head("alias").checkout()
+    upstream.index.commit("alias", skip_hooks=True)
+    upstream.git.checkout("master")
+    patch_read.return_value["bar"] = DependencySpec(
+        patch_read.return_value["foo"].url, "alias", ""
+    )
 
     dependency_mgmt.fetch_components(config)
 
@@ -1,5 +1,7 @@
 import json
+import os
 from pathlib import Path
+from unittest.mock import patch
 
 from commodore.component import Component
 from commodore.config import Config
@@ -88,3 +90,70 @@ def test_clear_jsonnet_lock_file(tmp_path: Path):
             data["dependencies"][0]["version"]
             != "57b4365eacda291b82e0d55ba7eec573a8198dda"
         )
+
+
+def _local_deps(tmp_path: Path, names: list[str]) -> list[dict]:
+    deps = []
+    for n in names:
+        (tmp_path / "dependencies" / n).mkdir(parents=True, exist_ok=True)
+        deps.append({"source": {"local": {"directory": f"dependencies/{n}"}}})
+    return deps
+
+
+def test_fetch_jsonnet_libraries_local(tmp_path: Path):
+    deps = _local_deps(tmp_path, ["test-component", "lib"])
+    vendor = tmp_path / "vendor"
+    vendor.mkdir()
+    (vendor / "stale").mkdir()
+    os.symlink("../dependencies/other", vendor / "other")
+    os.symlink("../dependencies/lib", vendor / "lib")
+    lib_inode = os.lstat(vendor / "lib").st_ino
+    (tmp_path / "jsonnetfile.lock.json").touch()
+
+    with patch("commodore.dependency_mgmt.jsonnet_bundler.call") as call:
+        jsonnet_bundler.fetch_jsonnet_libraries(tmp_path, deps=deps)
+        call.assert_not_called()
+
+    assert sorted(e.name for e in vendor.iterdir()) == ["lib", "test-component"]
+    assert os.readlink(vendor / "test-component") == "../dependencies/test-component"
+    # Symlinks which already point to the right target are kept
+    assert os.lstat(vendor / "lib").st_ino == lib_inode
+    assert not (tmp_path / "jsonnetfile.lock.json").exists()
+    with open(tmp_path / "jsonnetfile.json") as jf:
+        assert json.load(jf)["dependencies"] == deps
+
+
+def test_fetch_jsonnet_libraries_remote(tmp_path: Path):
+    deps = _local_deps(tmp_path, ["test-component", "remote-component", "lib"])
+    with open(
+        tmp_path / "dependencies" / "test-component" / "jsonnetfile.json", "w"
+    ) as jf:
+        json.dump({"version": 1, "dependencies": []}, jf)
+    with open(
+        tmp_path / "dependencies" / "remote-component" / "jsonnetfile.json", "w"
+    ) as jf:
+        json.dump(
+            {
+                "version": 1,
+                "dependencies": [
+                    {
+                        "source": {
+                            "git": {"remote": "https://github.com/example/lib.git"}
+                        },
+                        "version": "main",
+                    }
+                ],
+            },
+            jf,
+        )
+
+    with patch("commodore.dependency_mgmt.jsonnet_bundler.call") as call:
+        call.return_value = 0
+        jsonnet_bundler.fetch_jsonnet_libraries(tmp_path, deps=deps)
+        call.assert_called_once_with(["jb", "install"], cwd=tmp_path)
+
+    # Only the component with remote dependencies is installed by jb
+    with open(tmp_path / "jsonnetfile.json") as jf:
+        assert json.load(jf)["dependencies"] == [deps[1]]
+    vendor = tmp_path / "vendor"
+    assert sorted(e.name for e in vendor.iterdir()) == ["lib", "test-component"]
@@ -0,0 +1,174 @@
+"""
+Unit-tests for dependency mirroring
+"""
+
+from __future__ import annotations
+
+import os
+
+from pathlib import Path
+
+import click
+import git
+import pytest
+
+from commodore.config import Config
+from commodore.dependency_mgmt import mirror
+from commodore.gitrepo import GitRepo
+from commodore.helpers import yaml_dump
+from commodore.inventory.parameters import InventoryFacts
+
+from conftest import RunnerFunc
+from test_gitrepo import setup_remote
+
+
+def _setup_global(tmp_path: Path, url_a: str, url_b: str) -> Path:
+    global_path = tmp_path / "global-defaults"
+    os.makedirs(global_path / "distribution")
+    yaml_dump(
+        {
+            "parameters": {
+                "components": {"tc1": {"url": url_a, "version": "master"}},
+                "packages": {"tp1": {"url": url_a, "version": "v1.0.0"}},
+            }
+        },
+        global_path / "params.yml",
+    )
+    yaml_dump(
+        {
+            "parameters": {
+                "components": {"tc2": {"url": url_b, "version": "master"}},
+            }
+        },
+        global_path / "distribution" / "b.yml",
+    )
+    yaml_dump(
+        {
+            "classes": [
+                "global.params",
+                "global.distribution.${facts:distribution}",
+            ]
+        },
+        global_path / "commodore.yml",
+    )
+    return global_path
+
+
+def _cluster_values(tmp_path: Path, distribution: str) -> Path:
+    values = tmp_path / f"{distribution}.yml"
+    yaml_dump({"parameters": {"facts": {"distribution": distribution}}}, values)
+    return values
+
+
+def test_discover_dependency_urls(tmp_path: Path):
+    global_path = _setup_global(
+        tmp_path, "https://example.com/a.git", "git@example.com:b.git"
+    )
+    invfacts = [
+        InventoryFacts(str(global_path), None, [_cluster_values(tmp_path, d)], True)
+        for d in ["a", "b"]
+    ]
+
+    urls = mirror.discover_dependency_urls(Config(tmp_path), invfacts)
+
+    assert urls == {"https://example.com/a.git", "ssh://git@example.com/b.git"}
+
+
+def test_mirror_dependencies(tmp_path: Path):
+    url, ri = setup_remote(tmp_path / "upstream")
+    mirror_base = tmp_path / "mirror"
+
+    mirror.mirror_dependencies(Config(tmp_path), mirror_base, [url])
+
+    mirror_dir = mirror.mirror_dir(mirror_base, url)
+    m = git.Repo(mirror_dir)
+    assert m.bare
+    assert m.git.rev_parse("test-branch") == ri.commit_shas["test-branch"]
+
+    # Updating the mirror fetches new commits
+    (Path(ri.repo.working_tree_dir) / "new.txt").touch()
+    ri.repo.index.add(["new.txt"])
+    new_sha = ri.repo.index.commit("new").hexsha
+    mirror.mirror_dependencies(Config(tmp_path), mirror_base, [url])
+    assert m.git.rev_parse("master") == new_sha
+
+
+def test_mirror_dependencies_error(tmp_path: Path):
+    url, _ = setup_remote(tmp_path / "upstream")
+    missing = f"file://{tmp_path}/missing.git"
+
+    with pytest.raises(click.ClickException) as e:
+        mirror.mirror_dependencies(
+            Config(tmp_path), tmp_path / "mirror", [url, missing]
+        )
+
+    assert f" > {missing}: " in e.value.message
+    assert mirror.mirror_dir(tmp_path / "mirror", url).is_dir()
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        (
+            "https://github.com/projectsyn/component-foo.git",
+            ("https://github.com/", "file://{0}/github.com/"),
+        ),
+        (
+            "ssh://git@git.example.com:2222/org/repo.git",
+            ("ssh://git@git.example.com:2222/", "file://{0}/git.example.com/"),
+        ),
+        (
+            "file:///srv/git/repo.git",
+            ("file:///srv/git/repo.git", "file://{0}/srv/git/repo.git"),
+        ),
+    ],
+)
+def test_mirror_url_rewrites(tmp_path: Path, url: str, expected: tuple[str, str]):
+    rewrites = mirror.mirror_url_rewrites(tmp_path, [url])
+
+    assert rewrites == {expected[0]: expected[1].format(tmp_path)}
+
+
+def test_mirror_url_rewrites_applied(tmp_path: Path):
+    url, ri = setup_remote(tmp_path / "upstream")
+    mirror_base = tmp_path / "mirror"
+    mirror.mirror_dependencies(Config(tmp_path), mirror_base, [url])
+    # Make upstream unavailable to ensure we fetch from the mirror
+    os.rename(tmp_path / "upstream", tmp_path / "gone")
+
+    r = GitRepo(
+        url,
+        tmp_path / "local",
+        force_init=True,
+        url_rewrites=mirror.mirror_url_rewrites(mirror_base, [url]),
+    )
+    r.checkout("test-branch")
+
+    assert r.repo.head.commit.hexsha == ri.commit_shas["test-branch"]
+    assert r.repo.remote().url == url
+
+
+def test_dependency_mirror_cli(tmp_path: Path, cli_runner: RunnerFunc):
+    url_a, _ = setup_remote(tmp_path / "a")
+    url_b, _ = setup_remote(tmp_path / "b")
+    global_path = _setup_global(tmp_path, url_a, url_b)
+    mirror_base = tmp_path / "mirror"
+
+    result = cli_runner(
+        [
+            "dependency",
+            "mirror",
+            "-c",
+            str(_cluster_values(tmp_path, "a")),
+            "-c",
+            str(_cluster_values(tmp_path, "b")),
+            str(mirror_base),
+            str(global_path),
+        ]
+    )
+
+    assert result.exit_code == 0
+    assert "Mirroring 2 dependency repositories" in result.stdout
+    assert "--dependency-url-rewrite" in result.stdout
+    for url in [url_a, url_b]:
+        assert (mirror.mirror_dir(mirror_base.resolve(), url) / "HEAD").is_file()
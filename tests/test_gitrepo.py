@@ -408,6 +408,44 @@ def test_gitrepo_checkout_worktree_update_version(tmp_path: Path):
     assert wtr.head.commit.hexsha == ri.commit_shas["test-branch"]
 
 
+def test_gitrepo_checkout_worktree_replaces_symlink(tmp_path: Path):
+    repo_url, ri = setup_remote(tmp_path)
+    r = gitrepo.GitRepo(repo_url, targetdir=tmp_path / "bare.git", bare=True)
+    r.checkout_worktree(tmp_path / "shared", "master")
+    worktree = tmp_path / "repo"
+    os.symlink("shared", worktree)
+
+    r.checkout_worktree(worktree, "test-branch")
+
+    assert not worktree.is_symlink()
+    assert git.Repo(worktree).head.commit.hexsha == ri.commit_shas["test-branch"]
+    assert git.Repo(tmp_path / "shared").head.commit.hexsha == ri.commit_shas["master"]
+
+
+@pytest.mark.parametrize(
+    "version,expected",
+    [
+        ("master", "master"),
+        ("test-branch", "test-branch"),
+        ("v1.0.0", "master"),
+        (None, "master"),
+        ("nonexistent", None),
+    ],
+)
+def test_gitrepo_resolve_version(
+    tmp_path: Path, version: Optional[str], expected: Optional[str]
+):
+    repo_url, ri = setup_remote(tmp_path)
+    r = gitrepo.GitRepo(repo_url, targetdir=tmp_path / "bare.git", bare=True)
+    r.fetch()
+
+    sha = r.resolve_version(version)
+
+    assert sha == (ri.commit_shas[expected] if expected else None)
+    if expected:
+        assert r.resolve_version(sha) == sha
+
+
 def test_gitrepo_checkout_worktree_update_remote(tmp_path: Path):
     repo_url_1, ri1 = setup_remote(tmp_path / "remote1")
     repo_url_2, ri2 = setup_remote(tmp_path / "remote2")
@@ -764,3 +802,122 @@ def test_gitrepo_init_always_master(gitconfig: Path, tmp_path: Path):
 
     assert len(r._repo.heads) == 1
     assert r._repo.heads[0].name == "master"
+
+
+def test_gitrepo_fetch_if_changed(tmp_path: Path):
+    r, ri = setup_repo(tmp_path)
+
+    # The initial checkout fetched and stored the remote's fingerprint, so we don't
+    # fetch again if nothing changed upstream.
+    heads = r.fetch_if_changed()
+    assert all(isinstance(h, git.Reference) for h in heads)
+    assert {h.name for h in heads} >= {"origin/master", "origin/test-branch", "v1.0.0"}
+
+    # Changing the upstream repo results in a fetch
+    (tmp_path / "remote.git" / "new.txt").touch()
+    ri.repo.index.add(["new.txt"])
+    new_sha = ri.repo.index.commit("new commit").hexsha
+    heads = r.fetch_if_changed()
+    assert all(isinstance(h, git.FetchInfo) for h in heads)
+    assert r.repo.remote().refs["master"].commit.hexsha == new_sha
+
+    heads = r.fetch_if_changed()
+    assert all(isinstance(h, git.Reference) for h in heads)
+
+
+def test_gitrepo_fetch_if_changed_requested_ref(tmp_path: Path):
+    r, ri = setup_repo(tmp_path)
+
+    # Update an unrelated branch upstream
+    ri.repo.git.checkout("test-branch")
+    (tmp_path / "remote.git" / "new.txt").touch()
+    ri.repo.index.add(["new.txt"])
+    ri.repo.index.commit("new commit")
+
+    # Requested ref is unchanged, so we don't need to fetch
+    heads = r.fetch_if_changed(version="master")
+    assert all(isinstance(h, git.Reference) for h in heads)
+    heads = r.fetch_if_changed(version="v1.0.0")
+    assert all(isinstance(h, git.Reference) for h in heads)
+
+    # Requested ref changed
+    heads = r.fetch_if_changed(version="test-branch")
+    assert all(isinstance(h, git.FetchInfo) for h in heads)
+
+
+def test_gitrepo_fetch_if_changed_local_commit(tmp_path: Path):
+    r, ri = setup_repo(tmp_path)
+    # Make the remote unavailable, we don't need it for commits which exist locally
+    shutil.rmtree(tmp_path / "remote.git")
+
+    heads = r.fetch_if_changed(version=ri.commit_shas["test-branch"])
+    assert all(isinstance(h, git.Reference) for h in heads)
+
+    with pytest.raises(git.GitCommandError):
+        r.fetch_if_changed(version="f" * 40)
+
+
+def _setup_monorepo(tmp_path: Path) -> str:
+    remote = tmp_path / "monorepo.git"
+    repo = git.Repo.init(remote)
+    for f in ["README.md", "a/class/a.yml", "a/lib/a.libsonnet", "b/class/b.yml"]:
+        (remote / f).parent.mkdir(parents=True, exist_ok=True)
+        (remote / f).touch()
+    repo.index.add(["README.md", "a", "b"])
+    repo.index.commit("initial commit")
+    return f"file://{remote.absolute()}"
+
+
+def _worktree_files(worktree: Path) -> set[str]:
+    return {
+        str(f.relative_to(worktree))
+        for f in worktree.rglob("*")
+        if f.is_file() and f.name != ".git"
+    }
+
+
+def test_gitrepo_checkout_worktree_sparse(tmp_path: Path):
+    repo_url = _setup_monorepo(tmp_path)
+    r = gitrepo.GitRepo(repo_url, tmp_path / "bare.git", bare=True)
+    worktree = tmp_path / "a"
+    full = tmp_path / "full"
+
+    r.checkout_worktree(worktree, "master", sparse_path="a")
+    r.checkout_worktree(full, "master")
+
+    assert _worktree_files(worktree) == {
+        "README.md",
+        "a/class/a.yml",
+        "a/lib/a.libsonnet",
+    }
+    assert _worktree_files(full) == {
+        "README.md",
+        "a/class/a.yml",
+        "a/lib/a.libsonnet",
+        "b/class/b.yml",
+    }
+    # The bare repo is still detected as bare by GitPython
+    assert git.Repo(tmp_path / "bare.git").bare
+    wtr = gitrepo.GitRepo(None, worktree)
+    assert not wtr.repo.bare
+    assert not wtr.has_local_changes()
+
+    # Updating the sparse path of an existing worktree
+    r.checkout_worktree(worktree, "master", sparse_path="a/class")
+    assert _worktree_files(worktree) == {"README.md", "a/class/a.yml"}
+
+    # Disabling the sparse checkout for an existing worktree
+    r.checkout_worktree(worktree, "master")
+    assert _worktree_files(worktree) == _worktree_files(full)
+    assert not wtr.has_local_changes()
+
+
+@pytest.mark.parametrize(
+    "sparse_path,expected",
+    [
+        ("a", "/*\n!/*/\n/a/\n"),
+        ("a/b/c/", "/*\n!/*/\n/a/\n!/a/*/\n/a/b/\n!/a/b/*/\n/a/b/c/\n"),
+    ],
+)
+def test_cone_patterns(sparse_path: str, expected: str):
+    assert gitrepo._cone_patterns(sparse_path.strip("/")) == expected
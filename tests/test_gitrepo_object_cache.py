@@ -0,0 +1,98 @@
+"""
+Unit-tests for the shared Git object cache
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import git
+
+from commodore.gitrepo.object_cache import GitObjectCache
+from commodore.multi_dependency import MultiDependency, dependency_key
+
+from test_gitrepo import setup_remote
+
+
+def _cache_refs(cache: GitObjectCache) -> list[str]:
+    return [r.path for r in cache.repo.refs]
+
+
+def test_object_cache_update(tmp_path: Path):
+    repo_url, ri = setup_remote(tmp_path)
+    cache = GitObjectCache(tmp_path / "cache")
+
+    cache.update(repo_url, dependency_key(repo_url))
+
+    assert cache.repo.bare
+    refs = _cache_refs(cache)
+    assert len(refs) == 3
+    assert any(r.endswith("/heads/master") for r in refs)
+    assert any(r.endswith("/heads/test-branch") for r in refs)
+    assert any(r.endswith("/tags/v1.0.0") for r in refs)
+    for sha in ri.commit_shas.values():
+        assert cache.repo.git.cat_file("-t", sha) == "commit"
+
+
+def test_object_cache_update_error(tmp_path: Path, capsys):
+    cache = GitObjectCache(tmp_path / "cache")
+
+    cache.update(f"file://{tmp_path}/missing.git", "missing.git")
+
+    captured = capsys.readouterr()
+    assert "Unable to update shared Git object cache" in captured.out
+    assert _cache_refs(cache) == []
+
+
+def test_multi_dependency_object_cache(tmp_path: Path):
+    repo_url, ri = setup_remote(tmp_path)
+    cache = GitObjectCache(tmp_path / "cache")
+
+    md = MultiDependency(repo_url, tmp_path / "dependencies", object_cache=cache)
+
+    assert cache.is_linked(md.repo_directory)
+    with open(md.repo_directory / "objects" / "info" / "alternates") as f:
+        assert f.read() == f"{cache.objects_dir}\n"
+    with open(cache.referrers_file) as f:
+        assert f.read() == f"{dependency_key(repo_url)}\t{md.repo_directory}\n"
+
+    md.register_component("test", tmp_path / "test")
+    md.checkout_component("test", "master")
+
+    # All objects are available through the cache, so the dependency repo doesn't
+    # need to store any objects itself.
+    assert not list((md.repo_directory / "objects" / "pack").glob("*.pack"))
+    assert git.Repo(tmp_path / "test").head.commit.hexsha == ri.commit_shas["master"]
+
+    # Recreating the MultiDependency doesn't register the referrer again
+    MultiDependency(repo_url, tmp_path / "dependencies", object_cache=cache)
+    with open(cache.referrers_file) as f:
+        assert len(f.readlines()) == 1
+
+
+def test_object_cache_gc(tmp_path: Path):
+    repo_url, ri = setup_remote(tmp_path)
+    cache = GitObjectCache(tmp_path / "cache")
+
+    md1 = MultiDependency(repo_url, tmp_path / "wd1", object_cache=cache)
+    md1.register_component("test", tmp_path / "wd1" / "test")
+    md1.checkout_component("test", "master")
+    md2 = MultiDependency(repo_url, tmp_path / "wd2", object_cache=cache)
+
+    # Create a local commit in the worktree which references objects in the cache
+    wt = git.Repo(tmp_path / "wd1" / "test")
+    (tmp_path / "wd1" / "test" / "local.txt").touch()
+    wt.index.add(["local.txt"])
+    local_sha = wt.index.commit("local commit").hexsha
+
+    live, dropped = cache.gc(prune="now")
+    assert (live, dropped) == (2, 0)
+    assert wt.git.fsck("--connectivity-only") == ""
+    assert cache.repo.git.cat_file("-t", local_sha) == "commit"
+
+    # Drop second referrer, GC keeps the cache refs since md1 still uses the repo
+    git.rmtree(md2.repo_directory)
+    live, dropped = cache.gc(prune="now")
+    assert (live, dropped) == (1, 1)
+    assert any("/deps/" in r for r in _cache_refs(cache))
+    assert cache.repo.git.cat_file("-t", ri.commit_shas["test-branch"]) == "commit"
@@ -0,0 +1,125 @@
+"""
+Unit-tests for the Helm template cache
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+
+from pathlib import Path
+from unittest.mock import patch
+
+import kapitan.inputs.helm as kapitan_helm
+import kapitan.targets as kapitan_targets
+from kapitan import cached
+
+from commodore.helm_template_cache import HelmTemplateCache, cache_key
+
+
+def _setup_chart(tmp_path: Path) -> Path:
+    chart = tmp_path / "chart"
+    (chart / "templates").mkdir(parents=True)
+    (chart / "Chart.yaml").write_text("name: foo\nversion: 1.0.0\n")
+    (chart / "templates" / "cm.yaml").write_text("kind: ConfigMap\n")
+    return chart
+
+
+def _fake_render_chart(
+    chart_dir,
+    output_path,
+    helm_path,
+    helm_params,
+    helm_values_file,
+    helm_values_files,
+    helm_flags=None,
+):
+    out = Path(output_path) / "foo" / "templates"
+    out.mkdir(parents=True)
+    (out / "cm.yaml").write_text(f"namespace: {helm_params['namespace']}\n")
+    return ("", "")
+
+
+def test_cache_key(tmp_path: Path):
+    chart = _setup_chart(tmp_path)
+    values_a = tmp_path / "a.yaml"
+    values_a.write_text("foo: 1\nbar: 2\n")
+    values_b = tmp_path / "b.yaml"
+    values_b.write_text("bar: 2\nfoo: 1\n")
+    params = {"name": "foo", "namespace": "syn-foo"}
+
+    key = cache_key(str(chart), None, params, [str(values_a)], None)
+    assert key == cache_key(str(chart), None, params, [str(values_b)], None)
+    assert key != cache_key(
+        str(chart), None, {**params, "namespace": "bar"}, [str(values_a)], None
+    )
+
+    (chart / "templates" / "cm.yaml").write_text("kind: Secret\n")
+    assert key != cache_key(str(chart), None, params, [str(values_a)], None)
+
+
+def test_helm_template_cache(tmp_path: Path, capsys):
+    chart = _setup_chart(tmp_path)
+    cache = HelmTemplateCache(tmp_path / "cache")
+
+    with patch.object(kapitan_helm, "render_chart") as render:
+        render.side_effect = _fake_render_chart
+        with cache.enabled():
+            for i, ns in enumerate(["syn-foo", "syn-foo", "syn-bar"]):
+                out = tmp_path / f"out-{i}"
+                out.mkdir()
+                _, err = kapitan_helm.render_chart(
+                    str(chart), str(out), None, {"namespace": ns}, None, None
+                )
+                assert err == ""
+                assert (out / "foo" / "templates" / "cm.yaml").read_text() == (
+                    f"namespace: {ns}\n"
+                )
+        assert render.call_count == 2
+        # The original function is restored
+        assert kapitan_helm.render_chart is render
+
+    assert " > Helm template cache: 1 hits, 2 misses" in capsys.readouterr().out
+
+
+def test_helm_template_cache_stdout(tmp_path: Path):
+    chart = _setup_chart(tmp_path)
+    cache = HelmTemplateCache(tmp_path / "cache")
+
+    with patch.object(kapitan_helm, "render_chart") as render:
+        render.return_value = ("kind: ConfigMap\n", "")
+        with cache.enabled():
+            for _ in range(2):
+                output, _ = kapitan_helm.render_chart(
+                    str(chart), "-", None, {}, None, None
+                )
+                assert output == "kind: ConfigMap\n"
+        assert render.call_count == 2
+
+    assert not (tmp_path / "cache").exists()
+
+
+def _render_in_worker(chart: str, out: str):
+    return kapitan_helm.render_chart(chart, out, None, {"namespace": "a"}, None, None)
+
+
+def test_helm_template_cache_spawned_worker(tmp_path: Path, capsys):
+    chart = _setup_chart(tmp_path)
+    cache = HelmTemplateCache(tmp_path / "cache")
+    # Prepare a cache entry, so that the worker doesn't need to run helm
+    key = cache_key(str(chart), None, {"namespace": "a"}, [None], None)
+    _fake_render_chart(
+        str(chart), tmp_path / "entry", None, {"namespace": "a"}, None, None
+    )
+    cache._store(tmp_path / "entry", key)
+
+    with cache.enabled():
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(
+            1, initializer=kapitan_targets._pool_init, initargs=(cached.as_dict(), None)
+        ) as pool:
+            result = pool.apply(_render_in_worker, (str(chart), str(tmp_path / "out")))
+
+    assert result == ("", "")
+    assert (tmp_path / "out" / "foo" / "templates" / "cm.yaml").is_file()
+    assert " > Helm template cache: 1 hits, 0 misses" in capsys.readouterr().out
+    assert not hasattr(cached.args, "commodore_helm_template_cache")
@@ -22,6 +22,7 @@ from url_normalize import url_normalize
 
 import commodore.helpers as helpers
 from commodore.config import Config
+from commodore.lieutenant_session import new_session
 from commodore.multi_dependency import MultiDependency, dependency_dir
 
 
@@ -248,7 +249,9 @@ def test_lieutenant_query_response_errors(response, expected):
         )
 
     with pytest.raises(helpers.ApiError, match=expected):
-        helpers.lieutenant_query(base_url, "token", "clusters", "")
+        helpers.lieutenant_query(
+            base_url, "token", "clusters", "", session=new_session(retries=0)
+        )
 
     _verify_call_status(query_url)
 
@@ -452,6 +455,82 @@ def test_kapitan_inventory(tmp_path: Path, config: Config):
     )
 
 
+def _setup_kapitan_targets(config: Config):
+    config.inventory.targets_dir.mkdir(parents=True)
+    config.inventory.classes_dir.mkdir(parents=True)
+    for target in ["a", "b"]:
+        helpers.yaml_dump(
+            {
+                "parameters": {
+                    "kapitan": {"vars": {"target": target}},
+                    "foo": f"${{_instance}}-{target}",
+                    "_instance": "test",
+                }
+            },
+            config.inventory.targets_dir / f"{target}.yml",
+        )
+
+
+def test_prerendered_inventory(config: Config):
+    _setup_kapitan_targets(config)
+    nodes = helpers.kapitan_inventory(config)
+
+    with patch.object(
+        helpers.ReclassRsInventory, "_make_reclass_rs", side_effect=AssertionError
+    ):
+        inv = helpers.PrerenderedInventory(
+            nodes, inventory_path=str(config.inventory.inventory_dir)
+        )
+
+    assert set(inv.targets.keys()) == {"a", "b"}
+    assert inv.inventory["b"]["parameters"]["foo"] == "test-b"
+    assert inv.targets["a"].parameters.kapitan.vars.target == "a"
+
+
+def test_prerendered_inventory_missing_target(config: Config):
+    _setup_kapitan_targets(config)
+    nodes = helpers.kapitan_inventory(config)
+    del nodes["b"]
+
+    inv = helpers.PrerenderedInventory(
+        nodes, inventory_path=str(config.inventory.inventory_dir)
+    )
+
+    assert inv.inventory["b"]["parameters"]["foo"] == "test-b"
+
+
+def test_kapitan_compile_pipelined(config: Config):
+    _setup_kapitan_targets(config)
+    for target in ["a", "b"]:
+        (config.work_dir / "files" / target).mkdir(parents=True)
+        (config.work_dir / "files" / target / "cm.yaml").write_text(f"{target}: 1\n")
+        target_file = config.inventory.targets_dir / f"{target}.yml"
+        target_def = yaml.safe_load(target_file.read_text())
+        target_def["parameters"]["kapitan"]["compile"] = [
+            {
+                "input_type": "copy",
+                "input_paths": [str(config.work_dir / "files" / target)],
+                "output_path": target,
+            }
+        ]
+        helpers.yaml_dump(target_def, target_file)
+    nodes = helpers.kapitan_inventory(config)
+
+    compiled = []
+
+    def _on_compiled(target: str):
+        output = config.inventory.output_dir / target / target / "cm.yaml"
+        assert output.read_text() == f"{target}: 1\n"
+        compiled.append(target)
+
+    helpers.kapitan_compile(
+        config, ["a", "b"], inventory=nodes, on_compiled=_on_compiled
+    )
+
+    assert sorted(compiled) == ["a", "b"]
+    assert config.target_timings.duration("a", "compile") > 0.0
+
+
 class MockSYS:
     executable: str
 
@@ -0,0 +1,286 @@
+"""
+Unit-tests for the jsonnet-bundler cache
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+
+from pathlib import Path
+from typing import Optional
+from subprocess import CompletedProcess
+from unittest.mock import patch
+
+import pytest
+
+from commodore import jsonnet_cache
+from commodore.dependency_mgmt import jsonnet_bundler
+
+SOURCE = {"git": {"remote": "https://github.com/example/libs.git", "subdir": "lib"}}
+SHA_1 = "a" * 40
+SHA_2 = "b" * 40
+# Commit which is installed by `_fake_jb()`
+LOCKED = "c" * 40
+
+
+def _write_jsonnetfile(
+    path: Path, version: Optional[str] = SHA_1, local: list[str] = []
+):
+    deps: list[dict] = []
+    if version is not None:
+        deps.append({"source": SOURCE, "version": version})
+    deps += [{"source": {"local": {"directory": d}}, "version": ""} for d in local]
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path / "jsonnetfile.json", "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "dependencies": deps, "legacyImports": True}, f)
+
+
+def _ls_remote(sha: str):
+    """Fake `git ls-remote` which resolves all refs to `sha`."""
+
+    def run(args, **kwargs):
+        assert args[:3] == ["git", "ls-remote", SOURCE["git"]["remote"]]
+        return CompletedProcess(
+            args, 0, stdout="".join(f"{sha}\t{ref}\n" for ref in args[3:])
+        )
+
+    return run
+
+
+def _fake_jb(args, cwd: Path):
+    """Create the same vendor/ layout and lock file as `jb install`."""
+    pkg = cwd / "vendor" / "github.com" / "example" / "libs" / "lib"
+    pkg.mkdir(parents=True)
+    (pkg / "lib.libsonnet").write_text("{}\n")
+    if (cwd / "vendor" / "lib").is_symlink():
+        (cwd / "vendor" / "lib").unlink()
+    os.symlink("github.com/example/libs/lib", cwd / "vendor" / "lib")
+    with open(cwd / "jsonnetfile.lock.json", "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": 1,
+                "dependencies": [
+                    {"source": SOURCE, "version": LOCKED, "sum": "xyz"},
+                ],
+                "legacyImports": True,
+            },
+            f,
+        )
+    return 0
+
+
+@pytest.mark.parametrize(
+    "source,expected",
+    [
+        (SOURCE, "github.com/example/libs/lib"),
+        (
+            {"git": {"remote": "git@github.com:example/libs.git", "subdir": ""}},
+            "github.com/example/libs",
+        ),
+        ({"local": {"directory": "foo"}}, None),
+    ],
+)
+def test_package_name(source: dict, expected):
+    assert jsonnet_cache.package_name(source) == expected
+
+
+def test_inputs_digest(tmp_path: Path):
+    _write_jsonnetfile(tmp_path)
+    digest = jsonnet_cache.inputs_digest(tmp_path, tmp_path / "jsonnetfile.json")
+    assert digest == jsonnet_cache.inputs_digest(
+        tmp_path, tmp_path / "jsonnetfile.json"
+    )
+
+    _write_jsonnetfile(tmp_path, version=SHA_2)
+    assert digest != jsonnet_cache.inputs_digest(
+        tmp_path, tmp_path / "jsonnetfile.json"
+    )
+
+
+@pytest.mark.parametrize("version", ["", "main", "v1.0.0", "abc123"])
+def test_inputs_digest_unpinned(tmp_path: Path, version: str):
+    _write_jsonnetfile(tmp_path, version=version, local=["lib"])
+    # Unpinned dependencies of nested local dependencies also prevent caching
+    _write_jsonnetfile(tmp_path / "lib", version=None, local=["nested"])
+    _write_jsonnetfile(tmp_path / "lib" / "nested", version=version)
+
+    assert jsonnet_cache.inputs_digest(tmp_path, tmp_path / "jsonnetfile.json") is None
+
+
+def test_inputs_digest_nested_local(tmp_path: Path):
+    _write_jsonnetfile(tmp_path, local=["lib"])
+    _write_jsonnetfile(tmp_path / "lib", version=None, local=["nested"])
+    _write_jsonnetfile(tmp_path / "lib" / "nested")
+    digest = jsonnet_cache.inputs_digest(tmp_path, tmp_path / "jsonnetfile.json")
+    assert digest is not None
+
+    _write_jsonnetfile(tmp_path / "lib" / "nested", version=SHA_2)
+    assert digest != jsonnet_cache.inputs_digest(
+        tmp_path, tmp_path / "jsonnetfile.json"
+    )
+
+
+def test_fetch_jsonnet_libraries_cached(tmp_path: Path):
+    cwd = tmp_path / "component"
+    cwd.mkdir()
+    _write_jsonnetfile(cwd)
+    cache = jsonnet_cache.JsonnetBundlerCache(tmp_path / "cache")
+
+    with patch("commodore.dependency_mgmt.jsonnet_bundler.call") as call:
+        call.side_effect = _fake_jb
+        jsonnet_bundler.fetch_jsonnet_libraries(cwd, cache=cache)
+        assert call.call_count == 1
+
+        key = jsonnet_cache.package_key(SOURCE, LOCKED)
+        assert (cache.package_dir(key) / "lib.libsonnet").is_file()
+
+        # Unchanged inputs: vendor/ is created from the cache
+        jsonnet_bundler.fetch_jsonnet_libraries(cwd, cache=cache)
+        assert call.call_count == 1
+        pkg = cwd / "vendor" / "github.com" / "example" / "libs" / "lib"
+        assert pkg.is_symlink()
+        assert pkg.resolve() == cache.package_dir(key)
+        assert os.readlink(cwd / "vendor" / "lib") == "github.com/example/libs/lib"
+        assert (cwd / "vendor" / "lib" / "lib.libsonnet").is_file()
+        with open(cwd / "jsonnetfile.lock.json", encoding="utf-8") as f:
+            assert json.load(f)["dependencies"][0]["version"] == LOCKED
+
+        # Changed inputs: jb is run again
+        _write_jsonnetfile(cwd, version=SHA_2)
+        jsonnet_bundler.fetch_jsonnet_libraries(cwd, cache=cache)
+        assert call.call_count == 2
+        # The cached package isn't touched by jb
+        assert not pkg.is_symlink()
+        assert cache.package_dir(key).is_dir()
+
+
+def test_jsonnet_cache_restore_missing_package(tmp_path: Path):
+    cwd = tmp_path / "component"
+    cwd.mkdir()
+    _write_jsonnetfile(cwd)
+    cache = jsonnet_cache.JsonnetBundlerCache(tmp_path / "cache")
+    digest = jsonnet_cache.inputs_digest(cwd, cwd / "jsonnetfile.json")
+    _fake_jb(["jb", "install"], cwd)
+    cache.store(cwd, digest)
+
+    for p in (cache.directory / "packages").iterdir():
+        if p.is_dir():
+            p.rename(p.with_name("moved"))
+
+    assert not cache.restore(cwd, digest)
+    assert not (cwd / "vendor" / "github.com" / "example" / "libs" / "lib").is_symlink()
+
+
+def test_fetch_jsonnet_libraries_unpinned(tmp_path: Path):
+    cwd = tmp_path / "component"
+    _write_jsonnetfile(cwd, version="main")
+    cache = jsonnet_cache.JsonnetBundlerCache(tmp_path / "cache")
+
+    with patch("commodore.dependency_mgmt.jsonnet_bundler.call") as call, patch(
+        "commodore.jsonnet_cache.subprocess.run"
+    ) as run:
+        call.side_effect = _fake_jb
+        run.side_effect = _ls_remote(LOCKED)
+        jsonnet_bundler.fetch_jsonnet_libraries(cwd, cache=cache)
+        assert call.call_count == 1
+
+        # The branch has moved, and the new commit isn't in the cache
+        run.side_effect = _ls_remote(SHA_2)
+        shutil.rmtree(cwd / "vendor")
+        jsonnet_bundler.fetch_jsonnet_libraries(cwd, cache=cache)
+        assert call.call_count == 2
+
+    # The package is stored, but no result is recorded for unpinned inputs
+    assert cache.package_dir(jsonnet_cache.package_key(SOURCE, LOCKED)).is_dir()
+    assert not (cache.directory / "resolutions").exists()
+
+
+def test_fetch_jsonnet_libraries_tag_from_store(tmp_path: Path):
+    cwd = tmp_path / "component"
+    _write_jsonnetfile(cwd, version="v1.0.0")
+    cache = jsonnet_cache.JsonnetBundlerCache(tmp_path / "cache")
+
+    with patch("commodore.dependency_mgmt.jsonnet_bundler.call") as call, patch(
+        "commodore.jsonnet_cache.subprocess.run"
+    ) as run:
+        call.side_effect = _fake_jb
+        run.side_effect = _ls_remote(LOCKED)
+        jsonnet_bundler.fetch_jsonnet_libraries(cwd, cache=cache)
+        assert call.call_count == 1
+
+        shutil.rmtree(cwd / "vendor")
+        (cwd / "jsonnetfile.lock.json").unlink()
+        jsonnet_bundler.fetch_jsonnet_libraries(cwd, cache=cache)
+        # The tag is resolved with `git ls-remote`, and the package is linked from
+        # the package store without running jb
+        assert call.call_count == 1
+        assert run.call_count == 2
+
+    key = jsonnet_cache.package_key(SOURCE, LOCKED)
+    pkg = cwd / "vendor" / "github.com" / "example" / "libs" / "lib"
+    assert pkg.is_symlink()
+    assert pkg.resolve() == cache.package_dir(key)
+    assert os.readlink(cwd / "vendor" / "lib") == "github.com/example/libs/lib"
+    with open(cwd / "jsonnetfile.lock.json", encoding="utf-8") as f:
+        lock = json.load(f)
+    assert lock["dependencies"] == [{"source": SOURCE, "version": LOCKED, "sum": "xyz"}]
+
+
+def test_jsonnet_cache_link_local_dependency(tmp_path: Path):
+    cwd = tmp_path / "component"
+    _write_jsonnetfile(cwd, version=None, local=["mylib"])
+    _write_jsonnetfile(cwd / "mylib", version="v1.0.0")
+    cache = jsonnet_cache.JsonnetBundlerCache(tmp_path / "cache")
+    _fake_jb(["jb", "install"], cwd)
+    cache.store(cwd, None)
+    shutil.rmtree(cwd / "vendor")
+
+    with patch("commodore.jsonnet_cache.subprocess.run") as run:
+        run.side_effect = _ls_remote(LOCKED)
+        assert cache.link(cwd, cwd / "jsonnetfile.json")
+
+    # The remote dependency of the local dependency is linked from the cache
+    assert os.readlink(cwd / "vendor" / "mylib") == "../mylib"
+    assert os.readlink(cwd / "vendor" / "lib") == "github.com/example/libs/lib"
+    assert (cwd / "vendor" / "github.com" / "example" / "libs" / "lib").is_symlink()
+    with open(cwd / "jsonnetfile.lock.json", encoding="utf-8") as f:
+        lock = json.load(f)
+    assert [d["source"] for d in lock["dependencies"]] == [
+        {"local": {"directory": "mylib"}},
+        SOURCE,
+    ]
+
+
+def test_jsonnet_cache_link_unresolved(tmp_path: Path):
+    cwd = tmp_path / "component"
+    _write_jsonnetfile(cwd, version="v1.0.0")
+    cache = jsonnet_cache.JsonnetBundlerCache(tmp_path / "cache")
+    _fake_jb(["jb", "install"], cwd)
+    cache.store(cwd, None)
+    shutil.rmtree(cwd / "vendor")
+
+    with patch("commodore.jsonnet_cache.subprocess.run") as run:
+        run.return_value = CompletedProcess([], 0, stdout="")
+        assert not cache.link(cwd, cwd / "jsonnetfile.json")
+    assert not (cwd / "vendor").exists()
+
+
+def test_jsonnet_cache_store_unpinned_transitive(tmp_path: Path):
+    cwd = tmp_path / "component"
+    _write_jsonnetfile(cwd)
+    cache = jsonnet_cache.JsonnetBundlerCache(tmp_path / "cache")
+    digest = jsonnet_cache.inputs_digest(cwd, cwd / "jsonnetfile.json")
+    assert digest is not None
+    _fake_jb(["jb", "install"], cwd)
+    # The remote package depends on a branch
+    _write_jsonnetfile(
+        cwd / "vendor" / "github.com" / "example" / "libs" / "lib", "main"
+    )
+
+    cache.store(cwd, digest)
+
+    assert not cache.restore(cwd, digest)
+    # The package itself is stored regardless
+    assert cache.package_dir(jsonnet_cache.package_key(SOURCE, LOCKED)).is_dir()
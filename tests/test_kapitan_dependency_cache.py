@@ -0,0 +1,201 @@
+"""
+Unit-tests for the Kapitan dependency cache
+"""
+
+from __future__ import annotations
+
+import threading
+
+from pathlib import Path
+from unittest.mock import patch
+
+import click
+import pytest
+
+from commodore import kapitan_dependency_cache as kdc
+
+from test_gitrepo import setup_remote
+
+
+def _fake_helm_archive(helm_path, repo, chart_name, version, save_path):
+    Path(save_path).mkdir(parents=True)
+    (Path(save_path) / "Chart.yaml").write_text(
+        f"name: {chart_name}\nversion: {version}\n"
+    )
+
+
+def _helm_dep(output_path: str, version="1.2.3") -> dict:
+    return {
+        "type": "helm",
+        "source": "https://charts.example.com",
+        "chart_name": "foo",
+        "version": version,
+        "output_path": output_path,
+    }
+
+
+@pytest.mark.parametrize(
+    "dep,expected",
+    [
+        (_helm_dep("a"), True),
+        (_helm_dep("a", version=None), False),
+        ({"type": "git", "source": "u", "ref": "v1.0.0"}, True),
+        ({"type": "git", "source": "u", "ref": "a" * 40}, True),
+        ({"type": "git", "source": "u", "ref": "main"}, False),
+        ({"type": "git", "source": "u"}, False),
+        ({"type": "https", "source": "https://example.com/foo.yaml"}, True),
+    ],
+)
+def test_is_pinned(dep: dict, expected: bool):
+    assert kdc.is_pinned(dep) == expected
+
+
+def test_dependency_key():
+    assert kdc.dependency_key(_helm_dep("a")) == kdc.dependency_key(_helm_dep("b"))
+    assert kdc.dependency_key(_helm_dep("a")) != kdc.dependency_key(
+        _helm_dep("a", version="1.2.4")
+    )
+
+
+def test_kapitan_dependencies():
+    inventory = {
+        "a": {"parameters": {"kapitan": {"dependencies": [_helm_dep("a")]}}},
+        "b": {"parameters": {"kapitan": {}}},
+        "c": {"parameters": {"kapitan": {"dependencies": [_helm_dep("c")]}}},
+    }
+
+    assert kdc.kapitan_dependencies(inventory, ["a", "b"]) == [_helm_dep("a")]
+
+
+def test_fetch_dependencies_helm(tmp_path: Path):
+    cache = kdc.KapitanDependencyCache(tmp_path / "cache")
+    deps = [
+        _helm_dep("dependencies/a/helmcharts/foo"),
+        _helm_dep("dependencies/b/helmcharts/foo"),
+        _helm_dep("dependencies/c/helmcharts/foo", version=None),
+    ]
+
+    with patch("commodore.kapitan_dependency_cache.fetch_helm_archive") as fetch:
+        fetch.side_effect = _fake_helm_archive
+        assert cache.fetch_dependencies(deps, tmp_path / "work", 2)
+        assert fetch.call_count == 2
+
+        for d in ["a", "b", "c"]:
+            chart = tmp_path / "work" / "dependencies" / d / "helmcharts" / "foo"
+            assert (chart / "Chart.yaml").is_file()
+
+        # Only the unpinned chart is fetched again
+        assert cache.fetch_dependencies(deps, tmp_path / "work", 2)
+        assert fetch.call_count == 3
+        assert fetch.call_args.args[3] is None
+
+
+def test_fetch_dependencies_git(tmp_path: Path):
+    url, _ = setup_remote(tmp_path / "upstream")
+    cache = kdc.KapitanDependencyCache(tmp_path / "cache")
+    dep = {"type": "git", "source": url, "ref": "v1.0.0", "output_path": "deps/foo"}
+
+    assert cache.fetch_dependencies([dep], tmp_path / "work", 1)
+
+    out = tmp_path / "work" / "deps" / "foo"
+    assert (out / "test.txt").is_file()
+    assert not (out / "branch.txt").exists()
+
+    # Pinned entries are reused even if the upstream is gone
+    (tmp_path / "upstream").rename(tmp_path / "gone")
+    (out / "test.txt").unlink()
+    assert cache.fetch_dependencies([dep], tmp_path / "work", 1)
+    assert (out / "test.txt").is_file()
+
+
+def test_fetch_dependencies_http(tmp_path: Path):
+    def _fake_http_source(source, save_path, item_type):
+        Path(save_path).write_text("kind: ConfigMap\n")
+        return "text/plain"
+
+    cache = kdc.KapitanDependencyCache(tmp_path / "cache")
+    dep = {
+        "type": "https",
+        "source": "https://example.com/manifests/cm.yaml",
+        "output_path": "deps/cm.yaml",
+    }
+
+    with patch("commodore.kapitan_dependency_cache.fetch_http_source") as fetch:
+        fetch.side_effect = _fake_http_source
+        assert cache.fetch_dependencies([dep], tmp_path / "work", 1)
+
+    assert (tmp_path / "work" / "deps" / "cm.yaml").read_text() == "kind: ConfigMap\n"
+
+
+def test_fetch_dependencies_unsupported(tmp_path: Path):
+    cache = kdc.KapitanDependencyCache(tmp_path / "cache")
+    deps = [
+        _helm_dep("a"),
+        {"type": "oci", "source": "ghcr.io/example/foo:v1", "output_path": "b"},
+    ]
+
+    with patch("commodore.kapitan_dependency_cache.fetch_helm_archive") as fetch:
+        assert not cache.fetch_dependencies(deps, tmp_path / "work", 1)
+        fetch.assert_not_called()
+
+
+def test_fetch_dependencies_error(tmp_path: Path):
+    cache = kdc.KapitanDependencyCache(tmp_path / "cache")
+    dep = {
+        "type": "git",
+        "source": f"file://{tmp_path}/missing.git",
+        "output_path": "deps/foo",
+    }
+
+    with pytest.raises(click.ClickException) as e:
+        cache.fetch_dependencies([dep], tmp_path / "work", 1)
+
+    assert f" > file://{tmp_path}/missing.git: " in e.value.message
+    assert not list((tmp_path / "cache" / "entries").iterdir())
+
+
+def test_fetch_while_populating(tmp_path: Path):
+    cache = kdc.KapitanDependencyCache(tmp_path / "cache")
+    dep = _helm_dep("deps/foo", version=None)
+    key = kdc.dependency_key(dep)
+    version = iter(["1", "2"])
+
+    def _fake_fetch(helm_path, repo, chart_name, _, save_path):
+        _fake_helm_archive(helm_path, repo, chart_name, next(version), save_path)
+        (Path(save_path) / "templates").mkdir()
+        (Path(save_path) / "templates" / "cm.yaml").write_text("kind: ConfigMap\n")
+
+    copytree = kdc.shutil.copytree
+    fetcher = None
+
+    def _interleaved_copytree(src, dst, *args, **kwargs):
+        # Refresh the entry while the entry is being copied to the output path
+        nonlocal fetcher
+        if fetcher is not None:
+            # Recursive call for a subdirectory
+            return copytree(src, dst, *args, **kwargs)
+        fetcher = threading.Thread(target=cache._fetch_one, args=(key, dep))
+        fetcher.start()
+        fetcher.join(timeout=0.5)
+        # The entry isn't replaced while it's copied
+        assert fetcher.is_alive()
+        return copytree(src, dst, *args, **kwargs)
+
+    with patch("commodore.kapitan_dependency_cache.fetch_helm_archive") as fetch:
+        fetch.side_effect = _fake_fetch
+        assert cache._fetch_one(key, dep) is None
+        with patch.object(kdc.shutil, "copytree", _interleaved_copytree):
+            cache._populate(dep, tmp_path / "work")
+        assert fetcher is not None
+        fetcher.join(timeout=5)
+        assert not fetcher.is_alive()
+
+    out = tmp_path / "work" / "deps" / "foo"
+    assert (out / "Chart.yaml").read_text() == "name: foo\nversion: 1\n"
+    assert (out / "templates" / "cm.yaml").is_file()
+    assert (
+        cache.entry_dir(key) / "Chart.yaml"
+    ).read_text() == "name: foo\nversion: 2\n"
+
+    cache._populate(dep, tmp_path / "work")
+    assert (out / "Chart.yaml").read_text() == "name: foo\nversion: 2\n"
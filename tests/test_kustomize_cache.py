@@ -0,0 +1,151 @@
+"""
+Unit-tests for the Kustomize build cache
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+
+from pathlib import Path
+
+from commodore.helpers import yaml_dump
+from commodore.kustomize_cache import KustomizeCache, main, remote_refs
+
+from conftest import RunnerFunc
+from test_gitrepo import setup_remote
+
+FAKE_KUSTOMIZE = """#!/bin/sh
+if [ "$1" = "version" ]; then
+  echo "v5.0.0"
+  exit 0
+fi
+echo "build" >> "{calls}"
+# kustomize build <INPUT_DIR> -o <OUTPUT_DIR>
+mkdir -p "$4"
+cp "$2/kustomization.yaml" "$4/out.yaml"
+"""
+
+
+def _setup_kustomize(tmp_path: Path) -> Path:
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    kustomize = bindir / "kustomize"
+    kustomize.write_text(FAKE_KUSTOMIZE.format(calls=tmp_path / "calls"))
+    kustomize.chmod(0o755)
+    return kustomize
+
+
+def _setup_input(tmp_path: Path, resources: list[str]) -> Path:
+    input_dir = tmp_path / "input"
+    input_dir.mkdir(exist_ok=True)
+    yaml_dump({"resources": resources}, input_dir / "kustomization.yaml")
+    for res in resources:
+        if res.endswith(".yaml"):
+            (input_dir / res).write_text("kind: ConfigMap\n")
+    return input_dir
+
+
+def _calls(tmp_path: Path) -> int:
+    if not (tmp_path / "calls").exists():
+        return 0
+    return len((tmp_path / "calls").read_text().splitlines())
+
+
+def test_remote_refs(tmp_path: Path):
+    url, ri = setup_remote(tmp_path / "upstream")
+    sha = "a" * 40
+    input_dir = _setup_input(
+        tmp_path,
+        [
+            f"{url}//deploy?ref=v1.0.0",
+            f"https://github.com/example/foo//deploy?ref={sha}",
+            "local",
+        ],
+    )
+    _setup_input(input_dir, [f"{url}?ref=test-branch"]).rename(input_dir / "local")
+
+    assert remote_refs(input_dir) == {
+        f"{url}//deploy?ref=v1.0.0": ri.commit_shas["master"],
+        f"https://github.com/example/foo//deploy?ref={sha}": sha,
+        f"{url}?ref=test-branch": ri.commit_shas["test-branch"],
+    }
+
+
+def test_remote_refs_unresolvable(tmp_path: Path):
+    input_dir = _setup_input(tmp_path, [f"file://{tmp_path}/missing.git?ref=main"])
+    assert remote_refs(input_dir) is None
+
+    (tmp_path / "outside").mkdir()
+    input_dir = _setup_input(tmp_path, ["../outside"])
+    assert remote_refs(input_dir) is None
+
+    # Schemeless remote bases which we don't recognize aren't treated as local
+    input_dir = _setup_input(tmp_path, ["gitlab.com/org/repo//deploy?ref=main"])
+    assert remote_refs(input_dir) is None
+
+
+def test_kustomize_cache_main(tmp_path: Path):
+    kustomize = _setup_kustomize(tmp_path)
+    input_dir = _setup_input(tmp_path, ["deployment.yaml"])
+    cache_dir = tmp_path / "cache"
+
+    for i in range(2):
+        out = tmp_path / f"out-{i}"
+        rc = main([str(cache_dir), str(kustomize), str(input_dir), str(out)])
+        assert rc == 0
+        assert (out / "out.yaml").read_text() == (
+            input_dir / "kustomization.yaml"
+        ).read_text()
+    assert _calls(tmp_path) == 1
+
+    _setup_input(tmp_path, ["deployment.yaml", "service.yaml"])
+    rc = main([str(cache_dir), str(kustomize), str(input_dir), str(tmp_path / "out")])
+    assert rc == 0
+    assert _calls(tmp_path) == 2
+    assert len(KustomizeCache(cache_dir).entries()) == 2
+
+
+def test_kustomize_wrapper(tmp_path: Path):
+    kustomize = _setup_kustomize(tmp_path)
+    input_dir = _setup_input(tmp_path, ["deployment.yaml"])
+    wrapper = KustomizeCache(tmp_path / "cache").wrapper()
+    env = {
+        "PATH": f"{kustomize.parent}:{os.environ['PATH']}",
+        "INPUT_DIR": str(input_dir),
+    }
+
+    for i in range(2):
+        out = tmp_path / f"out-{i}"
+        subprocess.run([wrapper, out], env=env, check=True)
+        assert (out / "out.yaml").is_file()
+    assert _calls(tmp_path) == 1
+
+
+def test_kustomize_cache_prune_cli(tmp_path: Path, cli_runner: RunnerFunc):
+    cache = KustomizeCache(tmp_path / "cache")
+    for key in ["old", "new"]:
+        (tmp_path / "out").mkdir(exist_ok=True)
+        (tmp_path / "out" / "out.yaml").write_text(f"{key}\n")
+        cache.store(key, tmp_path / "out")
+    os.utime(cache.entry_dir("old"), (0, 0))
+
+    result = cli_runner(
+        ["cache", "kustomize-ls", "--kustomize-cache", str(tmp_path / "cache")]
+    )
+    assert result.exit_code == 0
+    assert result.stdout.splitlines()[0].startswith("old ")
+    assert "2 entries, 8 bytes" in result.stdout
+
+    result = cli_runner(
+        ["cache", "kustomize-prune", "--kustomize-cache", str(tmp_path / "cache")]
+    )
+    assert result.exit_code == 0
+    assert " > Removed 1 entries (4 bytes)" in result.stdout
+    assert [e.key for e in cache.entries()] == ["new"]
+
+
+def test_kustomize_cache_cli_not_configured(cli_runner: RunnerFunc):
+    result = cli_runner(["cache", "kustomize-ls"])
+    assert result.exit_code == 1
+    assert "No Kustomize cache configured." in result.stderr
@@ -0,0 +1,87 @@
+"""
+Unit-tests for the Lieutenant API response cache
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+import responses
+
+from responses import matchers
+
+from commodore import helpers
+from commodore.lieutenant_cache import LieutenantCache
+
+API_URL = "https://syn.example.com"
+TENANT_URL = f"{API_URL}/tenants/t-tenant"
+
+
+def _query(cache: LieutenantCache, token="token"):
+    return helpers.lieutenant_query(API_URL, token, "tenants", "t-tenant", cache=cache)
+
+
+@responses.activate
+def test_lieutenant_cache_in_memory():
+    responses.get(TENANT_URL, json={"id": "t-tenant"})
+    cache = LieutenantCache()
+
+    tenant = _query(cache)
+    tenant["id"] = "modified"
+    assert _query(cache) == {"id": "t-tenant"}
+    assert len(responses.calls) == 1
+
+    # The API token is part of the cache key
+    _query(cache, token="other-token")
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_lieutenant_cache_etag(tmp_path: Path):
+    responses.get(
+        TENANT_URL,
+        json={"id": "t-tenant"},
+        headers={"ETag": '"v1"'},
+    )
+    assert _query(LieutenantCache(tmp_path)) == {"id": "t-tenant"}
+    assert "If-None-Match" not in responses.calls[0].request.headers
+
+    responses.replace(
+        responses.GET,
+        TENANT_URL,
+        status=304,
+        headers={"ETag": '"v1"'},
+        match=[matchers.header_matcher({"If-None-Match": '"v1"'})],
+    )
+    # A new cache instance always revalidates the on-disk entry
+    assert _query(LieutenantCache(tmp_path)) == {"id": "t-tenant"}
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_lieutenant_cache_ttl(tmp_path: Path):
+    responses.get(TENANT_URL, json={"id": "t-tenant"})
+
+    _query(LieutenantCache(tmp_path))
+    assert _query(LieutenantCache(tmp_path)) == {"id": "t-tenant"}
+    assert len(responses.calls) == 1
+
+    # Entries are only reused without a request for the same API token
+    _query(LieutenantCache(tmp_path), token="other-token")
+    assert len(responses.calls) == 2
+
+    _query(LieutenantCache(tmp_path, ttl=0), token="other-token")
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_lieutenant_cache_errors(tmp_path: Path):
+    responses.get(TENANT_URL, status=404, json={"reason": "Not found"})
+    cache = LieutenantCache(tmp_path)
+
+    for _ in range(2):
+        with pytest.raises(helpers.ApiError, match="API returned 404: Not found"):
+            _query(cache)
+    assert len(responses.calls) == 2
+    assert not list((tmp_path / "entries").glob("*"))
@@ -0,0 +1,91 @@
+"""
+Unit-tests for the Lieutenant API session
+"""
+
+from __future__ import annotations
+
+import pytest
+import responses
+
+from responses import registries
+
+from commodore import helpers
+from commodore.config import Config
+from commodore.lieutenant_session import new_session
+
+API_URL = "https://syn.example.com"
+
+
+@responses.activate(registry=registries.OrderedRegistry)
+def test_lieutenant_query_retry():
+    url = f"{API_URL}/clusters/c-cluster"
+    responses.get(url, status=503, json={"reason": "Unavailable"})
+    responses.get(url, status=502)
+    responses.get(url, status=200, json={"id": "c-cluster"})
+
+    resp = helpers.lieutenant_query(
+        API_URL,
+        "token",
+        "clusters",
+        "c-cluster",
+        session=new_session(retries=2, backoff_factor=0),
+    )
+
+    assert resp == {"id": "c-cluster"}
+    assert len(responses.calls) == 3
+
+
+@responses.activate(registry=registries.OrderedRegistry)
+def test_lieutenant_query_retries_exhausted():
+    url = f"{API_URL}/clusters/c-cluster"
+    for _ in range(2):
+        responses.get(url, status=503, json={"reason": "Unavailable"})
+
+    with pytest.raises(helpers.ApiError, match="API returned 503: Unavailable"):
+        helpers.lieutenant_query(
+            API_URL,
+            "token",
+            "clusters",
+            "c-cluster",
+            session=new_session(retries=1, backoff_factor=0),
+        )
+
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_lieutenant_post_no_retry():
+    responses.post(f"{API_URL}/clusters/c-cluster/compileMeta", status=503)
+
+    with pytest.raises(helpers.ApiError, match="API returned 503"):
+        helpers.lieutenant_post(
+            API_URL,
+            "token",
+            "clusters/c-cluster",
+            "compileMeta",
+            post_data={},
+            session=new_session(retries=2, backoff_factor=0),
+        )
+
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_config_lieutenant_session(config: Config, capsys):
+    url = f"{API_URL}/tenants/t-tenant"
+    responses.get(url, status=200, json={"id": "t-tenant"})
+    config.request_retries = 0
+
+    session = config.lieutenant_session
+    assert session is config.lieutenant_session
+    assert session.get_adapter(url).max_retries.total == 0
+
+    helpers.lieutenant_query(API_URL, "token", "tenants", "t-tenant", session=session)
+    assert capsys.readouterr().out == ""
+
+    config.update_verbosity(1)
+    helpers.lieutenant_query(API_URL, "token", "tenants", "t-tenant", session=session)
+    assert capsys.readouterr().out.startswith(f" > GET {url}: 200 in ")
+
+    config.request_backoff_factor = 0.1
+    assert config.lieutenant_session is not session
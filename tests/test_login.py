@@ -7,12 +7,15 @@ from __future__ import annotations
 from unittest.mock import patch
 
 import json
+import re
 import time
 import threading
 
+from contextlib import contextmanager
 from functools import partial
 from http.server import HTTPServer
 from queue import Queue
+from urllib.parse import parse_qs, urlparse
 
 import click
 import jwt
@@ -33,12 +36,13 @@ akey = "a" * 32
 def mock_open_browser(authorization_endpoint: str, code="foobar"):
     def mock(request_uri: str):
         assert request_uri.startswith(authorization_endpoint)
+        redirect_uri = parse_qs(urlparse(request_uri).query)["redirect_uri"][0]
 
         params = ""
         if code is not None:
             params = f"?code={code}"
 
-        r = requests.get(f"http://localhost:18000/{params}", timeout=5)
+        r = requests.get(f"{redirect_uri}/{params}", timeout=5)
 
         print(r.text)
         r.raise_for_status()
@@ -62,7 +66,7 @@ def _setup_responses(api_url, auth_url, id_token) -> dict[str, str]:
     client = "syn-test"
     access_token = "access-123"
 
-    responses.add_passthru("http://localhost:18000/")
+    responses.add_passthru(re.compile(r"http://localhost:\d+/"))
     responses.add(
         responses.GET,
         api_url,
@@ -100,10 +104,14 @@ def test_login(
     config: Config,
     tmp_path,
     refresh_success,
+    monkeypatch,
 ):
+    monkeypatch.setattr(tokencache, "cache_name", tmp_path / "token")
     auth_url = "https://idp.example.com/auth"
     id_token = "id-123"
     config.api_token = None
+    # Let the OS pick a port for the callback server
+    config.oidc_callback_port = 0
 
     tokens = _setup_responses(config.api_url, auth_url, id_token)
 
@@ -118,6 +126,34 @@ def test_login(
     assert mock_browser.call_count == 0 if refresh_success else 1
 
 
+@patch("commodore.login.refresh_tokens")
+@responses.activate
+def test_login_concurrent(mock_refresh_tokens, config: Config, tmp_path, monkeypatch):
+    monkeypatch.setattr(tokencache, "cache_name", tmp_path / "token")
+    config.api_token = None
+    _setup_responses(config.api_url, "https://idp.example.com/auth", "id-123")
+    id_token = jwt.encode({"exp": time.time() + 600}, akey)
+
+    locked = tokencache.locked
+
+    @contextmanager
+    def concurrent_login():
+        # Simulate another Commodore process which has completed the login while
+        # we were waiting for the token cache lock.
+        (tmp_path / "token").write_text(
+            json.dumps({config.api_url: {"id_token": id_token}})
+        )
+        with locked():
+            yield
+
+    monkeypatch.setattr(tokencache, "locked", concurrent_login)
+
+    login.login(config)
+
+    assert mock_refresh_tokens.call_count == 0
+    assert config.api_token == id_token
+
+
 @responses.activate
 @pytest.mark.parametrize(
     "client,expected",
@@ -379,17 +415,42 @@ def test_run_callback_server(config, tmp_path):
     config.oidc_client = "test-client"
     token_url = "https://idp.example.com/token"
     c = WebApplicationClient(config.oidc_client)
-    s = login.OIDCCallbackServer(c, token_url, config.api_url, 5, port=18999)
+    s = login.OIDCCallbackServer(c, token_url, config.api_url, 5, port=0)
+    assert s.port != 0
+    assert s.redirect_url == f"http://localhost:{s.port}"
 
     s.start()
+    assert s.ready.is_set()
 
-    resp = requests.get("http://localhost:18999/healthz", timeout=5)
+    resp = requests.get(f"{s.redirect_url}/healthz", timeout=5)
     assert resp.status_code == 200
     assert resp.text == "ok"
 
     # calls to /healthz don't close the server, so we make a second request
-    resp = requests.get("http://localhost:18999/?foo=bar", timeout=5)
+    resp = requests.get(f"{s.redirect_url}/?foo=bar", timeout=5)
     assert resp.status_code == 422
     assert resp.text == "invalid callback: no code provided"
 
     s.join()
+
+
+@patch("commodore.login.refresh_tokens")
+@responses.activate
+@pytest.mark.parametrize("refresh_success", [False, True])
+def test_refresh_token(
+    mock_refresh_tokens, config: Config, tmp_path, monkeypatch, refresh_success
+):
+    monkeypatch.setattr(tokencache, "cache_name", tmp_path / "token")
+    config.api_token = None
+    _setup_responses(config.api_url, "https://idp.example.com/auth", "id-123")
+    id_token = jwt.encode({"exp": time.time() + 600}, akey)
+
+    def _refresh(cfg, client, token_endpoint):
+        if refresh_success:
+            tokencache.save(cfg.api_url, {"id_token": id_token})
+        return refresh_success
+
+    mock_refresh_tokens.side_effect = _refresh
+
+    assert login.refresh_token(config) == refresh_success
+    assert config.api_token == (id_token if refresh_success else None)
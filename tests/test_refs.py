@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 from pathlib import Path
@@ -29,6 +31,7 @@ def inventory():
     def _params(target):
         return {
             "_instance": target,
+            "cluster": {"name": "c-cluster"},
             "test": _test(target),
             "non_component": {
                 "password": "?{vaultkv:t-tenant/c-cluster/global/password}",
@@ -106,3 +109,120 @@ def test_update_refs(tmp_path: Path, config: Config, inventory):
     for ref in not_expected_refs:
         refpath = ref_prefix / ref
         assert not refpath.exists()
+
+
+def test_find_refs_key_paths(config: Config, inventory):
+    b = refs.RefBuilder(config, inventory)
+    params = {
+        "a": {"list": ["?{vaultkv:foo/a}", {"b": "?{vaultkv:foo/b}"}], "c": 1},
+        "d": "?{vaultkv:foo/a} and ?{vaultkv:foo/d}",
+        "e": None,
+    }
+    b._find_refs("test", params)
+
+    assert {r.refstr: r.keys for r in b.refs} == {
+        "vaultkv:foo/a": ["test/a/list[0]", "test/d"],
+        "vaultkv:foo/b": ["test/a/list[1]/b"],
+        "vaultkv:foo/d": ["test/d"],
+    }
+    assert [r.refstr for r in b.refs] == [
+        "vaultkv:foo/a",
+        "vaultkv:foo/b",
+        "vaultkv:foo/d",
+    ]
+
+
+def test_find_refs_trace(config: Config, inventory, capsys):
+    params = inventory["test-a"]["parameters"]
+    b = refs.RefBuilder(config, inventory)
+    b._find_refs("test", params)
+
+    config._verbose = 3
+    traced = refs.RefBuilder(config, inventory)
+    traced._find_refs("test", params)
+
+    assert " > Processing test/other_component/users[1]" in capsys.readouterr().out
+    assert [(r.refstr, r.keys) for r in b.refs] == [
+        (r.refstr, r.keys) for r in traced.refs
+    ]
+
+
+def test_update_refs_incremental(tmp_path: Path, config: Config, inventory, capsys):
+    aliases = {"test-a": "test"}
+    config.register_component_aliases(aliases)
+    refs.update_refs(config, aliases, inventory)
+    assert " > 6 secret refs: 6 ref files written, 0 stale ref files removed" in (
+        capsys.readouterr().out
+    )
+
+    ref_prefix = config.refs_dir / "t-tenant" / "c-cluster"
+    accesskey = ref_prefix / "test" / "test-a-accesskey"
+    content = accesskey.read_text()
+    mtime = accesskey.stat().st_mtime_ns
+    (ref_prefix / "global" / "password").write_text("outdated")
+    (ref_prefix / "stale" / "nested").mkdir(parents=True)
+    (ref_prefix / "stale" / "nested" / "secret").write_text("stale")
+    (config.refs_dir / ".hidden").write_text("keep")
+
+    refs.update_refs(config, aliases, inventory)
+    assert " > 6 secret refs: 1 ref files written, 1 stale ref files removed" in (
+        capsys.readouterr().out
+    )
+    assert accesskey.read_text() == content
+    assert accesskey.stat().st_mtime_ns == mtime
+    assert (ref_prefix / "global" / "password").read_text() != "outdated"
+    assert not (ref_prefix / "stale").exists()
+    assert (config.refs_dir / ".hidden").is_file()
+
+
+def test_update_refs_secret_ref_index(tmp_path: Path, config: Config, inventory):
+    aliases = {"test-a": "test", "test-b": "test"}
+    config.register_component_aliases(aliases)
+    config.secret_ref_index = tmp_path / "index" / "c-cluster.json"
+    refs.update_refs(config, aliases, inventory)
+
+    index = json.loads(config.secret_ref_index.read_text())
+    assert index["clusters"] == ["c-cluster"]
+    assert index["refs"]["vaultkv:t-tenant/c-cluster/test/test-a-accesskey"] == [
+        {"cluster": "c-cluster", "target": "test-a", "key": "test/accesskey"}
+    ]
+    assert index["refs"]["vaultkv:t-tenant/c-cluster/foo/bar"] == [
+        {
+            "cluster": "c-cluster",
+            "target": "cluster",
+            "key": "other_component/multiref",
+        }
+    ]
+    assert list(index["refs"].keys()) == sorted(index["refs"].keys())
+
+
+def test_merge_secret_ref_indexes():
+    def _usage(cluster, target="cluster", key="secret"):
+        return {"cluster": cluster, "target": target, "key": key}
+
+    a = {"clusters": ["c-a"], "refs": {"vaultkv:shared/pw": [_usage("c-a")]}}
+    b = {
+        "clusters": ["c-b"],
+        "refs": {
+            "vaultkv:shared/pw": [_usage("c-b")],
+            "vaultkv:c-b/pw": [_usage("c-b", "test", "test/pw")],
+        },
+    }
+    merged = refs.merge_secret_ref_indexes([b, a])
+    assert merged == {
+        "clusters": ["c-a", "c-b"],
+        "refs": {
+            "vaultkv:c-b/pw": [_usage("c-b", "test", "test/pw")],
+            "vaultkv:shared/pw": [_usage("c-b"), _usage("c-a")],
+        },
+    }
+
+    # A later index replaces all entries of its cluster in the merged index
+    b_updated = {"clusters": ["c-b"], "refs": {"vaultkv:c-b/other": [_usage("c-b")]}}
+    assert refs.merge_secret_ref_indexes([merged, b_updated]) == {
+        "clusters": ["c-a", "c-b"],
+        "refs": {
+            "vaultkv:c-b/other": [_usage("c-b")],
+            "vaultkv:shared/pw": [_usage("c-a")],
+        },
+    }
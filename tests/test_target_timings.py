@@ -0,0 +1,85 @@
+"""
+Unit-tests for the per-target timings
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import kapitan.targets as kapitan_targets
+from kapitan import cached
+
+from commodore.config import Config
+from commodore.target_timings import TIMINGS_FILE, TargetTimings
+
+
+def _target_config(name: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        compile=[], vars=SimpleNamespace(target=name), target_full_path=name
+    )
+
+
+def test_schedule(tmp_path: Path):
+    timings = TargetTimings(tmp_path / TIMINGS_FILE)
+    timings.record("a", "compile", 1.0)
+    timings.record("b", "compile", 10.0)
+    timings.record("c", "compile", 5.0)
+    timings.record("c", "postprocess", 20.0)
+
+    assert timings.schedule(["a", "b", "c", "d"]) == ["d", "b", "c", "a"]
+    assert timings.duration("c") == 25.0
+
+
+def test_save_load(tmp_path: Path):
+    timings = TargetTimings(tmp_path / TIMINGS_FILE)
+    timings.record("a", "compile", 1.23456)
+    timings.save()
+
+    assert TargetTimings(tmp_path / TIMINGS_FILE).duration("a", "compile") == 1.235
+
+    (tmp_path / TIMINGS_FILE).write_text("[]")
+    assert TargetTimings(tmp_path / TIMINGS_FILE).duration("a") == 0.0
+
+
+def test_config_target_timings(config: Config, tmp_path: Path):
+    assert config.target_timings is config.target_timings
+    assert config.target_timings.path == config.work_dir / TIMINGS_FILE
+
+    config.work_dir = tmp_path / "other"
+    assert config.target_timings.path == tmp_path / "other" / TIMINGS_FILE
+
+
+def test_recording_spawned_worker(tmp_path: Path):
+    timings = TargetTimings(tmp_path / TIMINGS_FILE)
+    compile_target = kapitan_targets.compile_target
+
+    with timings.recording():
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(1) as pool:
+            pool.apply(
+                kapitan_targets.compile_target,
+                (_target_config("foo"), [], str(tmp_path), None, cached.args),
+            )
+
+    assert kapitan_targets.compile_target is compile_target
+    assert not hasattr(cached.args, "commodore_target_timings")
+    assert timings.schedule(["bar", "foo"]) == ["bar", "foo"]
+    assert timings.duration("foo", "compile") >= 0.0
+
+
+def test_report(tmp_path: Path, capsys):
+    timings = TargetTimings(tmp_path / TIMINGS_FILE)
+    for i, t in enumerate(["a", "b", "c"]):
+        timings.record(t, "compile", float(i))
+    timings.record("b", "postprocess", 0.5)
+
+    timings.report(["a", "b", "c", "d"], count=2)
+
+    assert capsys.readouterr().out.splitlines() == [
+        "Slowest targets:",
+        " > c: 2.00s (compile 2.00s)",
+        " > b: 1.50s (compile 1.00s, postprocess 0.50s)",
+    ]
@@ -3,6 +3,10 @@ Unit-tests for tokencache
 """
 
 import json
+import multiprocessing
+import threading
+
+from pathlib import Path
 
 from xdg.BaseDirectory import xdg_cache_home
 from commodore import tokencache
@@ -69,18 +73,67 @@ def test_drop_old_cache_entry(fs):
 
 
 def test_update_broken_json_cache(fs):
-    cachef = fs.create_file(
+    fs.create_file(
         f"{xdg_cache_home}/commodore/token",
         contents='{"https://syn.example.com":{"id_token":"token"}',
     )
     tokencache.save("https://syn2.example.com", {"id_token": "token2"})
     assert tokencache.get("https://syn2.example.com") == {"id_token": "token2"}
-    assert (
-        cachef.contents
-        == '{\n "https://syn2.example.com": {\n  "id_token": "token2"\n }\n}'
-    )
+    with open(f"{xdg_cache_home}/commodore/token") as f:
+        assert (
+            f.read()
+            == '{\n "https://syn2.example.com": {\n  "id_token": "token2"\n }\n}'
+        )
 
     tokencache.save("https://syn.example.com", {"id_token": "token"})
 
     assert tokencache.get("https://syn2.example.com") == {"id_token": "token2"}
     assert tokencache.get("https://syn.example.com") == {"id_token": "token"}
+
+
+def _save_tokens(cache_name: Path, worker: int):
+    tokencache.cache_name = cache_name
+    for i in range(20):
+        tokencache.save(f"https://syn-{worker}-{i}.example.com", {"id_token": "t"})
+
+
+def test_save_token_concurrently(tmp_path: Path):
+    cache_name = tmp_path / "commodore" / "token"
+    procs = [
+        multiprocessing.Process(target=_save_tokens, args=(cache_name, w))
+        for w in range(4)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+
+    with open(cache_name) as f:
+        cache = json.load(f)
+    assert len(cache) == 80
+    assert cache_name.stat().st_mode & 0o077 == 0
+    assert sorted(f.name for f in cache_name.parent.iterdir()) == [
+        "token",
+        "token.lock",
+    ]
+
+
+def test_save_token_while_locked(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(tokencache, "cache_name", tmp_path / "token")
+
+    with tokencache.locked():
+        # Saving tokens from another thread of the process holding the lock doesn't
+        # block, as happens during `login()`.
+        t = threading.Thread(
+            target=tokencache.save,
+            args=("https://syn.example.com", {"id_token": "t"}),
+        )
+        t.start()
+        t.join(timeout=5)
+        assert not t.is_alive()
+        tokencache.save("https://syn2.example.com", {"id_token": "t2"})
+
+    assert tokencache.get("https://syn.example.com") == {"id_token": "t"}
+    assert tokencache.get("https://syn2.example.com") == {"id_token": "t2"}
+    assert tokencache._lockf is None
@@ -0,0 +1,194 @@
+"""
+Unit-tests for the memory-aware compile worker selection
+"""
+
+from __future__ import annotations
+
+import fcntl
+import os
+import threading
+
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import click
+import pytest
+
+from kapitan import cached
+
+from commodore import worker_memory as wm
+
+GiB = 2**30
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        (None, None),
+        ("auto", "auto"),
+        ("1024", 1024),
+        ("2Gi", 2 * GiB),
+        ("512M", 512 * 10**6),
+        ("1.5Gi", click.ClickException),
+        ("lots", click.ClickException),
+    ],
+)
+def test_parse_worker_memory(value, expected):
+    if expected is click.ClickException:
+        with pytest.raises(click.ClickException):
+            wm.parse_worker_memory(value)
+    else:
+        assert wm.parse_worker_memory(value) == expected
+
+
+def test_format_size():
+    assert wm.format_size(512) == "512.0B"
+    assert wm.format_size(1.5 * GiB) == "1.5GiB"
+
+
+@pytest.mark.parametrize(
+    "files,expected",
+    [
+        (
+            {
+                "/proc/self/cgroup": "0::/ci\n",
+                "/sys/fs/cgroup/ci/memory.max": "17179869184\n",
+                "/sys/fs/cgroup/ci/memory.current": "1073741824\n",
+            },
+            15 * GiB,
+        ),
+        (
+            {
+                "/proc/self/cgroup": "4:memory:/ci\n1:cpu:/\n",
+                "/sys/fs/cgroup/memory/ci/memory.limit_in_bytes": "4294967296\n",
+                "/sys/fs/cgroup/memory/ci/memory.usage_in_bytes": "0\n",
+            },
+            4 * GiB,
+        ),
+        (
+            {
+                "/proc/self/cgroup": "0::/\n",
+                "/sys/fs/cgroup/memory.max": "max\n",
+                "/sys/fs/cgroup/memory.current": "0\n",
+            },
+            None,
+        ),
+        ({}, None),
+    ],
+)
+def test_cgroup_available_memory(files: dict[str, str], expected):
+    with patch.object(wm, "_read", side_effect=files.get):
+        assert wm._cgroup_available_memory() == expected
+
+
+def test_available_memory():
+    files = {
+        "/proc/meminfo": "MemTotal: 33554432 kB\nMemAvailable: 8388608 kB\n",
+        "/proc/self/cgroup": "0::/\n",
+        "/sys/fs/cgroup/memory.max": str(4 * GiB),
+        "/sys/fs/cgroup/memory.current": "0",
+    }
+    with patch.object(wm, "_read", side_effect=files.get):
+        assert wm.available_memory() == 4 * GiB
+        del files["/sys/fs/cgroup/memory.max"]
+        assert wm.available_memory() == 8 * GiB
+
+
+@pytest.mark.parametrize(
+    "worker_memory,available,expected",
+    [
+        # No recorded peaks
+        ("auto", 16 * GiB, wm.WorkerPlan(12)),
+        # Unknown available memory
+        (GiB, None, wm.WorkerPlan(12)),
+        # Budget of 4GiB allows 4 workers, no targets exceed the budget
+        (4 * GiB, 16 * GiB, wm.WorkerPlan(4)),
+        # Budget of 1GiB: `c` needs 2GiB extra memory, 4GiB remain after 12 workers
+        (GiB, 16 * GiB, wm.WorkerPlan(12, ["c"], 2)),
+    ],
+)
+def test_plan_workers(worker_memory, available, expected):
+    peaks = {"a": GiB // 2, "b": GiB, "c": 3 * GiB}
+    targets = ["a", "b", "c"]
+    if worker_memory == "auto":
+        peaks = {}
+    with patch.object(wm, "available_memory", return_value=available):
+        plan = wm.plan_workers(worker_memory, peaks, targets, 12)
+    assert plan == expected
+
+
+def test_plan_workers_auto():
+    peaks = {"a": GiB, "b": GiB, "c": 2 * GiB, "d": 4 * GiB}
+    with patch.object(wm, "available_memory", return_value=10 * GiB):
+        plan = wm.plan_workers("auto", peaks, list(peaks), 32)
+    # Median budget of 1.5GiB allows 6 workers, `d` needs 2.5GiB extra memory
+    assert plan == wm.WorkerPlan(6, ["d", "c"], 1)
+
+
+def test_admitted():
+    plan = wm.WorkerPlan(2, ["heavy"], 1)
+
+    with plan.admission_control():
+        args = cached.args
+        slot = Path(args.commodore_heavy_targets["dir"]) / "slot-0"
+        with wm.admitted(args, "light"):
+            assert not slot.exists()
+        with wm.admitted(args, "heavy"):
+            fd = os.open(slot, os.O_RDWR)
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.close(fd)
+
+    assert not Path(slot).parent.exists()
+    with wm.admitted(SimpleNamespace(), "heavy"):
+        pass
+
+
+@pytest.mark.parametrize("release", ["a", "b"])
+def test_admitted_any_slot(release: str):
+    plan = wm.WorkerPlan(3, ["a", "b", "c"], 2)
+
+    with plan.admission_control():
+        args = cached.args
+        slots = [
+            Path(args.commodore_heavy_targets["dir"]) / f"slot-{i}" for i in (0, 1)
+        ]
+        entered = {t: threading.Event() for t in "abc"}
+        done = {t: threading.Event() for t in "abc"}
+
+        def compile_target(target: str):
+            with wm.admitted(args, target):
+                entered[target].set()
+                done[target].wait(timeout=10)
+
+        threads = {}
+        for t in "abc":
+            threads[t] = threading.Thread(target=compile_target, args=(t,))
+            threads[t].start()
+            if t != "c":
+                # `a` gets slot 0, `b` gets slot 1
+                assert entered[t].wait(timeout=5)
+
+        # Both slots are busy
+        assert not entered["c"].wait(timeout=0.2)
+
+        # `c` is admitted to whichever slot is released first
+        done[release].set()
+        threads[release].join(timeout=5)
+        assert entered["c"].wait(timeout=5)
+        for slot in slots:
+            fd = os.open(slot, os.O_RDWR)
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.close(fd)
+
+        for t in "abc":
+            done[t].set()
+            threads[t].join(timeout=5)
+
+
+def test_peak_rss():
+    wm.reset_peak_rss()
+    assert wm.peak_rss() > 0